@@ -0,0 +1 @@
+# Analisis de los datos de la LMB, los notebooks estan en analisis/curso
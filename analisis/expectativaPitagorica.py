@@ -0,0 +1,162 @@
+# Expectativa pitagorica (Bill James): porcentaje de victorias esperado de un equipo por sus carreras anotadas (R)
+# y permitidas (RA), R^x / (R^x + RA^x). El exponente original es 2, Baseball-Reference usa 1.83.
+# Los juegos se consultan una sola vez y todos los calculos (temporada, local y visitante, mitades de temporada y
+# series acumuladas y moviles por juego) se hacen con una consulta lazy de Polars para todos los equipos y
+# temporadas. Las estadisticas de local, visitante y temporada completa se calculan juntas con la columna
+# localia ('local', 'visitante' o 'total') igual que en resumen_equipo. Los juegos se leen con el cache de
+# cacheConsultas, repetir un reporte no vuelve a consultar la base mientras no se escriban juegos nuevos
+#   reporte = reporteTemporadas(engine, tiposJuego=['R'], exponente=1.83)
+#   reporte['temporadas'], reporte['series'], reporte['mitades']
+
+import polars as pl
+from sqlalchemy import text
+import cacheConsultas
+from resumenEquipos import ZONA_HORARIA
+
+EXPONENTE = 2.0
+VENTANA = 10 # juegos de la expectativa pitagorica movil
+
+# Juegos terminados con sus equipos, temporadas y tiposJuego None consultan todos
+def getJuegos(engine, temporadas=None, tiposJuego=None, usarCache=True):
+    query = text(f"""SELECT j.juego_id, j.temporada, j.primer_lanzamiento,
+                            CAST(j.primer_lanzamiento AT TIME ZONE '{ZONA_HORARIA}' AS DATE) AS fecha,
+                            j.tipo_juego_id, j.local_id, loc.nombre AS local, j.visitante_id, vis.nombre AS visitante,
+                            j.carreras_local, j.carreras_visitante
+                     FROM juego j
+                     JOIN equipo loc ON loc.equipo_id = j.local_id
+                     JOIN equipo vis ON vis.equipo_id = j.visitante_id
+                     WHERE (CAST(:temporadas AS TEXT[]) IS NULL OR j.temporada = ANY(:temporadas))
+                       AND (CAST(:tipos AS TEXT[]) IS NULL OR j.tipo_juego_id = ANY(:tipos))
+                       AND NOT EXISTS (SELECT 1 FROM juego_en_vivo v WHERE v.juego_id = j.juego_id)""")
+    datos = {
+        'temporadas': None if temporadas is None else [str(temporada) for temporada in temporadas],
+        'tipos': None if tiposJuego is None else list(tiposJuego)
+    }
+    schema_juegos = {
+        'juego_id': pl.Int64,
+        'temporada': pl.String,
+        'primer_lanzamiento': pl.Datetime(time_zone='UTC'),
+        'fecha': pl.Date,
+        'tipo_juego_id': pl.String,
+        'local_id': pl.Int64,
+        'local': pl.String,
+        'visitante_id': pl.Int64,
+        'visitante': pl.String,
+        'carreras_local': pl.Int64,
+        'carreras_visitante': pl.Int64
+    }
+    if usarCache:
+        return cacheConsultas.consultar(engine, query, datos, schema_juegos).lazy()
+    with engine.connect() as conn:
+        juegos = pl.read_database(query, conn, execute_options={'parameters': datos}, schema_overrides=schema_juegos)
+    return juegos.lazy()
+
+# Una fila por equipo en cada juego, con las carreras desde el punto de vista del equipo. numero_juego es el
+# numero del juego en la temporada del equipo
+def getPartidos(juegos):
+    columnas = ['juego_id', 'temporada', 'primer_lanzamiento', 'fecha', 'tipo_juego_id']
+    locales = juegos.select(
+        *columnas,
+        pl.col('local_id').alias('equipo_id'),
+        pl.col('local').alias('equipo'),
+        pl.col('visitante').alias('rival'),
+        pl.lit('local').alias('localia'),
+        pl.col('carreras_local').alias('carreras'),
+        pl.col('carreras_visitante').alias('carreras_en_contra')
+    )
+    visitantes = juegos.select(
+        *columnas,
+        pl.col('visitante_id').alias('equipo_id'),
+        pl.col('visitante').alias('equipo'),
+        pl.col('local').alias('rival'),
+        pl.lit('visitante').alias('localia'),
+        pl.col('carreras_visitante').alias('carreras'),
+        pl.col('carreras_local').alias('carreras_en_contra')
+    )
+    return (pl.concat([locales, visitantes])
+            .sort('primer_lanzamiento', 'juego_id')
+            .with_columns(numero_juego=pl.int_range(1, pl.len() + 1).over('temporada', 'equipo_id')))
+
+# Cada partido una vez con su localia y otra vez como 'total'
+def conTotal(partidos):
+    return pl.concat([partidos, partidos.with_columns(localia=pl.lit('total'))])
+
+def pitagorica(carreras, carrerasEnContra, exponente=EXPONENTE):
+    carreras = carreras.cast(pl.Float64) ** exponente
+    carrerasEnContra = carrerasEnContra.cast(pl.Float64) ** exponente
+    return pl.when(carreras + carrerasEnContra > 0).then(carreras / (carreras + carrerasEnContra))
+
+# Agregaciones de los partidos de cada grupo, con filtro solo de los partidos que lo cumplen
+def getEstadisticas(filtro=None, sufijo=''):
+    def filtrar(columna):
+        return columna if filtro is None else columna.filter(filtro)
+    return [
+        filtrar(pl.col('juego_id')).len().alias(f'juegos{sufijo}'),
+        filtrar(pl.col('carreras') > pl.col('carreras_en_contra')).sum().alias(f'victorias{sufijo}'),
+        filtrar(pl.col('carreras') < pl.col('carreras_en_contra')).sum().alias(f'derrotas{sufijo}'),
+        filtrar(pl.col('carreras')).sum().alias(f'carreras{sufijo}'),
+        filtrar(pl.col('carreras_en_contra')).sum().alias(f'carreras_en_contra{sufijo}')
+    ]
+
+# Porcentaje de victorias real y esperado, y la diferencia entre las victorias reales y las esperadas
+# (positiva si el equipo gano mas de lo que esperaban sus carreras)
+def agregarPorcentajes(frame, exponente=EXPONENTE, sufijo=''):
+    juegos = pl.col(f'juegos{sufijo}')
+    pct = pitagorica(pl.col(f'carreras{sufijo}'), pl.col(f'carreras_en_contra{sufijo}'), exponente)
+    return frame.with_columns(
+        (pl.col(f'victorias{sufijo}') / juegos).alias(f'pct_victorias{sufijo}'),
+        pct.alias(f'pitagorica{sufijo}'),
+        (pl.col(f'victorias{sufijo}') - pct * juegos).alias(f'diferencia_victorias{sufijo}')
+    )
+
+# Totales de cada equipo por temporada y localia
+def resumenTemporadas(partidos, exponente=EXPONENTE):
+    resumen = (conTotal(partidos)
+               .group_by('temporada', 'equipo_id', 'equipo', 'localia')
+               .agg(getEstadisticas())
+               .sort('temporada', 'equipo', 'localia'))
+    return agregarPorcentajes(resumen, exponente)
+
+# Acumulados de cada equipo despues de cada juego por temporada y localia, y la expectativa pitagorica de los
+# ultimos ventana juegos. juegos es el numero de juegos de la localia y numero_juego el de la temporada
+def seriesEquipos(partidos, exponente=EXPONENTE, ventana=VENTANA):
+    grupo = ['temporada', 'equipo_id', 'localia']
+    series = conTotal(partidos).sort('primer_lanzamiento', 'juego_id').with_columns(
+        juegos=pl.int_range(1, pl.len() + 1).over(grupo),
+        victorias=(pl.col('carreras') > pl.col('carreras_en_contra')).cum_sum().over(grupo),
+        derrotas=(pl.col('carreras') < pl.col('carreras_en_contra')).cum_sum().over(grupo),
+        carreras_ventana=pl.col('carreras').rolling_sum(ventana, min_samples=1).over(grupo),
+        carreras_en_contra_ventana=pl.col('carreras_en_contra').rolling_sum(ventana, min_samples=1).over(grupo),
+        carreras=pl.col('carreras').cum_sum().over(grupo),
+        carreras_en_contra=pl.col('carreras_en_contra').cum_sum().over(grupo)
+    )
+    series = agregarPorcentajes(series, exponente).with_columns(
+        pitagorica_ventana=pitagorica(pl.col('carreras_ventana'), pl.col('carreras_en_contra_ventana'), exponente)
+    )
+    return series.sort('temporada', 'equipo', 'localia', 'juegos')
+
+# Primera (1) y segunda (2) mitad de la temporada de cada equipo, para ver que tanto la expectativa pitagorica de la
+# primera mitad pronostica la segunda. cortes es {temporada: fecha} con el dia en que empieza la segunda mitad de
+# cada temporada (por ejemplo el juego de estrellas), sin corte cada equipo se divide por su numero de juegos
+def mitadesTemporada(partidos, exponente=EXPONENTE, cortes=None):
+    cortes = {str(temporada): fecha for temporada, fecha in (cortes or {}).items()}
+    corte = pl.col('temporada').replace_strict(cortes, default=None, return_dtype=pl.Date)
+    porJuegos = pl.col('numero_juego') <= (pl.col('numero_juego').max().over('temporada', 'equipo_id') + 1) // 2
+    mitades = partidos.with_columns(
+        primera=pl.when(corte.is_null()).then(porJuegos).otherwise(pl.col('fecha') < corte)
+    )
+    mitades = (mitades
+               .group_by('temporada', 'equipo_id', 'equipo')
+               .agg(getEstadisticas(pl.col('primera'), '1') + getEstadisticas(~pl.col('primera'), '2'))
+               .sort('temporada', 'equipo'))
+    return agregarPorcentajes(agregarPorcentajes(mitades, exponente, '1'), exponente, '2')
+
+# Todas las tablas del reporte con una sola consulta a la base
+def reporteTemporadas(engine, temporadas=None, tiposJuego=None, exponente=EXPONENTE, ventana=VENTANA, cortes=None, usarCache=True):
+    partidos = getPartidos(getJuegos(engine, temporadas, tiposJuego, usarCache))
+    temporadasEquipos, series, mitades = pl.collect_all([
+        resumenTemporadas(partidos, exponente),
+        seriesEquipos(partidos, exponente, ventana),
+        mitadesTemporada(partidos, exponente, cortes)
+    ])
+    return {'temporadas': temporadasEquipos, 'series': series, 'mitades': mitades}
@@ -0,0 +1,185 @@
+# Aplanado de las jugadas: allPlays -> turnos, playEvents -> lanzamientos y runners -> bases alcanzadas.
+# Las jugadas de uno o varios juegos se recorren una sola vez y cada fila se guarda como tupla, las tablas se
+# arman al final columna por columna. Las bases alcanzadas de cada turno se guardan como bits en un entero
+# (BASES) y se separan en columnas al final. Los turnos se identifican por su posicion (columna turno),
+# obtenerDatos.procesarTurnos les asigna el turno_id.
+# Este modulo no es un aplanado columnar. Se probaron dos versiones con Arrow/Polars (explode y unnest) y las dos
+# fueron mas lentas que el ciclo original con los feeds sinteticos de benchmark/feeds (unos 110 turnos por juego):
+#   - diccionarios del feed -> Arrow -> explode: convertir a Arrow ya cuesta casi lo mismo que el ciclo y con un
+#     solo juego (en vivo y los reintentos) todo el aplanado era unas 6 veces mas lento
+#   - pl.read_json de los bytes del feed con un esquema solo de los campos que se usan: leer cuesta ~2.1 ms por
+#     juego y ~3.2 ms con el explode de las jugadas, contra ~1.3 ms del ciclo original, y el feed se tiene que
+#     decodificar de todos modos para el resto de transformarJuego
+# Por eso el aplanado es un ciclo de una sola pasada, que baja de ~1.37 a ~1.0 ms por juego.
+# tests/test_aplanadoJugadas.py compara este aplanado con la version original del ciclo
+
+import polars as pl
+
+schema_df_turno = {
+    'turno': pl.Int64,
+    'at_bat_descripcion': pl.String,
+    'entrada': pl.Int64,
+    'es_parte_alta': pl.Boolean,
+    'cuenta_outs': pl.Int64,
+    'carreras_anotadas': pl.Int64,
+    'llego_1b': pl.Boolean,
+    'llego_2b': pl.Boolean,
+    'llego_3b': pl.Boolean,
+    'llego_home': pl.Boolean,
+    'es_corredor_emergente': pl.Boolean,
+    'juego_id': pl.Int64,
+    'bateador_id': pl.Int64,
+    'pitcher_id': pl.Int64,
+    'tipo_turno_id': pl.String
+}
+
+schema_df_lanzamiento = {
+    'turno': pl.Int64,
+    'numero_lanzamiento': pl.Int64,
+    'es_jugada': pl.Boolean,
+    'es_bola': pl.Boolean,
+    'es_strike': pl.Boolean,
+    'es_foul': pl.Boolean,
+    'es_out': pl.Boolean,
+    'cuenta_bolas': pl.Int64,
+    'cuenta_strikes': pl.Int64,
+    'x': pl.Float32,
+    'y': pl.Float32,
+    'tipo_lanzamiento_id': pl.String
+}
+
+schema_jugadores = {
+    'juego_id': pl.Int64,
+    'es_local': pl.Boolean,
+    'jugador_id': pl.Int64
+}
+
+# Columnas de los turnos que se llenan en el ciclo, las bases alcanzadas se agregan despues
+columnas_turno = ['turno', 'at_bat_descripcion', 'entrada', 'es_parte_alta', 'cuenta_outs', 'carreras_anotadas',
+                  'juego_id', 'bateador_id', 'pitcher_id', 'tipo_turno_id']
+
+# Bit de cada columna de bases alcanzadas, llegar a una base marca tambien las anteriores
+BASES = {'llego_1b': 1, 'llego_2b': 2, 'llego_3b': 4, 'llego_home': 8, 'es_corredor_emergente': 16}
+BITS_FIN = {'1B': 1, '2B': 1 | 2, '3B': 1 | 2 | 4, 'score': 1 | 2 | 4 | 8}
+EMERGENTE = BASES['es_corredor_emergente']
+
+# Tabla con las filas (tuplas en el orden de columnas) y columnasExtra ({columna: valores}). Se arma con una
+# serie por columna porque es mas rapido que pasar un diccionario y el esquema a pl.DataFrame
+def getTabla(filas, columnas, schema, columnasExtra={}):
+    valores = dict(zip(columnas, zip(*filas))) if len(filas) > 0 else {columna: [] for columna in columnas}
+    valores.update(columnasExtra)
+    return pl.DataFrame([pl.Series(columna, valores[columna], dtype=tipo) for columna, tipo in schema.items()])
+
+# Aplana las jugadas de varios juegos a la vez, los turnos de todos los juegos se numeran en orden.
+# Regresa los turnos, los lanzamientos y los pitchers y bateadores de cada juego (juego_id, es_local, jugador_id)
+def aplanarJugadasJuegos(datosJuegosRaw):
+    turnos = []
+    bases = [] # bits de BASES de cada turno
+    lanzamientos = []
+    # Los pitchers de cada equipo en el orden en que aparecen: el pitcher del turno y despues las sustituciones
+    # de pitcher dentro del turno. En la parte alta batea el visitante y lanza el local
+    pitchers = {}
+    bateadores = {}
+    sustituciones = {}
+
+    for datosJuegoRaw in datosJuegosRaw:
+        juego_id = int(datosJuegoRaw['gameData']['game']['pk'])
+        # Turno en el que llego a base cada corredor que esta en base
+        jugadoresEnBase = {}
+        contador_outs = 0
+        contador_carreras_local = 0
+        contador_carreras_visitante = 0
+
+        for jugada in datosJuegoRaw['liveData']['plays']['allPlays']:
+            resultado = jugada['result']
+            # Validar que tenga informacion
+            tipo_turno_id = resultado.get('eventType')
+            if tipo_turno_id is None:
+                continue
+            turno = len(turnos)
+            es_parte_alta = bool(jugada['about']['isTopInning'])
+
+            # cuenta_outs son los outs del turno anterior, el turno despues de un tercer out reinicia las bases
+            cuenta_outs = contador_outs
+            contador_outs = int(jugada['count']['outs'])
+            if cuenta_outs == 3:
+                contador_outs = 0
+                jugadoresEnBase = {}
+            if es_parte_alta:
+                marcador = int(resultado['awayScore'])
+                carreras_anotadas = marcador - contador_carreras_visitante
+                contador_carreras_visitante = marcador
+            else:
+                marcador = int(resultado['homeScore'])
+                carreras_anotadas = marcador - contador_carreras_local
+                contador_carreras_local = marcador
+
+            bateador_id = int(jugada['matchup']['batter']['id'])
+            pitcher_id = int(jugada['matchup']['pitcher']['id'])
+            turnos.append((turno, resultado.get('description'), int(jugada['about']['inning']), es_parte_alta, cuenta_outs,
+                           carreras_anotadas, juego_id, bateador_id, pitcher_id, tipo_turno_id))
+            bases.append(0)
+            pitchers[(juego_id, es_parte_alta, pitcher_id)] = None
+            bateadores[(juego_id, not es_parte_alta, bateador_id)] = None
+
+            # Lanzamientos, la cuenta antes de cada lanzamiento es la cuenta despues del anterior (0 en el primero)
+            contador_bolas = 0
+            contador_strikes = 0
+            numero_lanzamiento = 0
+            for lanzamiento in jugada['playEvents']:
+                detalles = lanzamiento['details']
+                tipo_evento = detalles.get('eventType')
+                if tipo_evento is not None:
+                    if tipo_evento == 'offensive_substitution':
+                        nuevo_corredor = int(lanzamiento['player']['id'])
+                        sustituciones[(juego_id, not es_parte_alta, nuevo_corredor)] = None
+                        # Un corredor emergente ocupa el lugar del corredor que reemplaza si ese corredor estaba en base
+                        origen = jugadoresEnBase.get(int(lanzamiento['replacedPlayer']['id']))
+                        if origen is not None:
+                            bases[origen] |= EMERGENTE
+                            jugadoresEnBase[nuevo_corredor] = origen
+                    elif tipo_evento == 'pitching_substitution':
+                        pitchers[(juego_id, es_parte_alta, int(lanzamiento['player']['id']))] = None
+                    continue
+
+                numero_lanzamiento += 1
+                # Las banderas que no vienen (o vienen nulas) son False
+                es_strike = detalles.get('isStrike') or False
+                es_out = detalles.get('isOut') or False
+                cuenta = lanzamiento['count']
+                x = None
+                y = None
+                datosLanzamiento = lanzamiento.get('pitchData')
+                if datosLanzamiento is not None:
+                    coordenadas = datosLanzamiento.get('coordinates') or {}
+                    coordenada_x = coordenadas.get('x')
+                    coordenada_y = coordenadas.get('y')
+                    if coordenada_x is not None and coordenada_y is not None:
+                        x = -0.021 * coordenada_x + 2.298
+                        y = -0.021 * coordenada_y + 5.803
+                lanzamientos.append((turno, numero_lanzamiento, detalles.get('isInPlay') or False, detalles.get('isBall') or False, es_strike,
+                                     contador_strikes == 2 and es_strike and not es_out, es_out, contador_bolas, contador_strikes,
+                                     x, y, detalles.get('code')))
+                contador_bolas = int(cuenta['balls'])
+                contador_strikes = int(cuenta['strikes'])
+
+            # Corredores: un corredor que empieza en home llega a base en este turno, al anotar o ser out sale de las bases
+            for corredor in jugada['runners']:
+                corredor_id = int(corredor['details']['runner']['id'])
+                movimiento = corredor['movement']
+                if movimiento.get('start') is None:
+                    jugadoresEnBase[corredor_id] = turno
+                origen = jugadoresEnBase[corredor_id]
+                fin = movimiento.get('end')
+                bases[origen] |= BITS_FIN.get(fin, 0)
+                if fin not in ('1B', '2B', '3B'):
+                    del jugadoresEnBase[corredor_id]
+
+    llegadas = {columna: [base & bit > 0 for base in bases] for columna, bit in BASES.items()}
+    datosTablaTurno = getTabla(turnos, columnas_turno, schema_df_turno, llegadas)
+    datosTablaLanzamiento = getTabla(lanzamientos, list(schema_df_lanzamiento), schema_df_lanzamiento)
+    # Los bateadores de los turnos y despues los que entraron como sustitutos
+    bateadores.update((jugador, None) for jugador in sustituciones if jugador not in bateadores)
+    pitchers = getTabla(list(pitchers), list(schema_jugadores), schema_jugadores)
+    bateadores = getTabla(list(bateadores), list(schema_jugadores), schema_jugadores)
+    return datosTablaTurno, datosTablaLanzamiento, pitchers, bateadores
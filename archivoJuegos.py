@@ -0,0 +1,52 @@
+# Archivo local y comprimido de las respuestas de la API
+# Cada respuesta se guarda con gzip y se identifica por el sha256 de su contenido (objetos/),
+# el indice (indice/) relaciona cada clave, por ejemplo juegos/<gamePk>, con el hash de su contenido
+
+import gzip
+import hashlib
+import os
+import threading
+import dotenv
+
+dotenv.load_dotenv()
+directorioArchivo = os.getenv('DIRECTORIO_ARCHIVO', 'archivo')
+
+def getRutaObjeto(hashContenido):
+    return os.path.join(directorioArchivo, 'objetos', hashContenido[:2], f'{hashContenido}.json.gz')
+
+def getRutaIndice(clave):
+    return os.path.join(directorioArchivo, 'indice', *clave.split('/'))
+
+def escribirArchivo(ruta, contenido):
+    # Se escribe a un archivo temporal y despues se renombra para que otro hilo o proceso nunca lea un archivo a medias
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    rutaTemporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(rutaTemporal, 'wb') as f:
+        f.write(contenido)
+    os.replace(rutaTemporal, ruta)
+
+def guardar(clave, contenido):
+    hashContenido = hashlib.sha256(contenido).hexdigest()
+    rutaObjeto = getRutaObjeto(hashContenido)
+    if not os.path.exists(rutaObjeto):
+        escribirArchivo(rutaObjeto, gzip.compress(contenido, compresslevel=6))
+    escribirArchivo(getRutaIndice(clave), hashContenido.encode())
+    return hashContenido
+
+def leer(clave):
+    rutaIndice = getRutaIndice(clave)
+    if not os.path.exists(rutaIndice):
+        return None
+    with open(rutaIndice, 'rb') as f:
+        hashContenido = f.read().decode().strip()
+    with open(getRutaObjeto(hashContenido), 'rb') as f:
+        return gzip.decompress(f.read())
+
+def existe(clave):
+    return os.path.exists(getRutaIndice(clave))
+
+def getClaves(prefijo):
+    rutaPrefijo = getRutaIndice(prefijo)
+    if not os.path.isdir(rutaPrefijo):
+        return []
+    return [f'{prefijo}/{nombre}' for nombre in os.listdir(rutaPrefijo) if not nombre.endswith('.tmp')]
@@ -0,0 +1,396 @@
+# Benchmark de la ingesta sin red sobre los feeds de benchmark/feeds/ (o DIRECTORIO_BENCHMARK/feeds/).
+# Corre cada etapa de obtenerDatos (decodificacion, getDatosTablaJuego, getDatosTablaJugador, procesarTurnos,
+# los extractores del boxscore, transformarJuegos completo y la escritura con LoteJuegos) y escribe en una base
+# de PostgreSQL temporal que se crea en el servidor local (.env, DB_*_LOCAL) y se borra al terminar.
+# Reporta juegos/s, filas/s y el pico de memoria (RSS) de cada etapa y guarda el resultado en
+# benchmark/resultados/ con el commit actual, asi los cambios de rendimiento se pueden comparar entre commits.
+# El repositorio trae un juego fijo de cada categoria (CATEGORIAS) en benchmark/feeds/ con su manifiesto, para
+# que los resultados de distintos commits se midan sobre los mismos feeds. Esos feeds son sinteticos (sintetico_*,
+# origen 'sintetico' en el manifiesto): tienen la forma de feed/live pero solo los campos que lee la ingesta,
+# unos 120 KB sin comprimir contra varios MB de un feed real, asi que la decodificacion y el aplanado se miden
+# sobre mucho menos datos y sus juegos/s no se comparan con una corrida real. Sirven para comparar commits entre
+# si. --grabar agrega feeds reales (origen 'grabado') del archivo local o de la API a ese directorio y el
+# resultado dice de que origen fueron los feeds que se midieron (origen_feeds)
+#   python benchmarkIngesta.py --grabar                      graba feeds del archivo local, algunos por categoria
+#   python benchmarkIngesta.py --grabar --juegos 745123 ...  graba juegos especificos (archivo local o API)
+#   python benchmarkIngesta.py --copias 10                   corre el benchmark con 10 copias de cada feed
+#   python benchmarkIngesta.py --comparar a.json b.json      compara dos resultados
+
+import argparse
+import gzip
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+import polars as pl
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+import archivoJuegos
+import cargaMasiva
+import decodificador
+import extraccionBoxscore
+import metricas
+import obtenerDatos
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+directorioBase = os.path.dirname(os.path.abspath(__file__))
+directorioBenchmark = os.getenv('DIRECTORIO_BENCHMARK', os.path.join(directorioBase, 'benchmark'))
+directorioFeeds = os.path.join(directorioBenchmark, 'feeds')
+directorioResultados = os.path.join(directorioBenchmark, 'resultados')
+rutaManifiesto = os.path.join(directorioFeeds, 'manifiesto.json')
+rutaCrearTablas = os.path.join(directorioBase, 'dB', 'crearTablas.sql')
+
+CATEGORIAS = ['temporada_regular', 'extra_innings', 'corredor_emergente', 'suspendido']
+JUEGOS_POR_CATEGORIA = 3
+
+# Categorias de un feed completo (decodificado con todos sus campos)
+def getCategorias(datosJuegoRaw):
+    categorias = []
+    gameData = datosJuegoRaw['gameData']
+    liveData = datosJuegoRaw['liveData']
+
+    fechas = gameData.get('datetime', {})
+    if 'resumeDate' in fechas or 'resumedFrom' in fechas or 'Suspended' in gameData['status'].get('detailedState', ''):
+        categorias.append('suspendido')
+    if liveData['linescore'].get('currentInning', 0) > liveData['linescore'].get('scheduledInnings', 9):
+        categorias.append('extra_innings')
+    for jugada in liveData['plays']['allPlays']:
+        for evento in jugada.get('playEvents', []):
+            detalles = evento.get('details', {})
+            if detalles.get('eventType') != 'offensive_substitution':
+                continue
+            if evento.get('position', {}).get('abbreviation') == 'PR' or 'Pinch-runner' in detalles.get('description', ''):
+                categorias.append('corredor_emergente')
+                break
+        if 'corredor_emergente' in categorias:
+            break
+    if len(categorias) == 0 and gameData['game'].get('type') == 'R':
+        categorias.append('temporada_regular')
+    return categorias
+
+def guardarFeed(categoria, juego_id, contenido, manifiesto):
+    nombre = f'{categoria}_{juego_id}.json.gz'
+    os.makedirs(directorioFeeds, exist_ok=True)
+    with open(os.path.join(directorioFeeds, nombre), 'wb') as f:
+        f.write(gzip.compress(contenido))
+    manifiesto[nombre] = {'juego_id': juego_id, 'categoria': categoria, 'origen': 'grabado'}
+    print(f'Grabado {nombre}')
+
+# Graba los juegos indicados (del archivo local o de la API) o, si no se indican, busca en el archivo
+# local hasta JUEGOS_POR_CATEGORIA juegos de cada categoria
+def grabar(clavesJuegos=None):
+    manifiesto = leerManifiesto()
+
+    if clavesJuegos is not None:
+        for juego_id in clavesJuegos:
+            contenido = archivoJuegos.leer(f'juegos/{juego_id}')
+            if contenido is None:
+                contenido = obtenerDatos.getApiRaw(obtenerDatos.urlBaseV1_1 + f'game/{juego_id}/feed/live')
+            categorias = getCategorias(decodificador.decodificar(contenido))
+            guardarFeed(categorias[0] if len(categorias) > 0 else 'otro', juego_id, contenido, manifiesto)
+    else:
+        grabados = {categoria: 0 for categoria in CATEGORIAS}
+        for clave in sorted(archivoJuegos.getClaves('juegos')):
+            if all(total >= JUEGOS_POR_CATEGORIA for total in grabados.values()):
+                break
+            contenido = archivoJuegos.leer(clave)
+            for categoria in getCategorias(decodificador.decodificar(contenido)):
+                if grabados[categoria] < JUEGOS_POR_CATEGORIA:
+                    guardarFeed(categoria, int(clave.split('/')[-1]), contenido, manifiesto)
+                    grabados[categoria] += 1
+                    break
+        for categoria, total in grabados.items():
+            if total < JUEGOS_POR_CATEGORIA:
+                print(f'Solo se encontraron {total} juegos de la categoria {categoria} en el archivo local')
+
+    os.makedirs(directorioFeeds, exist_ok=True)
+    with open(rutaManifiesto, 'w') as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+
+def leerManifiesto():
+    if not os.path.exists(rutaManifiesto):
+        return {}
+    with open(rutaManifiesto) as f:
+        return json.load(f)
+
+# Origen de cada feed segun el manifiesto, los feeds que no estan en el manifiesto se grabaron antes de que
+# existiera el campo origen
+def getOrigenFeeds(nombres):
+    manifiesto = leerManifiesto()
+    return {nombre: manifiesto.get(nombre, {}).get('origen', 'grabado') for nombre in nombres}
+
+def leerFeeds():
+    feeds = {}
+    if os.path.isdir(directorioFeeds):
+        for nombre in sorted(os.listdir(directorioFeeds)):
+            if nombre.endswith('.json.gz'):
+                with open(os.path.join(directorioFeeds, nombre), 'rb') as f:
+                    feeds[nombre] = gzip.decompress(f.read())
+    return feeds
+
+def getRssPico():
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB en Linux
+    import psutil
+    return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+def getCommit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directorioBase, capture_output=True, text=True, check=True).stdout.strip()
+        cambios = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directorioBase, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'sin_commit'
+    return f'{commit}-modificado' if cambios else commit
+
+# Base de datos temporal en el servidor local con las tablas de dB/crearTablas.sql, se borra al terminar
+@contextmanager
+def baseTemporal():
+    _, connection_url = obtenerDatos.crearEngine(coneccion_local=True)
+    url = make_url(connection_url)
+    nombre = f'lmb_benchmark_{os.getpid()}'
+    administrador = create_engine(url.set(database='postgres'), isolation_level='AUTOCOMMIT')
+    with administrador.connect() as conn:
+        conn.execute(text(f'CREATE DATABASE {nombre}'))
+    url = url.set(database=nombre)
+    engine = create_engine(url)
+    try:
+        with open(rutaCrearTablas) as f:
+            sql = f.read()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(sql)
+        yield engine, url.render_as_string(hide_password=False)
+    finally:
+        engine.dispose()
+        with administrador.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS {nombre}'))
+        administrador.dispose()
+
+# Registra en los catalogos los ids que usan los juegos, con descripciones de relleno
+def poblarCatalogos(engine, juegos):
+    equipos = set()
+    umpires = set()
+    tipos_juego = set()
+    status_juego = set()
+    for juego in juegos:
+        equipos.update([juego['juego']['local_id'], juego['juego']['visitante_id']])
+        umpires.update(juego['juego'][columna] for columna in ['umpire_home_id', 'umpire_1b_id', 'umpire_2b_id', 'umpire_3b_id'])
+        tipos_juego.add(juego['juego']['tipo_juego_id'])
+        status_juego.add(juego['juego']['status_juego_id'])
+    catalogos = {
+        'equipo': ("INSERT INTO equipo VALUES (:id, 'Equipo ' || :id, '', '') ON CONFLICT DO NOTHING", equipos),
+        'umpire': ("INSERT INTO umpire VALUES (:id, 'Umpire ' || :id) ON CONFLICT DO NOTHING", umpires),
+        'tipo_juego': ("INSERT INTO tipo_juego VALUES (:id, :id) ON CONFLICT DO NOTHING", tipos_juego),
+        'status_juego': ("INSERT INTO status_juego VALUES (:id, :id) ON CONFLICT DO NOTHING", status_juego),
+        'tipo_turno': ("INSERT INTO tipo_turno VALUES (:id, :id) ON CONFLICT DO NOTHING",
+                       set(pl.concat([juego['turno']['tipo_turno_id'] for juego in juegos]).drop_nulls().to_list())),
+        'tipo_lanzamiento': ("INSERT INTO tipo_lanzamiento VALUES (:id, :id) ON CONFLICT DO NOTHING",
+                             set(pl.concat([juego['lanzamiento']['tipo_lanzamiento_id'] for juego in juegos]).drop_nulls().to_list())),
+        'posicion': ("INSERT INTO posicion VALUES (:id, :id) ON CONFLICT DO NOTHING",
+                     set(pl.concat([juego['jugador']['posicion_id'] for juego in juegos]).drop_nulls().to_list()))
+    }
+    with engine.begin() as conn:
+        for query, ids in catalogos.values():
+            ids = [{'id': valor} for valor in ids if valor is not None]
+            if len(ids) > 0:
+                conn.execute(text(query), ids)
+
+def reiniciarRegistros():
+    obtenerDatos.contexto.jugadoresRegistrados = set()
+    obtenerDatos.contexto.jugadoresSinNombre = set()
+    obtenerDatos.contexto.estadiosRegistrados = set()
+    obtenerDatos.contexto.umpiresRegistrados = set()
+
+# Corre la funcion repeticiones veces, la funcion regresa las filas que genero (o None)
+def medirEtapa(resultados, etapa, funcion, juegos, repeticiones, antes=None):
+    tiempos = []
+    filas = None
+    for _ in range(repeticiones):
+        if antes is not None:
+            antes()
+        inicio = time.perf_counter()
+        filas = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    agregarResultado(resultados, etapa, statistics.median(tiempos), juegos, filas)
+
+def agregarResultado(resultados, etapa, segundos, juegos, filas):
+    segundos = max(segundos, 1e-9)
+    resultados[etapa] = {
+        'segundos': round(segundos, 6),
+        'juegos_por_segundo': round(juegos / segundos, 2),
+        'filas_por_segundo': round(filas / segundos, 2) if filas is not None else None,
+        'rss_pico_mb': round(getRssPico(), 1)
+    }
+    print(f'{etapa:<28} {segundos * 1000:>10.1f} ms {juegos / segundos:>10.1f} juegos/s'
+          + (f' {filas / segundos:>12.0f} filas/s' if filas is not None else ' ' * 20)
+          + f' {resultados[etapa]["rss_pico_mb"]:>8.1f} MB')
+
+def correrBenchmark(copias=1, repeticiones=3, juegosPorLote=20):
+    feeds = leerFeeds()
+    if len(feeds) == 0:
+        raise ValueError(f'No hay feeds en {directorioFeeds}, primero hay que grabarlos con --grabar')
+    contenidos = list(feeds.values())
+    origenFeeds = getOrigenFeeds(feeds)
+    if 'sintetico' in origenFeeds.values():
+        print('Aviso: el benchmark incluye feeds sinteticos, sus juegos/s no se comparan con feeds reales')
+
+    # Copias de cada feed para tener mas volumen, los juegos se numeran desde 1 para que cada copia tenga
+    # un juego_id distinto y sus turno_id (juego_id * TURNOS_POR_JUEGO) quepan en INTEGER
+    def decodificar():
+        datosJuegosRaw = []
+        for copia in range(copias):
+            for contenido in contenidos:
+                datosJuegoRaw = decodificador.decodificarJuego(contenido)
+                datosJuegoRaw['gameData']['game']['pk'] = len(datosJuegosRaw) + 1
+                datosJuegosRaw.append(datosJuegoRaw)
+        return datosJuegosRaw
+    datosJuegosRaw = decodificar()
+    totalJuegos = len(datosJuegosRaw)
+    print(f'Benchmark: {len(contenidos)} feeds x {copias} copias = {totalJuegos} juegos, {repeticiones} repeticiones, decodificador {decodificador.backend}')
+
+    reiniciarRegistros()
+    resultados = {}
+    def decodificarFeeds():
+        decodificar()
+    medirEtapa(resultados, 'decodificacion', decodificarFeeds, totalJuegos, repeticiones)
+    medirEtapa(resultados, 'getDatosTablaJuego', lambda: len([obtenerDatos.getDatosTablaJuego(datosJuegoRaw) for datosJuegoRaw in datosJuegosRaw]), totalJuegos, repeticiones)
+    medirEtapa(resultados, 'getDatosTablaJugador', lambda: sum(obtenerDatos.getDatosTablaJugador(datosJuegoRaw['gameData']['players']).height for datosJuegoRaw in datosJuegosRaw), totalJuegos, repeticiones)
+
+    def procesarTurnos():
+        turnosJuegos, _, _ = obtenerDatos.procesarTurnos(datosJuegosRaw)
+        return sum(turno.height + lanzamiento.height for turno, lanzamiento in turnosJuegos.values())
+    medirEtapa(resultados, 'procesarTurnos', procesarTurnos, totalJuegos, repeticiones)
+
+    _, pitchers, bateadores = obtenerDatos.procesarTurnos(datosJuegosRaw)
+    medirEtapa(resultados, 'extractorJuego_pitcher', lambda: extraccionBoxscore.extractorJuego_pitcher.extraer(datosJuegosRaw, pitchers).height, totalJuegos, repeticiones)
+    medirEtapa(resultados, 'extractorJuego_bateador', lambda: extraccionBoxscore.extractorJuego_bateador.extraer(datosJuegosRaw, bateadores).height, totalJuegos, repeticiones)
+
+    def transformarJuegos():
+        juegos = []
+        for i in range(0, totalJuegos, juegosPorLote):
+            juegos += obtenerDatos.transformarJuegos(datosJuegosRaw[i:i + juegosPorLote])
+        return juegos
+    tablas = ['jugador', 'turno', 'lanzamiento', 'juego_pitcher', 'juego_bateador']
+    medirEtapa(resultados, 'transformarJuegos', lambda: sum(juego[tabla].height for juego in transformarJuegos() for tabla in tablas), totalJuegos, repeticiones)
+
+    juegos = transformarJuegos()
+    with baseTemporal() as (engine, connection_url):
+        obtenerDatos.contexto.conexion = (engine, connection_url)
+        poblarCatalogos(engine, juegos)
+
+        def reiniciarTablas():
+            reiniciarRegistros()
+            with engine.begin() as conn:
+                conn.execute(text('TRUNCATE juego, jugador, estadio, turno, lanzamiento, juego_pitcher, juego_bateador CASCADE'))
+            metricas.registro.reiniciar()
+
+        def escribir(modoEscritura='copy'):
+            lote = obtenerDatos.LoteJuegos(maxJuegos=juegosPorLote, modoEscritura=modoEscritura)
+            juegosFallidos = []
+            # Los avisos de jugadores sin nombre se repetirian en cada repeticion y en cada copia
+            with redirect_stdout(io.StringIO()):
+                for juego in juegos:
+                    lote.agregar(dict(juego))
+                    if lote.estaLleno():
+                        juegosFallidos += lote.vaciar()
+                juegosFallidos += lote.vaciar()
+            if len(juegosFallidos) > 0:
+                raise ValueError(f'No se pudieron escribir {len(juegosFallidos)} juegos')
+            filas = metricas.registro.contadores.get('filas_escritas', {})
+            return sum(filas.values())
+        medirEtapa(resultados, 'escritura', escribir, totalJuegos, repeticiones, antes=reiniciarTablas)
+
+        # Desglose por tabla de la ultima repeticion (medido con metricas.py dentro de escribirJuegos)
+        filasTablas = metricas.registro.contadores.get('filas_escritas', {})
+        for etapa, datos in sorted(metricas.registro.etapas.items()):
+            if not etapa.startswith('escritura_') or etapa == 'escritura_lote':
+                continue
+            agregarResultado(resultados, etapa, datos['segundos'], totalJuegos, filasTablas.get(etapa.removeprefix('escritura_'), 0))
+
+        # Volver a escribir los mismos juegos con upsert, el costo de reprocesar juegos que ya estan en la base
+        def reiniciarMetricas():
+            reiniciarRegistros()
+            metricas.registro.reiniciar()
+        medirEtapa(resultados, 'escritura_upsert', lambda: escribir('upsert'), totalJuegos, repeticiones, antes=reiniciarMetricas)
+
+        # Carga masiva sobre las tablas vacias: COPY a las tablas de la carga, validacion y fusion
+        def escribirCarga(reconstruirIndices):
+            with redirect_stdout(io.StringIO()):
+                cargaMasiva.prepararCarga(engine)
+            filas = escribir('carga')
+            with redirect_stdout(io.StringIO()):
+                juegosInvalidos = cargaMasiva.fusionarCarga(engine, obtenerDatos.TURNOS_POR_JUEGO, reconstruirIndices)
+            if len(juegosInvalidos) > 0:
+                raise ValueError(f'{len(juegosInvalidos)} juegos no pasaron la validacion de la carga')
+            return filas
+        medirEtapa(resultados, 'escritura_carga', lambda: escribirCarga(False), totalJuegos, repeticiones, antes=reiniciarTablas)
+        medirEtapa(resultados, 'escritura_carga_indices', lambda: escribirCarga(True), totalJuegos, repeticiones, antes=reiniciarTablas)
+        del obtenerDatos.contexto.conexion
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': getCommit(),
+        'python': platform.python_version(),
+        'polars': pl.__version__,
+        'decodificador': decodificador.backend,
+        'feeds': sorted(feeds.keys()),
+        'origen_feeds': sorted(set(origenFeeds.values())),
+        'copias': copias,
+        'repeticiones': repeticiones,
+        'juegos_por_lote': juegosPorLote,
+        'juegos': totalJuegos,
+        'rss_pico_mb': round(getRssPico(), 1),
+        'etapas': resultados
+    }
+
+def guardarResultado(resultado):
+    os.makedirs(directorioResultados, exist_ok=True)
+    fecha = datetime.fromisoformat(resultado['fecha']).strftime('%Y%m%d_%H%M%S')
+    ruta = os.path.join(directorioResultados, f'{fecha}_{resultado["commit"]}.json')
+    with open(ruta, 'w') as f:
+        json.dump(resultado, f, indent=2)
+    return ruta
+
+def comparar(rutaBase, rutaNueva):
+    with open(rutaBase) as f:
+        base = json.load(f)
+    with open(rutaNueva) as f:
+        nuevo = json.load(f)
+    if base['feeds'] != nuevo['feeds'] or base['copias'] != nuevo['copias']:
+        print('Aviso: los resultados no se corrieron con los mismos feeds y copias')
+    for nombre, resultado in [('base', base), ('nuevo', nuevo)]:
+        if 'sintetico' in resultado.get('origen_feeds', []):
+            print(f'Aviso: el resultado {nombre} se midio con feeds sinteticos')
+    print(f'{"etapa":<28} {base["commit"]:>16} {nuevo["commit"]:>16}   (juegos/s)')
+    for etapa, datos in nuevo['etapas'].items():
+        if etapa not in base['etapas'] or datos['juegos_por_segundo'] is None or base['etapas'][etapa]['juegos_por_segundo'] is None:
+            continue
+        juegosBase = base['etapas'][etapa]['juegos_por_segundo']
+        print(f'{etapa:<28} {juegosBase:>16.1f} {datos["juegos_por_segundo"]:>16.1f}   x{datos["juegos_por_segundo"] / juegosBase:.2f}')
+    print(f'{"rss_pico_mb":<28} {base["rss_pico_mb"]:>16.1f} {nuevo["rss_pico_mb"]:>16.1f}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de la ingesta sobre feeds fijos y una base temporal')
+    parser.add_argument('--grabar', action='store_true', help='Grabar feeds en benchmark/feeds/')
+    parser.add_argument('--juegos', type=int, nargs='+', help='Juegos a grabar (por defecto se eligen del archivo local por categoria)')
+    parser.add_argument('--copias', type=int, default=1, help='Copias de cada feed con juego_id distinto')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Repeticiones de cada etapa, se reporta la mediana')
+    parser.add_argument('--juegos-por-lote', type=int, default=20, help='Juegos por transformacion y por transaccion')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVO'), help='Comparar dos resultados de benchmark/resultados/')
+    args = parser.parse_args()
+
+    if args.grabar:
+        grabar(args.juegos)
+    elif args.comparar:
+        comparar(*args.comparar)
+    else:
+        resultado = correrBenchmark(args.copias, args.repeticiones, args.juegos_por_lote)
+        print(f'Resultado guardado en {guardarResultado(resultado)}')
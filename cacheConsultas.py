@@ -0,0 +1,157 @@
+# Cache local de los resultados de las consultas de los analisis y notebooks, para no repetir los joins pesados
+# de juego y equipo en cada reinicio del kernel o cambio de un parametro.
+# Cada resultado se guarda en Parquet y se identifica por el sha256 de la consulta normalizada (espacios y
+# comentarios no cambian la llave) con sus parametros y esquema. Los resultados se guardan en un subdirectorio
+# por revision de la ingesta: cada transaccion que escribe juegos avanza la revision (avanzarRevision), los
+# resultados anteriores ya no se leen y se borran. El cache tiene un tamano maximo, al pasarlo se borran los
+# resultados usados hace mas tiempo.
+# Los cambios de los catalogos, umpires y nombres de jugadores tambien avanzan la revision. Despues de editar la base
+# a mano se usa limpiarCache()
+#   juegos = cacheConsultas.consultar(engine, text("SELECT ... WHERE temporada = :temporada"), {'temporada': '2024'})
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import dotenv
+import polars as pl
+from sqlalchemy import text
+
+dotenv.load_dotenv()
+directorioCache = os.getenv('DIRECTORIO_CACHE', 'cache')
+tamanoMaximoCache = int(os.getenv('TAMANO_MAXIMO_CACHE', 1024 * 1024 * 1024)) # bytes
+
+# Revision de la ingesta, una sola fila que avanzan las transacciones que escriben juegos, turnos, lanzamientos
+# o resumenes (LoteJuegos, los juegos en vivo, la carga masiva y --reingestar). Se avanza al final de cada
+# transaccion, asi el bloqueo de la fila solo dura hasta que la transaccion termina.
+# revision_juego tiene la revision de cada juego, un numero nuevo de revision_juego_seq cada vez que se escribe
+# el juego aunque su fila de juego no cambie (el upsert no reescribe las filas iguales). La exportacion al lago
+# (exportacionLago.py) la usa para saber que juegos cambiaron
+def crearTablaRevision(conn):
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS revision_ingesta
+                         (
+                             id            BOOLEAN NOT NULL DEFAULT TRUE ,
+                             revision      BIGINT NOT NULL ,
+                             actualizado   TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+                             PRIMARY KEY (id),
+                             CONSTRAINT revision_ingesta_ck_id CHECK (id)
+                         )"""))
+    conn.execute(text("""CREATE SEQUENCE IF NOT EXISTS revision_juego_seq"""))
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS revision_juego
+                         (
+                             juego_id      INTEGER NOT NULL ,
+                             revision      BIGINT NOT NULL ,
+
+                             PRIMARY KEY (juego_id),
+                             CONSTRAINT fk_revision_juego_juego_id FOREIGN KEY (juego_id) REFERENCES juego (juego_id) ON DELETE CASCADE
+                         )"""))
+
+def avanzarRevision(conn):
+    conn.execute(text("""INSERT INTO revision_ingesta (id, revision) VALUES (TRUE, 1)
+                         ON CONFLICT (id) DO UPDATE
+                         SET revision = revision_ingesta.revision + 1,
+                             actualizado = NOW()"""))
+
+def registrarRevisionJuegos(conn, juegos_id):
+    conn.execute(text("""INSERT INTO revision_juego (juego_id, revision)
+                         SELECT juego_id, NEXTVAL('revision_juego_seq') FROM UNNEST(CAST(:juegos_id AS INTEGER[])) AS j (juego_id)
+                         ON CONFLICT (juego_id) DO UPDATE
+                         SET revision = EXCLUDED.revision"""), {'juegos_id': list(juegos_id)})
+
+QUERY_MARCA = text("""SELECT COALESCE(MAX(revision), 0) FROM revision_ingesta""")
+
+# Textos entre comillas, comentarios y espacios de una consulta
+PARTES_CONSULTA = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|(?:--[^\n]*|/\*.*?\*/|\s)+""", re.DOTALL)
+
+def normalizarConsulta(consulta):
+    # Los textos entre comillas se dejan igual, los comentarios y los espacios se cambian por un espacio
+    return PARTES_CONSULTA.sub(lambda parte: parte.group(1) or ' ', str(consulta)).strip()
+
+def getMarcaIngesta(conn):
+    return f'revision_{conn.execute(QUERY_MARCA).scalar()}'
+
+def getLlaveConsulta(consulta, parametros=None, schema_overrides=None):
+    llave = {
+        'consulta': normalizarConsulta(consulta),
+        'parametros': parametros or {},
+        'esquema': {columna: str(tipo) for columna, tipo in (schema_overrides or {}).items()}
+    }
+    return hashlib.sha256(json.dumps(llave, sort_keys=True, default=str).encode()).hexdigest()
+
+def getRutaResultado(directorio, marca, llave):
+    return os.path.join(directorio, marca, f'{llave}.parquet')
+
+def leerResultado(ruta):
+    try:
+        resultado = pl.read_parquet(ruta)
+        # La fecha de modificacion es la del ultimo uso, para borrar primero los resultados usados hace mas tiempo
+        os.utime(ruta)
+        return resultado
+    except (FileNotFoundError, PermissionError):
+        # Otro proceso lo borro mientras se leia
+        return None
+
+def guardarResultado(ruta, resultado):
+    # Se escribe a un archivo temporal y despues se renombra para que otro proceso nunca lea un archivo a medias
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    rutaTemporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+    resultado.write_parquet(rutaTemporal)
+    try:
+        os.replace(rutaTemporal, ruta)
+    except PermissionError:
+        # En Windows no se puede reemplazar un archivo abierto, otro proceso ya guardo el mismo resultado
+        os.remove(rutaTemporal)
+
+def borrar(ruta):
+    try:
+        if os.path.isdir(ruta):
+            shutil.rmtree(ruta)
+        else:
+            os.remove(ruta)
+    except OSError:
+        # Ya lo borro otro proceso o esta abierto (Windows), se borra en otra llamada
+        pass
+
+# Borra los resultados de las marcas anteriores y, si el cache pasa de tamanoMaximo, los usados hace mas tiempo
+def liberarEspacio(directorio, marca, tamanoMaximo):
+    resultados = []
+    for entrada in os.scandir(directorio):
+        if entrada.is_dir() and entrada.name != marca:
+            borrar(entrada.path)
+    for entrada in os.scandir(os.path.join(directorio, marca)):
+        if entrada.name.endswith('.parquet'):
+            try:
+                datos = entrada.stat()
+            except FileNotFoundError:
+                continue
+            resultados.append((datos.st_mtime, datos.st_size, entrada.path))
+    tamano = sum(resultado[1] for resultado in resultados)
+    for _, tamanoResultado, ruta in sorted(resultados):
+        if tamano <= tamanoMaximo:
+            break
+        borrar(ruta)
+        tamano -= tamanoResultado
+
+# Igual que pl.read_database pero con cache. La marca y la consulta se leen en la misma transaccion, asi un
+# resultado siempre corresponde a la marca con la que se guarda
+def consultar(engine, consulta, parametros=None, schema_overrides=None, directorio=directorioCache, tamanoMaximo=tamanoMaximoCache):
+    if isinstance(consulta, str):
+        consulta = text(consulta)
+    llave = getLlaveConsulta(consulta, parametros, schema_overrides)
+    with engine.connect().execution_options(isolation_level='REPEATABLE READ') as conn, conn.begin():
+        marca = getMarcaIngesta(conn)
+        ruta = getRutaResultado(directorio, marca, llave)
+        if os.path.exists(ruta):
+            resultado = leerResultado(ruta)
+            if resultado is not None:
+                return resultado
+        resultado = pl.read_database(consulta, conn, execute_options={'parameters': parametros or {}}, schema_overrides=schema_overrides)
+    guardarResultado(ruta, resultado)
+    liberarEspacio(directorio, marca, tamanoMaximo)
+    return resultado
+
+def limpiarCache(directorio=directorioCache):
+    shutil.rmtree(directorio, ignore_errors=True)
@@ -0,0 +1,174 @@
+# Carga masiva para llenar temporadas completas (backfill)
+# Los juegos se copian con COPY a tablas UNLOGGED sin llaves ni indices (carga_<tabla>), asi escribir un lote
+# no revisa llaves foraneas ni actualiza indices fila por fila. Al final se valida la carga con una consulta
+# por llave foranea, se descartan los juegos con datos invalidos y se fusiona con un INSERT ... SELECT por tabla
+# en una sola transaccion. Opcionalmente se eliminan los indices secundarios y las llaves foraneas de las
+# tablas antes de fusionar y se vuelven a crear despues, crearlos una vez es mas rapido que mantenerlos
+# fila por fila cuando la carga es grande comparada con lo que ya esta en la base
+
+from sqlalchemy import text
+import cacheConsultas
+import metricas
+import resumenEquipos
+
+# Tablas que pasan por la carga en el orden en que se fusionan (primero las tablas referidas)
+TABLAS_CARGA = ['juego', 'jugador', 'turno', 'lanzamiento', 'juego_pitcher', 'juego_bateador']
+
+# memoria para ordenar al crear cada indice
+MEMORIA_INDICES = '256MB'
+
+# Llaves foraneas que se validan antes de fusionar: (tabla, columna, tabla referida, columna referida).
+# Si la tabla referida tambien esta en la carga el valor puede estar en la tabla o en su carga
+llavesCarga = [
+    ('juego', 'local_id', 'equipo', 'equipo_id'),
+    ('juego', 'visitante_id', 'equipo', 'equipo_id'),
+    ('juego', 'tipo_juego_id', 'tipo_juego', 'tipo_juego_id'),
+    ('juego', 'estadio_id', 'estadio', 'estadio_id'),
+    ('juego', 'status_juego_id', 'status_juego', 'status_juego_id'),
+    ('juego', 'umpire_home_id', 'umpire', 'umpire_id'),
+    ('juego', 'umpire_1b_id', 'umpire', 'umpire_id'),
+    ('juego', 'umpire_2b_id', 'umpire', 'umpire_id'),
+    ('juego', 'umpire_3b_id', 'umpire', 'umpire_id'),
+    ('turno', 'juego_id', 'juego', 'juego_id'),
+    ('turno', 'bateador_id', 'jugador', 'jugador_id'),
+    ('turno', 'pitcher_id', 'jugador', 'jugador_id'),
+    ('turno', 'tipo_turno_id', 'tipo_turno', 'tipo_turno_id'),
+    ('lanzamiento', 'turno_id', 'turno', 'turno_id'),
+    ('lanzamiento', 'tipo_lanzamiento_id', 'tipo_lanzamiento', 'tipo_lanzamiento_id'),
+    ('juego_pitcher', 'juego_id', 'juego', 'juego_id'),
+    ('juego_pitcher', 'pitcher_id', 'jugador', 'jugador_id'),
+    ('juego_bateador', 'juego_id', 'juego', 'juego_id'),
+    ('juego_bateador', 'bateador_id', 'jugador', 'jugador_id')
+]
+
+def getTablaCarga(tabla):
+    return f'carga_{tabla}'
+
+# Expresion con el juego de cada fila de la carga de una tabla (alias c). Los lanzamientos no tienen
+# juego_id, pero su turno_id es juego_id * turnosPorJuego + numero de turno
+def getJuegoFila(tabla, turnosPorJuego):
+    if tabla == 'lanzamiento':
+        return f'c.turno_id / {turnosPorJuego}'
+    return 'c.juego_id'
+
+# Crea las tablas de la carga con las columnas actuales de cada tabla. Si quedaron de una corrida que no
+# termino se descartan, nada de esa corrida se fusiono y sus juegos se vuelven a procesar desde la marca de agua
+def prepararCarga(engine):
+    with engine.begin() as conn:
+        for tabla in TABLAS_CARGA:
+            conn.execute(text(f"""DROP TABLE IF EXISTS {getTablaCarga(tabla)}"""))
+            conn.execute(text(f"""CREATE UNLOGGED TABLE {getTablaCarga(tabla)} (LIKE {tabla})"""))
+
+# Regresa los juegos de la carga con algun dato invalido y el motivo. Los jugadores no pertenecen a un
+# juego, los que tienen una posicion invalida se quitan de la carga y sus juegos fallan al validar turnos
+def validarCarga(conn, turnosPorJuego):
+    jugadoresInvalidos = conn.execute(text(f"""DELETE FROM {getTablaCarga('jugador')} c
+                                             WHERE c.posicion_id IS NOT NULL
+                                               AND NOT EXISTS (SELECT 1 FROM posicion r WHERE r.posicion_id = c.posicion_id)
+                                             RETURNING c.jugador_id""")).fetchall()
+    for jugador in jugadoresInvalidos:
+        print(f'jugador: {jugador[0]} -> posicion invalida, no se agrega')
+
+    juegosInvalidos = {}
+    consultas = [
+        ('ya esta registrado', f"""SELECT c.juego_id FROM {getTablaCarga('juego')} c
+                                  WHERE EXISTS (SELECT 1 FROM juego r WHERE r.juego_id = c.juego_id)"""),
+        ('esta duplicado en la carga', f"""SELECT c.juego_id FROM {getTablaCarga('juego')} c
+                                          GROUP BY c.juego_id HAVING COUNT(*) > 1""")
+    ]
+    for tabla, columna, tablaReferida, columnaReferida in llavesCarga:
+        condicion = f'NOT EXISTS (SELECT 1 FROM {tablaReferida} r WHERE r.{columnaReferida} = c.{columna})'
+        if tablaReferida in TABLAS_CARGA:
+            condicion += f' AND NOT EXISTS (SELECT 1 FROM {getTablaCarga(tablaReferida)} r WHERE r.{columnaReferida} = c.{columna})'
+        consultas.append((f'{tabla}.{columna} no existe en {tablaReferida}',
+                          f"""SELECT DISTINCT {getJuegoFila(tabla, turnosPorJuego)} FROM {getTablaCarga(tabla)} c
+                              WHERE c.{columna} IS NOT NULL AND {condicion}"""))
+
+    for motivo, consulta in consultas:
+        for juego in conn.execute(text(consulta)):
+            juegosInvalidos.setdefault(int(juego[0]), motivo)
+    return juegosInvalidos
+
+def eliminarJuegosCarga(conn, juegos_id, turnosPorJuego):
+    for tabla in TABLAS_CARGA:
+        if tabla == 'jugador':
+            continue
+        conn.execute(text(f"""DELETE FROM {getTablaCarga(tabla)} c WHERE {getJuegoFila(tabla, turnosPorJuego)} = ANY(:juegos_id)"""),
+                     {'juegos_id': juegos_id})
+
+# Indices que no son de llave primaria o unica y llaves foraneas de las tablas, con su definicion para volver a crearlos
+def getIndicesSecundarios(conn):
+    query = text("""SELECT i.relname, pg_get_indexdef(x.indexrelid)
+                    FROM pg_index x
+                    JOIN pg_class i ON i.oid = x.indexrelid
+                    JOIN pg_class t ON t.oid = x.indrelid
+                    WHERE t.relname = ANY(:tablas) AND t.relnamespace = current_schema()::regnamespace
+                      AND NOT x.indisprimary AND NOT x.indisunique""")
+    return conn.execute(query, {'tablas': TABLAS_CARGA}).fetchall()
+
+# Las llaves que refieren a una tabla particionada tienen una copia por particion (conparentid) que se
+# elimina y se vuelve a crear con la llave original
+def getLlavesForaneas(conn):
+    query = text("""SELECT t.relname, c.conname, pg_get_constraintdef(c.oid)
+                    FROM pg_constraint c
+                    JOIN pg_class t ON t.oid = c.conrelid
+                    WHERE c.contype = 'f' AND c.conparentid = 0 AND t.relname = ANY(:tablas) AND t.relnamespace = current_schema()::regnamespace""")
+    return conn.execute(query, {'tablas': TABLAS_CARGA}).fetchall()
+
+def fusionarTablas(conn):
+    for tabla in TABLAS_CARGA:
+        columnas = ', '.join(columna[0] for columna in conn.execute(text("""SELECT column_name FROM information_schema.columns
+                                                                          WHERE table_schema = current_schema() AND table_name = :tabla
+                                                                          ORDER BY ordinal_position"""), {'tabla': tabla}))
+        conflicto = 'ON CONFLICT DO NOTHING' if tabla == 'jugador' else ''
+        with metricas.medir(f'fusion_{tabla}', juegos=0):
+            filas = conn.execute(text(f"""INSERT INTO {tabla} ({columnas})
+                                         SELECT {columnas} FROM {getTablaCarga(tabla)}
+                                         {conflicto}""")).rowcount
+        metricas.contar('filas_fusionadas', filas, tabla)
+
+# Valida y fusiona la carga con las tablas en una sola transaccion, regresa los juegos invalidos que no se fusionaron.
+# Con reconstruirIndices se eliminan los indices secundarios y las llaves foraneas antes de fusionar y se vuelven
+# a crear despues, cada llave foranea se revisa con una sola consulta sobre toda la tabla
+def fusionarCarga(engine, turnosPorJuego, reconstruirIndices=False):
+    with engine.begin() as conn:
+        with metricas.medir('validacion_carga', juegos=0):
+            juegosInvalidos = validarCarga(conn, turnosPorJuego)
+            if len(juegosInvalidos) > 0:
+                eliminarJuegosCarga(conn, list(juegosInvalidos), turnosPorJuego)
+        for juego_id, motivo in sorted(juegosInvalidos.items()):
+            print(f'Juego {juego_id} no se fusiona: {motivo}')
+
+        juegos = conn.execute(text(f"""SELECT COUNT(*) FROM {getTablaCarga('juego')}""")).scalar()
+        if reconstruirIndices:
+            indices = getIndicesSecundarios(conn)
+            llaves = getLlavesForaneas(conn)
+            with metricas.medir('eliminar_indices', juegos=0):
+                for tabla, nombre, _ in llaves:
+                    conn.execute(text(f"""ALTER TABLE {tabla} DROP CONSTRAINT {nombre}"""))
+                for nombre, _ in indices:
+                    conn.execute(text(f"""DROP INDEX {nombre}"""))
+
+        with metricas.medir('fusion_carga', juegos=juegos):
+            fusionarTablas(conn)
+        juegos_id = [juego[0] for juego in conn.execute(text(f"""SELECT juego_id FROM {getTablaCarga('juego')}"""))]
+        with metricas.medir('resumen_equipos', juegos=juegos):
+            resumenEquipos.actualizarResumenesJuegos(conn, juegos_id)
+
+        if reconstruirIndices:
+            with metricas.medir('crear_indices', juegos=0):
+                conn.execute(text(f"""SET LOCAL maintenance_work_mem = '{MEMORIA_INDICES}'"""))
+                # En las tablas particionadas la definicion es ON ONLY, sin ONLY el indice se crea tambien en cada particion
+                for _, definicion in indices:
+                    conn.exec_driver_sql(definicion.replace(' ON ONLY ', ' ON ', 1))
+                for tabla, nombre, definicion in llaves:
+                    conn.exec_driver_sql(f"""ALTER TABLE {tabla} ADD CONSTRAINT {nombre} {definicion}""")
+        conn.execute(text(f"""TRUNCATE {', '.join(getTablaCarga(tabla) for tabla in TABLAS_CARGA)}"""))
+        cacheConsultas.registrarRevisionJuegos(conn, juegos_id)
+        cacheConsultas.avanzarRevision(conn)
+
+    # Estadisticas nuevas para el planificador despues de agregar muchas filas
+    with engine.begin() as conn:
+        conn.execute(text(f"""ANALYZE {', '.join(TABLAS_CARGA)}"""))
+    print(f'Carga masiva: {juegos} juegos fusionados, {len(juegosInvalidos)} juegos invalidos')
+    return sorted(juegosInvalidos)
@@ -0,0 +1,243 @@
+# Ingesta distribuida con una cola de juegos en la tabla trabajo_juego
+# Un proceso encola los juegos por ingerir (de la API o del archivo local) y cualquier numero de trabajadores,
+# en una o varias maquinas que usen la misma base, toman lotes de juegos, los procesan y los marcan como
+# terminados o fallidos con su error.
+# Tomar un lote es un UPDATE corto (con FOR UPDATE SKIP LOCKED) que pasa los juegos a en_proceso con el nombre
+# del trabajador y la hora en que los tomo, asi ninguna transaccion queda abierta mientras se procesa el lote.
+# Si el trabajador se cae sus juegos se quedan en_proceso hasta que vence la toma (DURACION_TOMA), despues
+# cuentan como un intento fallido y otro trabajador los vuelve a tomar. Los juegos se escriben con upsert, asi un
+# juego que se escribio pero no se alcanzo a marcar se puede volver a procesar
+#   python colaTrabajos.py --encolar                  encola los juegos finalizados de las temporadas que faltan
+#   python colaTrabajos.py --encolar --replay         encola los juegos del archivo local que no estan en la base
+#   python colaTrabajos.py --trabajador               procesa juegos de la cola hasta que se vacia
+#   python colaTrabajos.py --estado                   juegos por estado y los ultimos errores
+#   python colaTrabajos.py --reintentar --trabajador  regresa los juegos fallidos a la cola y los procesa
+
+import argparse
+import os
+import socket
+from time import sleep
+from sqlalchemy import text
+import archivoJuegos
+import metricas
+import obtenerDatos
+
+MAX_INTENTOS = 3 # los juegos fallidos se vuelven a tomar hasta este numero de intentos
+ESPERA_COLA_VACIA = 30 # segundos entre revisiones de la cola con --esperar
+DURACION_TOMA = 30 # minutos que un trabajador tiene para procesar un lote antes de que otro lo pueda tomar
+
+# Para bases creadas antes de que existiera la cola
+def crearTablaTrabajos():
+    query_tabla = text("""CREATE TABLE IF NOT EXISTS trabajo_juego
+                          (
+                              juego_id      INTEGER NOT NULL ,
+                              temporada     TEXT ,
+                              estado        TEXT NOT NULL DEFAULT 'pendiente' ,
+                              intentos      SMALLINT NOT NULL DEFAULT 0 ,
+                              trabajador    TEXT ,
+                              tomado        TIMESTAMP(0) WITH TIME ZONE ,
+                              error         TEXT ,
+                              creado        TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                              actualizado   TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+                              PRIMARY KEY (juego_id),
+                              CONSTRAINT trabajo_juego_ck_estado CHECK (estado IN ('pendiente', 'en_proceso', 'terminado', 'fallido'))
+                          )""")
+    query_indice = text("""CREATE INDEX IF NOT EXISTS idx_trabajo_juego_estado ON trabajo_juego (estado, juego_id)""")
+    # Las colas creadas antes de que los juegos se tomaran con en_proceso no tienen la columna tomado ni ese estado
+    query_en_proceso = text("""SELECT POSITION('en_proceso' IN pg_get_constraintdef(oid)) > 0 FROM pg_constraint
+                                 WHERE conrelid = 'trabajo_juego'::regclass AND conname = 'trabajo_juego_ck_estado'""")
+    query_migracion = text("""ALTER TABLE trabajo_juego
+                                    ADD COLUMN IF NOT EXISTS tomado TIMESTAMP(0) WITH TIME ZONE ,
+                                    DROP CONSTRAINT IF EXISTS trabajo_juego_ck_estado ,
+                                    ADD CONSTRAINT trabajo_juego_ck_estado CHECK (estado IN ('pendiente', 'en_proceso', 'terminado', 'fallido'))""")
+    with obtenerDatos.contexto.engine.begin() as conn:
+        conn.execute(query_tabla)
+        conn.execute(query_indice)
+        if not conn.execute(query_en_proceso).scalar():
+            conn.execute(query_migracion)
+
+def encolarJuegos(clavesJuegos, temporada=None):
+    if len(clavesJuegos) == 0:
+        return 0
+    # Un juego que ya esta en la cola no se vuelve a encolar, aunque haya fallado
+    query = text("""INSERT INTO trabajo_juego (juego_id, temporada)
+                    SELECT juego_id, :temporada FROM UNNEST(CAST(:claves AS INTEGER[])) AS juego_id
+                    ON CONFLICT (juego_id) DO NOTHING""")
+    with obtenerDatos.contexto.engine.begin() as conn:
+        return conn.execute(query, {'claves': list(clavesJuegos), 'temporada': temporada}).rowcount
+
+# Encola los juegos finalizados de cada temporada y avanza su marca de agua, los juegos ya quedan guardados en la cola
+def encolarTemporadas(temporadas):
+    obtenerDatos.validarTablasIndependientes()
+    obtenerDatos.actualizarEsquema()
+    crearTablaTrabajos()
+    for temporada in temporadas:
+        clavesJuegosTemporada, estadoTemporada = obtenerDatos.getClavesJuegosTemporada(temporada)
+        if estadoTemporada is None:
+            print(f'Temporada: {temporada} cerrada')
+            continue
+        encolados = encolarJuegos(clavesJuegosTemporada, str(temporada))
+        print(f'Temporada: {temporada} juegos encolados: {encolados} pendientes: {len(estadoTemporada["pendientes"])}')
+        obtenerDatos.guardarEstadoTemporada(temporada, estadoTemporada)
+
+def encolarArchivo():
+    obtenerDatos.modoReplay = True
+    obtenerDatos.validarTablasIndependientes()
+    crearTablaTrabajos()
+    juegosRegistrados = obtenerDatos.getJuegosRegistrados()
+    clavesJuegosArchivo = [int(clave.split('/')[-1]) for clave in archivoJuegos.getClaves('juegos')]
+    clavesJuegosArchivo = sorted(juego_id for juego_id in clavesJuegosArchivo if juego_id not in juegosRegistrados)
+    print(f'Replay: juegos encolados desde el archivo local: {encolarJuegos(clavesJuegosArchivo)}')
+
+# Los juegos en_proceso cuya toma vencio (el trabajador se cayo o tardo demasiado) se marcan como fallidos,
+# asi se vuelven a tomar si les quedan intentos
+def liberarTomasVencidas(conn, duracionToma):
+    query = text("""UPDATE trabajo_juego
+                    SET estado = 'fallido', error = 'La toma de ' || trabajador || ' vencio sin marcar el juego', actualizado = NOW()
+                    WHERE estado = 'en_proceso' AND tomado < NOW() - MAKE_INTERVAL(mins => :duracion_toma)""")
+    liberados = conn.execute(query, {'duracion_toma': duracionToma}).rowcount
+    if liberados > 0:
+        print(f'Juegos con la toma vencida: {liberados}')
+
+# Toma hasta juegosPorLote juegos pendientes (o fallidos con intentos restantes) que ningun otro trabajador
+# tenga bloqueados y los pasa a en_proceso a nombre de trabajador. Cada toma cuenta como un intento
+def tomarJuegos(conn, trabajador, juegosPorLote, maxIntentos):
+    query = text("""UPDATE trabajo_juego
+                    SET estado = 'en_proceso', tomado = NOW(), trabajador = :trabajador, intentos = intentos + 1,
+                        actualizado = NOW()
+                    WHERE juego_id IN (SELECT juego_id FROM trabajo_juego
+                                       WHERE estado = 'pendiente' OR (estado = 'fallido' AND intentos < :max_intentos)
+                                       ORDER BY juego_id
+                                       LIMIT :juegos_por_lote
+                                       FOR UPDATE SKIP LOCKED)
+                    RETURNING juego_id""")
+    juegos = conn.execute(query, {'trabajador': trabajador, 'juegos_por_lote': juegosPorLote, 'max_intentos': maxIntentos})
+    return sorted(juego[0] for juego in juegos)
+
+# Solo se marcan los juegos que siguen tomados por trabajador, si su toma vencio otro trabajador ya los tomo
+def marcarJuegos(conn, trabajador, terminados, errores):
+    query_terminados = text("""UPDATE trabajo_juego
+                               SET estado = 'terminado', error = NULL, actualizado = NOW()
+                               WHERE juego_id = ANY(:juegos) AND estado = 'en_proceso' AND trabajador = :trabajador""")
+    query_fallidos = text("""UPDATE trabajo_juego
+                             SET estado = 'fallido', error = :error, actualizado = NOW()
+                             WHERE juego_id = :juego_id AND estado = 'en_proceso' AND trabajador = :trabajador""")
+    if len(terminados) > 0:
+        conn.execute(query_terminados, {'trabajador': trabajador, 'juegos': terminados})
+    if len(errores) > 0:
+        conn.execute(query_fallidos, [{'trabajador': trabajador, 'juego_id': juego_id, 'error': error} for juego_id, error in errores.items()])
+
+# Obtiene, transforma y escribe un lote de juegos, regresa el error de cada juego que no se pudo ingerir
+def procesarLote(clavesJuegos, trabajadores):
+    juegos, tablas, umpires, errores, metricasLote = obtenerDatos.transformarGrupoProceso(clavesJuegos, trabajadores)
+    metricas.registro.combinar(metricasLote)
+    errores = dict(errores)
+    juegos = obtenerDatos.deserializarJuegos(juegos, tablas)
+    for juego_id in clavesJuegos:
+        if juego_id not in errores and juego_id not in [juego['juego_id'] for juego in juegos]:
+            errores[juego_id] = 'El juego esta pospuesto o cancelado'
+    if len(juegos) == 0:
+        return errores
+
+    obtenerDatos.registrarUmpires(umpires)
+    lote = obtenerDatos.LoteJuegos(maxJuegos=len(juegos), modoEscritura='upsert')
+    for juego in juegos:
+        lote.agregar(juego)
+    lote.vaciar()
+    errores.update(lote.errores)
+    obtenerDatos.completarJugadoresSinNombre()
+    return errores
+
+def getNombreTrabajador():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+# Procesa lotes de la cola hasta que ya no hay juegos disponibles (o espera nuevos juegos con esperar)
+def trabajar(trabajadores=1, juegosPorLote=20, maxIntentos=MAX_INTENTOS, esperar=False, duracionToma=DURACION_TOMA):
+    crearTablaTrabajos()
+    obtenerDatos.actualizarEsquema()
+    obtenerDatos.validarTablasIndependientes()
+    trabajador = getNombreTrabajador()
+    juegosProcesados = 0
+    while True:
+        with obtenerDatos.contexto.engine.begin() as conn:
+            liberarTomasVencidas(conn, duracionToma)
+            clavesJuegos = tomarJuegos(conn, trabajador, juegosPorLote, maxIntentos)
+        if len(clavesJuegos) > 0:
+            try:
+                errores = procesarLote(clavesJuegos, trabajadores)
+            except Exception as err:
+                errores = {juego_id: str(err) for juego_id in clavesJuegos}
+            for juego_id, error in errores.items():
+                print(f'----\nJuego {juego_id}: {error}')
+            terminados = [juego_id for juego_id in clavesJuegos if juego_id not in errores]
+            with obtenerDatos.contexto.engine.begin() as conn:
+                marcarJuegos(conn, trabajador, terminados, errores)
+            metricas.contar('juegos_cola', len(terminados), 'terminado')
+            metricas.contar('juegos_cola', len(errores), 'fallido')
+            juegosProcesados += len(clavesJuegos)
+            print(f'{trabajador}: {len(terminados)} juegos terminados, {len(errores)} fallidos')
+
+        if len(clavesJuegos) == 0:
+            if not esperar:
+                break
+            sleep(ESPERA_COLA_VACIA)
+    print(f'{trabajador}: cola vacia, {juegosProcesados} juegos procesados')
+
+def mostrarEstado():
+    query_estados = text("""SELECT estado, COUNT(*) FROM trabajo_juego GROUP BY estado ORDER BY estado""")
+    query_en_proceso = text("""SELECT trabajador, COUNT(*), MIN(tomado) FROM trabajo_juego
+                               WHERE estado = 'en_proceso' GROUP BY trabajador ORDER BY trabajador""")
+    query_errores = text("""SELECT juego_id, intentos, trabajador, actualizado, error FROM trabajo_juego
+                            WHERE estado = 'fallido' ORDER BY actualizado DESC LIMIT 20""")
+    with obtenerDatos.contexto.engine.connect() as conn:
+        for estado, juegos in conn.execute(query_estados):
+            print(f'{estado}: {juegos}')
+        for trabajador, juegos, tomado in conn.execute(query_en_proceso):
+            print(f'en_proceso por {trabajador}: {juegos} juegos tomados desde {tomado}')
+        for juego_id, intentos, trabajador, actualizado, error in conn.execute(query_errores):
+            print(f'----\nJuego {juego_id} ({intentos} intentos, {trabajador}, {actualizado}): {error}')
+
+# Los juegos que se quedaron como fallidos despues de maxIntentos se regresan a pendientes
+def reintentarFallidos():
+    query = text("""UPDATE trabajo_juego SET estado = 'pendiente', intentos = 0, actualizado = NOW()
+                    WHERE estado = 'fallido'""")
+    with obtenerDatos.contexto.engine.begin() as conn:
+        print(f'Juegos fallidos regresados a la cola: {conn.execute(query).rowcount}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingesta distribuida con una cola de juegos en la base de datos')
+    parser.add_argument('--encolar', action='store_true', help='Encolar los juegos finalizados que faltan de cada temporada')
+    parser.add_argument('--replay', action='store_true', help='Con --encolar, encolar los juegos del archivo local y procesarlos sin usar la API')
+    parser.add_argument('--trabajador', action='store_true', help='Procesar juegos de la cola')
+    parser.add_argument('--estado', action='store_true', help='Mostrar los juegos por estado y los ultimos errores')
+    parser.add_argument('--reintentar', action='store_true', help='Regresar a la cola los juegos fallidos')
+    parser.add_argument('--trabajadores', type=int, default=1, help='Numero de juegos que se descargan en paralelo en cada trabajador')
+    parser.add_argument('--juegos-por-lote', type=int, default=20, help='Juegos que toma cada trabajador a la vez')
+    parser.add_argument('--max-intentos', type=int, default=MAX_INTENTOS, help='Intentos de cada juego antes de dejarlo como fallido')
+    parser.add_argument('--duracion-toma', type=int, default=DURACION_TOMA, help='Minutos que un trabajador tiene para procesar un lote antes de que otro trabajador lo pueda tomar')
+    parser.add_argument('--esperar', action='store_true', help='Con --trabajador, esperar juegos nuevos cuando la cola este vacia')
+    parser.add_argument('--metricas', default=metricas.directorioMetricas, help='Directorio donde se escriben el resumen JSON y las metricas de Prometheus de la corrida, cada trabajador de una misma maquina debe usar el suyo')
+    args = parser.parse_args()
+
+    if args.estado:
+        mostrarEstado()
+        raise SystemExit(0)
+
+    if args.reintentar:
+        reintentarFallidos()
+
+    metricas.registro.reiniciar()
+    exitosa = False
+    try:
+        if args.encolar:
+            if args.replay:
+                encolarArchivo()
+            else:
+                encolarTemporadas(obtenerDatos.temporadas)
+        if args.trabajador:
+            obtenerDatos.modoReplay = args.replay
+            trabajar(args.trabajadores, args.juegos_por_lote, args.max_intentos, args.esperar, args.duracion_toma)
+        exitosa = True
+    finally:
+        print(f'Metricas de la corrida: {metricas.escribirMetricas(args.metricas, exitosa)}')
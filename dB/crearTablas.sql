@@ -229,16 +229,17 @@ CREATE TABLE IF NOT EXISTS turno
     es_corredor_emergente BOOLEAN NOT NULL ,
 
     juego_id      INTEGER NOT NULL ,
+    temporada     TEXT NOT NULL ,
     bateador_id   INTEGER NOT NULL ,
     pitcher_id   INTEGER NOT NULL ,
     tipo_turno_id TEXT NOT NULL,
 
-    PRIMARY KEY (turno_id),
+    PRIMARY KEY (turno_id, temporada),
     CONSTRAINT fk_turno_juego_id FOREIGN KEY (juego_id) REFERENCES juego(juego_id) ON DELETE CASCADE,
     CONSTRAINT fk_turno_bateador_id FOREIGN KEY (bateador_id) REFERENCES jugador(jugador_id),
     CONSTRAINT fk_turno_pitcher_id FOREIGN KEY (pitcher_id) REFERENCES jugador(jugador_id),
     CONSTRAINT fk_turno_tipo_turno_id FOREIGN KEY (tipo_turno_id) REFERENCES tipo_turno(tipo_turno_id)
-);
+) PARTITION BY LIST (temporada);
 
 DROP INDEX IF EXISTS idx_turno_juego_id;
 DROP INDEX IF EXISTS idx_turno_bateador_id;
@@ -249,6 +250,13 @@ CREATE INDEX idx_turno_bateador_id ON turno (bateador_id);
 CREATE INDEX idx_turno_pitcher_id ON turno (pitcher_id);
 CREATE INDEX idx_turno_tipo_turno_id ON turno (tipo_turno_id);
 
+-- turno_id = juego_id * 1000 + numero del turno en el juego (ver TURNOS_POR_JUEGO en obtenerDatos.py),
+-- volver a procesar un juego genera los mismos ids y se puede actualizar con ON CONFLICT
+
+-- turno y lanzamiento estan particionadas por temporada (turno_2024, lanzamiento_2024, ...), por eso la
+-- temporada es parte de sus llaves. Las particiones se crean al escribir el primer juego de cada temporada
+-- (ver registrarParticiones en obtenerDatos.py)
+
 DROP TABLE IF EXISTS lanzamiento CASCADE;
 CREATE TABLE IF NOT EXISTS lanzamiento
 (
@@ -265,11 +273,152 @@ CREATE TABLE IF NOT EXISTS lanzamiento
     y REAL,
 
     tipo_lanzamiento_id TEXT NOT NULL ,
+    temporada     TEXT NOT NULL ,
     
-    PRIMARY KEY (turno_id, numero_lanzamiento),
-    CONSTRAINT fk_jugada_turno_id FOREIGN KEY (turno_id) REFERENCES turno(turno_id) ON DELETE CASCADE,
+    PRIMARY KEY (turno_id, numero_lanzamiento, temporada),
+    CONSTRAINT fk_jugada_turno_id FOREIGN KEY (turno_id, temporada) REFERENCES turno(turno_id, temporada) ON DELETE CASCADE,
     CONSTRAINT fk_jugada_tipo_lanzamiento_id FOREIGN KEY (tipo_lanzamiento_id) REFERENCES tipo_lanzamiento(tipo_lanzamiento_id)
-);
+) PARTITION BY LIST (temporada);
 
 DROP INDEX IF EXISTS idx_lanzamiento_tipo_lanzamiento_id;
-CREATE INDEX idx_lanzamiento_tipo_lanzamiento_id ON lanzamiento (tipo_lanzamiento_id);
\ No newline at end of file
+CREATE INDEX idx_lanzamiento_tipo_lanzamiento_id ON lanzamiento (tipo_lanzamiento_id);
+
+-- Validadores (ETag y Last-Modified) de la ultima respuesta de la API de cada catalogo, la siguiente
+-- sincronizacion hace una peticion condicional y si el catalogo no cambio la API responde 304
+DROP TABLE IF EXISTS sincronizacion_catalogo CASCADE;
+CREATE TABLE IF NOT EXISTS sincronizacion_catalogo
+(
+    tabla                TEXT NOT NULL ,
+    etag                 TEXT ,
+    ultima_modificacion  TEXT ,
+    actualizado          TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (tabla)
+);
+
+-- Estado de la ingesta
+-- marca_agua es el ultimo dia del calendario revisado, la siguiente corrida solo pide el calendario desde ahi
+DROP TABLE IF EXISTS estado_temporada CASCADE;
+CREATE TABLE IF NOT EXISTS estado_temporada
+(
+    temporada      TEXT NOT NULL ,
+    marca_agua     DATE NOT NULL ,
+    cerrada        BOOLEAN NOT NULL DEFAULT FALSE ,
+    actualizado    TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (temporada)
+);
+
+-- Juegos que ya estaban en el calendario revisado pero todavia no terminaban
+DROP TABLE IF EXISTS juego_pendiente CASCADE;
+CREATE TABLE IF NOT EXISTS juego_pendiente
+(
+    juego_id      INTEGER NOT NULL ,
+    temporada     TEXT NOT NULL ,
+    fecha         DATE NOT NULL ,
+
+    PRIMARY KEY (juego_id)
+);
+
+-- Cola de juegos por ingerir con varios trabajadores (colaTrabajos.py). Un juego en_proceso lo tomo trabajador
+-- a la hora tomado, si la toma vence sin que el trabajador lo marque otro trabajador lo puede volver a tomar
+DROP TABLE IF EXISTS trabajo_juego CASCADE;
+CREATE TABLE IF NOT EXISTS trabajo_juego
+(
+    juego_id      INTEGER NOT NULL ,
+    temporada     TEXT ,
+    estado        TEXT NOT NULL DEFAULT 'pendiente' ,
+    intentos      SMALLINT NOT NULL DEFAULT 0 ,
+    trabajador    TEXT ,
+    tomado        TIMESTAMP(0) WITH TIME ZONE ,
+    error         TEXT ,
+    creado        TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    actualizado   TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (juego_id),
+    CONSTRAINT trabajo_juego_ck_estado CHECK (estado IN ('pendiente', 'en_proceso', 'terminado', 'fallido'))
+);
+
+DROP INDEX IF EXISTS idx_trabajo_juego_estado;
+CREATE INDEX idx_trabajo_juego_estado ON trabajo_juego (estado, juego_id);
+
+-- Juegos que se estan ingiriendo en vivo (enVivo.py), ya tienen datos parciales en juego, turno y lanzamiento.
+-- timecode es el ultimo feed escrito, cuando el juego termina se escribe completo y se elimina de aqui
+DROP TABLE IF EXISTS juego_en_vivo CASCADE;
+CREATE TABLE IF NOT EXISTS juego_en_vivo
+(
+    juego_id      INTEGER NOT NULL ,
+    timecode      TEXT ,
+    actualizado   TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (juego_id)
+);
+
+-- Revision de la ingesta (una sola fila), la avanza cada transaccion que escribe juegos. El cache de consultas
+-- (cacheConsultas.py) guarda los resultados por revision
+DROP TABLE IF EXISTS revision_ingesta CASCADE;
+CREATE TABLE IF NOT EXISTS revision_ingesta
+(
+    id            BOOLEAN NOT NULL DEFAULT TRUE ,
+    revision      BIGINT NOT NULL ,
+    actualizado   TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (id),
+    CONSTRAINT revision_ingesta_ck_id CHECK (id)
+);
+
+-- Revision de cada juego, un numero nuevo de revision_juego_seq cada vez que se escribe el juego aunque su fila
+-- de juego no cambie. La exportacion al lago (exportacionLago.py) la usa para saber que juegos cambiaron
+DROP TABLE IF EXISTS revision_juego CASCADE;
+DROP SEQUENCE IF EXISTS revision_juego_seq;
+CREATE SEQUENCE IF NOT EXISTS revision_juego_seq;
+CREATE TABLE IF NOT EXISTS revision_juego
+(
+    juego_id      INTEGER NOT NULL ,
+    revision      BIGINT NOT NULL ,
+
+    PRIMARY KEY (juego_id),
+    CONSTRAINT fk_revision_juego_juego_id FOREIGN KEY (juego_id) REFERENCES juego (juego_id) ON DELETE CASCADE
+);
+
+-- Resumenes de cada equipo por temporada, tipo de juego y localia ('local', 'visitante' o 'total'), se actualizan
+-- con cada lote de juegos escrito (ver resumenEquipos.py). resumen_equipo_fecha tiene los acumulados hasta cada
+-- dia en que jugo el equipo. carreras son las carreras anotadas (R) y carreras_en_contra las permitidas (RA)
+DROP TABLE IF EXISTS resumen_equipo CASCADE;
+CREATE TABLE IF NOT EXISTS resumen_equipo
+(
+    temporada          TEXT NOT NULL ,
+    equipo_id          SMALLINT NOT NULL ,
+    tipo_juego_id      TEXT NOT NULL ,
+    localia            TEXT NOT NULL ,
+    juegos             SMALLINT NOT NULL ,
+    victorias          SMALLINT NOT NULL ,
+    derrotas           SMALLINT NOT NULL ,
+    carreras           INTEGER NOT NULL ,
+    carreras_en_contra INTEGER NOT NULL ,
+
+    PRIMARY KEY (temporada, equipo_id, tipo_juego_id, localia),
+    CONSTRAINT fk_resumen_equipo_equipo_id FOREIGN KEY (equipo_id) REFERENCES equipo(equipo_id),
+    CONSTRAINT fk_resumen_equipo_tipo_juego_id FOREIGN KEY (tipo_juego_id) REFERENCES tipo_juego(tipo_juego_id),
+    CONSTRAINT resumen_equipo_ck_localia CHECK (localia IN ('local', 'visitante', 'total'))
+);
+
+DROP TABLE IF EXISTS resumen_equipo_fecha CASCADE;
+CREATE TABLE IF NOT EXISTS resumen_equipo_fecha
+(
+    temporada          TEXT NOT NULL ,
+    equipo_id          SMALLINT NOT NULL ,
+    tipo_juego_id      TEXT NOT NULL ,
+    localia            TEXT NOT NULL ,
+    fecha              DATE NOT NULL ,
+    juegos             SMALLINT NOT NULL ,
+    victorias          SMALLINT NOT NULL ,
+    derrotas           SMALLINT NOT NULL ,
+    carreras           INTEGER NOT NULL ,
+    carreras_en_contra INTEGER NOT NULL ,
+
+    PRIMARY KEY (temporada, equipo_id, tipo_juego_id, localia, fecha),
+    CONSTRAINT fk_resumen_equipo_fecha_equipo_id FOREIGN KEY (equipo_id) REFERENCES equipo(equipo_id),
+    CONSTRAINT fk_resumen_equipo_fecha_tipo_juego_id FOREIGN KEY (tipo_juego_id) REFERENCES tipo_juego(tipo_juego_id),
+    CONSTRAINT resumen_equipo_fecha_ck_localia CHECK (localia IN ('local', 'visitante', 'total'))
+);
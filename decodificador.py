@@ -0,0 +1,225 @@
+# Decodificacion de las respuestas JSON de la API
+# Usa msgspec (en requirements.txt) u orjson si estan instalados, si no usa json de la biblioteca estandar.
+# Se puede forzar uno con la variable de entorno DECODIFICADOR_JSON (msgspec, orjson o json).
+# Con msgspec los feeds de juegos se decodifican solo con los campos que leen las transformaciones,
+# el resto del feed (varios MB) se salta sin crear objetos de Python
+
+import json
+import os
+from typing import Any, TypedDict
+import dotenv
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Campos del feed game/{pk}/feed/live que se usan, cualquier campo que no este aqui se ignora.
+# Si una transformacion empieza a leer un campo nuevo hay que agregarlo aqui
+class Id(TypedDict, total=False):
+    id: Any
+    fullName: Any
+
+class Codigo(TypedDict, total=False):
+    code: Any
+
+class Juego(TypedDict, total=False):
+    pk: Any
+    season: Any
+    type: Any
+
+class InformacionJuego(TypedDict, total=False):
+    firstPitch: Any
+    gameDurationMinutes: Any
+    delayDurationMinutes: Any
+    attendance: Any
+
+class Clima(TypedDict, total=False):
+    temp: Any
+    wind: Any
+
+class Equipos(TypedDict, total=False):
+    home: Id
+    away: Id
+
+class Ubicacion(TypedDict, total=False):
+    city: Any
+
+class Campo(TypedDict, total=False):
+    capacity: Any
+    turfType: Any
+    leftLine: Any
+    center: Any
+    rightLine: Any
+
+class Estadio(TypedDict, total=False):
+    id: Any
+    name: Any
+    location: Ubicacion
+    fieldInfo: Campo
+
+class Status(TypedDict, total=False):
+    codedGameState: Any
+    statusCode: Any
+
+class Jugador(TypedDict, total=False):
+    id: Any
+    fullName: Any
+    birthDate: Any
+    birthCountry: Any
+    batSide: Codigo
+    pitchHand: Codigo
+    strikeZoneTop: Any
+    strikeZoneBottom: Any
+    primaryPosition: Codigo
+
+class DatosJuego(TypedDict, total=False):
+    game: Juego
+    gameInfo: InformacionJuego
+    weather: Clima
+    teams: Equipos
+    venue: Estadio
+    status: Status
+    players: dict[str, Jugador]
+
+class CarrerasEquipo(TypedDict, total=False):
+    runs: Any
+
+class CarrerasEquipos(TypedDict, total=False):
+    home: CarrerasEquipo
+    away: CarrerasEquipo
+
+class Linescore(TypedDict, total=False):
+    currentInning: Any
+    teams: CarrerasEquipos
+
+class Oficial(TypedDict, total=False):
+    officialType: Any
+    official: Id
+
+class EstadisticasJugador(TypedDict, total=False):
+    pitching: dict[str, Any]
+    batting: dict[str, Any]
+
+class JugadorBoxscore(TypedDict, total=False):
+    stats: EstadisticasJugador
+
+class EquipoBoxscore(TypedDict, total=False):
+    players: dict[str, JugadorBoxscore]
+
+class EquiposBoxscore(TypedDict, total=False):
+    home: EquipoBoxscore
+    away: EquipoBoxscore
+
+class Boxscore(TypedDict, total=False):
+    officials: list[Oficial]
+    teams: EquiposBoxscore
+
+class Resultado(TypedDict, total=False):
+    eventType: Any
+    description: Any
+    homeScore: Any
+    awayScore: Any
+
+class Acerca(TypedDict, total=False):
+    inning: Any
+    isTopInning: Any
+
+class Cuenta(TypedDict, total=False):
+    balls: Any
+    strikes: Any
+    outs: Any
+
+class Enfrentamiento(TypedDict, total=False):
+    batter: Id
+    pitcher: Id
+
+class DetallesEvento(TypedDict, total=False):
+    eventType: Any
+    code: Any
+    isInPlay: Any
+    isBall: Any
+    isStrike: Any
+    isOut: Any
+
+class Coordenadas(TypedDict, total=False):
+    x: Any
+    y: Any
+
+class DatosLanzamiento(TypedDict, total=False):
+    coordinates: Coordenadas
+
+class Evento(TypedDict, total=False):
+    details: DetallesEvento
+    count: Cuenta
+    pitchData: DatosLanzamiento
+    player: Id
+    replacedPlayer: Id
+
+class DetallesCorredor(TypedDict, total=False):
+    runner: Id
+
+class Movimiento(TypedDict, total=False):
+    start: Any
+    end: Any
+
+class Corredor(TypedDict, total=False):
+    details: DetallesCorredor
+    movement: Movimiento
+
+class Jugada(TypedDict, total=False):
+    result: Resultado
+    about: Acerca
+    count: Cuenta
+    matchup: Enfrentamiento
+    playEvents: list[Evento]
+    runners: list[Corredor]
+
+class Jugadas(TypedDict, total=False):
+    allPlays: list[Jugada]
+
+class DatosEnVivo(TypedDict, total=False):
+    linescore: Linescore
+    boxscore: Boxscore
+    plays: Jugadas
+
+class FeedJuego(TypedDict, total=False):
+    gamePk: Any
+    gameData: DatosJuego
+    liveData: DatosEnVivo
+    # Respuesta de error de la API
+    error: Any
+    status: Any
+
+def getBackend():
+    dotenv.load_dotenv()
+    backend = os.getenv('DECODIFICADOR_JSON')
+    if backend is not None:
+        return backend
+    if msgspec is not None:
+        return 'msgspec'
+    if orjson is not None:
+        return 'orjson'
+    return 'json'
+
+backend = getBackend()
+if backend == 'msgspec':
+    decodificadorGeneral = msgspec.json.Decoder()
+    decodificadorJuego = msgspec.json.Decoder(FeedJuego)
+
+def decodificar(contenido):
+    if backend == 'msgspec':
+        return decodificadorGeneral.decode(contenido)
+    if backend == 'orjson':
+        return orjson.loads(contenido)
+    return json.loads(contenido)
+
+def decodificarJuego(contenido):
+    if backend == 'msgspec':
+        return decodificadorJuego.decode(contenido)
+    return decodificar(contenido)
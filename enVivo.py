@@ -0,0 +1,340 @@
+# Ingesta en vivo de los juegos en curso
+# Cada juego se descarga completo una vez (feed/live) y despues solo se piden los cambios desde el ultimo
+# timecode del feed con feed/live/diffPatch?startTimecode=. Los cambios son operaciones JSON Patch (RFC 6902)
+# que se aplican al feed en memoria. En cada revision el juego se transforma otra vez en memoria y solo se
+# escriben los turnos y lanzamientos nuevos o que cambiaron (un turno tambien cambia cuando sus corredores
+# avanzan en turnos posteriores), asi lo que se descarga y lo que se escribe es proporcional a lo que paso
+# desde la revision anterior.
+# Mientras el juego esta en curso la fila de juego tiene datos parciales (duracion y asistencia en 0) y
+# juego_pitcher y juego_bateador no se escriben. Cuando el juego termina se escribe completo con upsert, se
+# guarda en el archivo local y se quita de juego_en_vivo. Los juegos de juego_en_vivo ya estan en juego y
+# la ingesta normal los salta, si este proceso se detiene antes de que terminen la siguiente corrida los retoma
+#   python enVivo.py                 sigue los juegos en curso hasta que terminan
+#   python enVivo.py --esperar       sigue revisando el calendario del dia por juegos nuevos
+
+import argparse
+import json
+import time
+from datetime import datetime
+import polars as pl
+from sqlalchemy import text
+import archivoJuegos
+import cacheConsultas
+import decodificador
+import metricas
+import obtenerDatos
+import resumenEquipos
+
+INTERVALO_REVISION = 15 # segundos entre revisiones de cada juego
+ESPERA_CALENDARIO = 300 # segundos entre revisiones del calendario del dia
+MAX_ERRORES = 5 # errores seguidos de un juego antes de dejar de seguirlo en esta corrida
+
+# codedGameState de un juego que ya empezo y no ha terminado (en curso, revision de jugada y juego terminado
+# que todavia no es final)
+ESTADOS_EN_CURSO = ['I', 'M', 'N', 'O']
+
+def getJuegosEnVivoRegistrados():
+    query = text("""SELECT juego_id FROM juego_en_vivo ORDER BY juego_id""")
+    with obtenerDatos.contexto.engine.connect() as conn:
+        juegos = conn.execute(query)
+        juegos = [juego[0] for juego in juegos]
+    return juegos
+
+# Juegos del calendario de hoy que estan en curso entre equipos registrados
+def getJuegosEnCurso():
+    diaActual = datetime.now().strftime('%Y-%m-%d')
+    juegosDia = obtenerDatos.getApi(obtenerDatos.urlBaseV1 + f'schedule?sportId=23&leageId=125&date={diaActual}')
+    juegosEnCurso = []
+    for dia in juegosDia.get('dates', []):
+        for juego in dia['games']:
+            local_id = juego['teams']['home']['team']['id']
+            visitante_id = juego['teams']['away']['team']['id']
+            if (local_id not in obtenerDatos.contexto.equiposRegistrados) or (visitante_id not in obtenerDatos.contexto.equiposRegistrados):
+                continue
+            if juego['status']['codedGameState'] in ESTADOS_EN_CURSO:
+                juegosEnCurso.append(juego['gamePk'])
+    return juegosEnCurso
+
+# Un JSON Pointer (RFC 6901) separado en sus llaves, '' es el documento completo
+def getLlavesApuntador(apuntador):
+    if apuntador == '':
+        return []
+    return [llave.replace('~1', '/').replace('~0', '~') for llave in apuntador.split('/')[1:]]
+
+# En las listas '-' es la posicion despues del ultimo elemento y los indices no tienen signo ni ceros a la izquierda
+def getLlaveContenedor(contenedor, llave):
+    if isinstance(contenedor, list):
+        if llave == '-':
+            return len(contenedor)
+        if not llave.isdecimal() or (llave.startswith('0') and llave != '0'):
+            raise ValueError(f'Indice invalido: {llave}')
+        return int(llave)
+    return llave
+
+# Regresa el contenedor del valor al que apunta el apuntador y su llave (indice en listas)
+def getPadre(documento, apuntador):
+    llaves = getLlavesApuntador(apuntador)
+    contenedor = documento
+    for llave in llaves[:-1]:
+        contenedor = contenedor[getLlaveContenedor(contenedor, llave)]
+    return contenedor, getLlaveContenedor(contenedor, llaves[-1])
+
+def getValor(documento, apuntador):
+    valor = documento
+    for llave in getLlavesApuntador(apuntador):
+        valor = valor[getLlaveContenedor(valor, llave)]
+    return valor
+
+def agregarValor(documento, apuntador, valor):
+    if apuntador == '':
+        return valor
+    contenedor, llave = getPadre(documento, apuntador)
+    if isinstance(contenedor, list):
+        # insert no falla con indices mayores al tamano de la lista
+        if llave > len(contenedor):
+            raise IndexError(f'Indice fuera de la lista: {apuntador}')
+        contenedor.insert(llave, valor)
+    else:
+        contenedor[llave] = valor
+    return documento
+
+def eliminarValor(documento, apuntador):
+    contenedor, llave = getPadre(documento, apuntador)
+    valor = contenedor[llave]
+    del contenedor[llave]
+    return valor
+
+# Aplica las operaciones de un JSON Patch al documento, regresa el documento (cambia si se reemplaza la raiz).
+# Una operacion que no se puede aplicar lanza KeyError, IndexError o ValueError
+def aplicarParche(documento, operaciones):
+    for operacion in operaciones:
+        op = operacion['op']
+        apuntador = operacion['path']
+        if op == 'add':
+            documento = agregarValor(documento, apuntador, operacion['value'])
+        elif op == 'remove':
+            eliminarValor(documento, apuntador)
+        elif op == 'replace':
+            if apuntador == '':
+                documento = operacion['value']
+            else:
+                # El valor que se reemplaza tiene que existir, getValor lanza KeyError o IndexError si no existe
+                getValor(documento, apuntador)
+                contenedor, llave = getPadre(documento, apuntador)
+                contenedor[llave] = operacion['value']
+        elif op == 'move':
+            documento = agregarValor(documento, apuntador, eliminarValor(documento, operacion['from']))
+        elif op == 'copy':
+            documento = agregarValor(documento, apuntador, json.loads(json.dumps(getValor(documento, operacion['from']))))
+        elif op == 'test':
+            if getValor(documento, apuntador) != operacion['value']:
+                raise ValueError(f'El valor de {apuntador} no coincide')
+        else:
+            raise ValueError(f'Operacion desconocida: {op}')
+    return documento
+
+# Los datos que el feed todavia no trae mientras el juego esta en curso se llenan con valores
+# provisionales, la fila de juego se reescribe con los valores reales cuando el juego termina
+def completarDatosEnVivo(datosJuegoRaw):
+    gameData = datosJuegoRaw['gameData']
+    gameInfo = {
+        'firstPitch': gameData.get('datetime', {}).get('dateTime'),
+        'gameDurationMinutes': 0,
+        'attendance': 0,
+        **gameData.get('gameInfo', {})
+    }
+    weather = {'temp': 32, 'wind': '', **gameData.get('weather', {})}
+    return {**datosJuegoRaw, 'gameData': {**gameData, 'gameInfo': gameInfo, 'weather': weather}}
+
+# Filas de datos que no estan igual en anteriores y llaves de anteriores que ya no estan en datos
+def getCambiosTabla(datos, anteriores, llave):
+    cambios = datos.filter(~datos.hash_rows().is_in(anteriores.hash_rows()))
+    eliminados = anteriores.select(llave).join(datos.select(llave), on=llave, how='anti')
+    return cambios, eliminados
+
+class JuegoEnVivo:
+    def __init__(self, juego_id):
+        self.juego_id = juego_id
+        self.feed = None
+        # Turnos y lanzamientos que ya estan en la base, None si todavia no se escribe el juego en esta corrida
+        self.turnos = None
+        self.lanzamientos = None
+        self.errores = 0
+
+    def getTimecode(self):
+        return self.feed['metaData']['timeStamp']
+
+    def getEstado(self):
+        return self.feed['gameData']['status']['codedGameState']
+
+    def descargarFeed(self):
+        with metricas.medir('descarga_feed', self.juego_id):
+            contenido = obtenerDatos.getApiRaw(obtenerDatos.urlBaseV1_1 + f'game/{self.juego_id}/feed/live')
+        feed = decodificador.decodificar(contenido)
+        if 'error' in feed:
+            raise ValueError(f'Error al obtener datos del juego {self.juego_id}. Status {feed["status"]}: {feed["error"]}')
+        self.feed = feed
+
+    # Actualiza el feed en memoria, regresa si cambio desde la revision anterior
+    def actualizarFeed(self):
+        if self.feed is None:
+            self.descargarFeed()
+            return True
+        with metricas.medir('descarga_diff', self.juego_id):
+            contenido = obtenerDatos.getApiRaw(obtenerDatos.urlBaseV1_1 + f'game/{self.juego_id}/feed/live/diffPatch?startTimecode={self.getTimecode()}')
+        cambios = decodificador.decodificar(contenido)
+        # Si el timecode es muy viejo la API regresa el feed completo en lugar de los cambios
+        if isinstance(cambios, dict):
+            if 'error' in cambios:
+                raise ValueError(f'Error al obtener los cambios del juego {self.juego_id}. Status {cambios["status"]}: {cambios["error"]}')
+            self.feed = cambios
+            return True
+        if len(cambios) == 0:
+            return False
+        try:
+            with metricas.medir('aplicar_parche', self.juego_id):
+                for cambio in cambios:
+                    self.feed = aplicarParche(self.feed, cambio['diff'])
+        except (KeyError, IndexError, ValueError, TypeError) as err:
+            # El feed en memoria ya no coincide con el de la API, se vuelve a descargar completo
+            print(f'Juego {self.juego_id}: no se pudieron aplicar los cambios ({err!r}), se descarga el feed completo')
+            metricas.contar('reintentos', etiqueta='parche')
+            self.descargarFeed()
+        return True
+
+    # Escribe en una transaccion la fila de juego, los jugadores nuevos y los turnos y lanzamientos que
+    # cambiaron. La primera vez en la corrida se escriben todos con upsert y se eliminan los que sobran
+    def escribirCambios(self):
+        datosJuegoRaw = completarDatosEnVivo(self.feed)
+        obtenerDatos.registrarUmpiresFaltantes([datosJuegoRaw])
+        with metricas.medir('transformacion_en_vivo', self.juego_id):
+            juego = obtenerDatos.transformarJuego(datosJuegoRaw)
+        jugadores = juego['jugador'].filter(~pl.col('jugador_id').is_in(list(obtenerDatos.contexto.jugadoresRegistrados)))
+        if self.turnos is None:
+            turnos, lanzamientos = juego['turno'], juego['lanzamiento']
+        else:
+            turnos, turnosEliminados = getCambiosTabla(juego['turno'], self.turnos, obtenerDatos.llavesTablas['turno'])
+            lanzamientos, lanzamientosEliminados = getCambiosTabla(juego['lanzamiento'], self.lanzamientos, obtenerDatos.llavesTablas['lanzamiento'])
+
+        query_turnos = text("""DELETE FROM turno WHERE temporada = :temporada AND turno_id = ANY(:turnos_id)""")
+        query_lanzamientos = text("""DELETE FROM lanzamiento l
+                                     USING UNNEST(CAST(:turnos_id AS INTEGER[]), CAST(:numeros AS INTEGER[])) AS e (turno_id, numero_lanzamiento)
+                                     WHERE l.temporada = :temporada AND l.turno_id = e.turno_id AND l.numero_lanzamiento = e.numero_lanzamiento""")
+        query_en_vivo = text("""INSERT INTO juego_en_vivo (juego_id, timecode, actualizado)
+                                VALUES (:juego_id, :timecode, NOW())
+                                ON CONFLICT (juego_id) DO UPDATE
+                                SET timecode = EXCLUDED.timecode,
+                                    actualizado = EXCLUDED.actualizado""")
+        with metricas.medir('escritura_en_vivo', self.juego_id), obtenerDatos.contexto.engine.begin() as conn:
+            if juego['estadio'] is not None:
+                obtenerDatos.insertDatosTablaEstadio(juego['estadio'], conn)
+            obtenerDatos.insertDatosTablaJuego([juego['juego']], conn, 'upsert', [self.juego_id])
+            obtenerDatos.insertarDatosTablaJugador(jugadores, conn, 'upsert', [self.juego_id])
+            if self.turnos is None:
+                obtenerDatos.insertarDatosTablaTurno(turnos, conn, 'upsert', [self.juego_id])
+                obtenerDatos.insertarDatosTablaLanzamiento(lanzamientos, conn, 'upsert', [self.juego_id])
+            else:
+                # Con juegos_id vacio el upsert no elimina filas, aqui solo se escriben las que cambiaron
+                if turnosEliminados.height > 0:
+                    conn.execute(query_turnos, {'temporada': juego['juego']['temporada'], 'turnos_id': turnosEliminados['turno_id'].to_list()})
+                if lanzamientosEliminados.height > 0:
+                    conn.execute(query_lanzamientos, {'temporada': juego['juego']['temporada'], 'turnos_id': lanzamientosEliminados['turno_id'].to_list(),
+                                                      'numeros': lanzamientosEliminados['numero_lanzamiento'].to_list()})
+                obtenerDatos.insertarDatosTablaTurno(turnos, conn, 'upsert', [])
+                obtenerDatos.insertarDatosTablaLanzamiento(lanzamientos, conn, 'upsert', [])
+            conn.execute(query_en_vivo, {'juego_id': self.juego_id, 'timecode': self.getTimecode()})
+            cacheConsultas.registrarRevisionJuegos(conn, [self.juego_id])
+            cacheConsultas.avanzarRevision(conn)
+
+        if juego['estadio'] is not None:
+            obtenerDatos.contexto.estadiosRegistrados.add(juego['estadio']['estadio_id'])
+        obtenerDatos.contexto.jugadoresRegistrados.update(jugadores['jugador_id'].to_list())
+        obtenerDatos.contexto.jugadoresSinNombre.update(jugadores.filter(pl.col('nombre').is_null())['jugador_id'].to_list())
+        metricas.contar('filas_escritas', 1, 'juego')
+        metricas.contar('filas_escritas', turnos.height, 'turno')
+        metricas.contar('filas_escritas', lanzamientos.height, 'lanzamiento')
+        self.turnos = juego['turno']
+        self.lanzamientos = juego['lanzamiento']
+        print(f'Juego {self.juego_id} ({self.getTimecode()}): {turnos.height} turnos y {lanzamientos.height} lanzamientos escritos')
+
+    # El juego termino: se escribe completo con upsert (juego, turnos, lanzamientos, juego_pitcher y
+    # juego_bateador), se guarda el feed en el archivo local y se quita de juego_en_vivo
+    def finalizar(self):
+        obtenerDatos.registrarUmpiresFaltantes([self.feed])
+        juego = obtenerDatos.transformarJuego(self.feed)
+        lote = obtenerDatos.LoteJuegos(maxJuegos=1, modoEscritura='upsert')
+        lote.agregar(juego)
+        if len(lote.vaciar()) > 0:
+            raise ValueError(lote.errores[self.juego_id])
+        with metricas.medir('guardado_archivo', self.juego_id):
+            archivoJuegos.guardar(f'juegos/{self.juego_id}', json.dumps(self.feed).encode())
+        # Los resumenes no cuentan los juegos en juego_en_vivo, se actualizan cuando el juego sale de ahi
+        with obtenerDatos.contexto.engine.begin() as conn:
+            conn.execute(text("""DELETE FROM juego_en_vivo WHERE juego_id = :juego_id"""), {'juego_id': self.juego_id})
+            resumenEquipos.actualizarResumenesJuegos(conn, [self.juego_id])
+            cacheConsultas.avanzarRevision(conn)
+        obtenerDatos.completarJugadoresSinNombre()
+        metricas.contar('juegos_escritos')
+        print(f'Juego {self.juego_id} finalizado')
+
+    # Revisa el juego una vez, regresa True si ya no hay que seguirlo
+    def revisar(self):
+        cambio = self.actualizarFeed()
+        estado = self.getEstado()
+        if estado == 'F':
+            self.finalizar()
+            return True
+        if estado not in ESTADOS_EN_CURSO:
+            # Suspendido o pospuesto, se queda en juego_en_vivo y se retoma cuando vuelva a estar en curso
+            print(f'Juego {self.juego_id}: ya no esta en curso (estado {estado})')
+            return True
+        if cambio:
+            self.escribirCambios()
+        return False
+
+# Sigue los juegos en curso (y los que quedaron en juego_en_vivo) hasta que terminan, con esperar
+# se sigue revisando el calendario del dia por juegos nuevos
+def seguirJuegos(intervalo=INTERVALO_REVISION, esperar=False):
+    obtenerDatos.actualizarEsquema()
+    obtenerDatos.validarTablasIndependientes()
+    juegos = {juego_id: JuegoEnVivo(juego_id) for juego_id in getJuegosEnVivoRegistrados()}
+    revisionCalendario = None
+    while True:
+        if revisionCalendario is None or time.time() - revisionCalendario >= ESPERA_CALENDARIO:
+            with metricas.medir('calendario', juegos=0):
+                for juego_id in getJuegosEnCurso():
+                    juegos.setdefault(juego_id, JuegoEnVivo(juego_id))
+            revisionCalendario = time.time()
+
+        for juego_id in list(juegos):
+            juego = juegos[juego_id]
+            try:
+                terminado = juego.revisar()
+                juego.errores = 0
+            except Exception as err:
+                print(f'----\nJuego {juego_id}: {err}')
+                metricas.contar('reintentos', etiqueta='juego')
+                juego.errores += 1
+                terminado = juego.errores >= MAX_ERRORES
+            if terminado:
+                del juegos[juego_id]
+
+        if len(juegos) == 0 and not esperar:
+            break
+        time.sleep(intervalo)
+    print('No hay juegos en curso')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingesta en vivo de los juegos en curso con los cambios de cada feed')
+    parser.add_argument('--intervalo', type=float, default=INTERVALO_REVISION, help='Segundos entre revisiones de cada juego')
+    parser.add_argument('--esperar', action='store_true', help='Seguir revisando el calendario del dia cuando no hay juegos en curso')
+    parser.add_argument('--metricas', default=metricas.directorioMetricas, help='Directorio donde se escriben el resumen JSON y las metricas de Prometheus de la corrida')
+    args = parser.parse_args()
+
+    metricas.registro.reiniciar()
+    exitosa = False
+    try:
+        seguirJuegos(args.intervalo, args.esperar)
+        exitosa = True
+    finally:
+        print(f'Metricas de la corrida: {metricas.escribirMetricas(args.metricas, exitosa)}')
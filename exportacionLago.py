@@ -0,0 +1,235 @@
+# Exportacion de las tablas a un lago local de tablas Delta (archivos Parquet con un registro de transacciones),
+# para que los analisis lean archivos columnares comprimidos sin consultar la base ni necesitar sus credenciales.
+# Cada tabla queda en <lago>/<tabla>; juego, turno y lanzamiento estan particionadas por temporada.
+# Las tablas de los juegos solo se escriben para los juegos nuevos o que cambiaron. exportacion_juego es el
+# registro de los juegos exportados con su revision (revision_juego, ver cacheConsultas.registrarRevisionJuegos),
+# cada escritura de un juego en la base (--refrescar, --reingestar, un juego en vivo que termina) le da una
+# revision nueva aunque solo cambien sus turnos o lanzamientos, sus filas anteriores se eliminan del lago y se
+# vuelven a exportar. Los juegos que ya no estan en la base se eliminan del lago. Las filas se escriben con un
+# merge que solo inserta las que faltan y el registro se escribe al final de cada lote, asi si una exportacion se
+# detiene a medias la siguiente no duplica filas. Los cambios hechos a mano en la base no cambian la revision,
+# despues de esos se usa --completo. Los catalogos, los jugadores y los resumenes son chicos y se reescriben
+# completos en cada exportacion.
+#   python exportacionLago.py                  exporta los juegos nuevos y reescribe los catalogos
+#   python exportacionLago.py --completo       vuelve a escribir el lago desde cero
+#   python exportacionLago.py --compactar      despues de exportar junta los archivos chicos de cada tabla
+# Para leer el lago:
+#   pl.scan_delta('lago/lanzamiento').filter(pl.col('temporada') == '2024')
+
+import argparse
+import os
+import shutil
+import dotenv
+import polars as pl
+from deltalake import DeltaTable
+from sqlalchemy import text
+import metricas
+import obtenerDatos
+
+dotenv.load_dotenv()
+directorioLago = os.getenv('DIRECTORIO_LAGO', 'lago')
+
+# Tablas que se reescriben completas en cada exportacion
+TABLAS_COMPLETAS = ['equipo', 'estadio', 'umpire', 'posicion', 'jugador', 'tipo_juego', 'status_juego', 'tipo_turno',
+                    'tipo_lanzamiento', 'resumen_equipo', 'resumen_equipo_fecha']
+
+# Tablas de los juegos en el orden en que se exportan, juego al final
+TABLAS_JUEGOS = ['turno', 'lanzamiento', 'juego_pitcher', 'juego_bateador', 'juego']
+
+TABLAS_PARTICIONADAS = ['juego', 'turno', 'lanzamiento']
+
+# Registro de los juegos exportados: juego_id, temporada y revision
+TABLA_REGISTRO = 'exportacion_juego'
+schema_registro = {
+    'juego_id': pl.Int32,
+    'temporada': pl.String,
+    'revision': pl.Int64
+}
+
+llavesTablas = {**obtenerDatos.llavesTablas, TABLA_REGISTRO: ['juego_id']}
+
+# Tipo de Polars de cada tipo de columna de la base, para que todos los lotes de una tabla tengan el mismo
+# esquema aunque una columna venga vacia en un lote
+tiposColumnas = {
+    'smallint': pl.Int16,
+    'integer': pl.Int32,
+    'bigint': pl.Int64,
+    'real': pl.Float32,
+    'double precision': pl.Float64,
+    'boolean': pl.Boolean,
+    'text': pl.String,
+    'date': pl.Date,
+    'timestamp with time zone': pl.Datetime('us', 'UTC')
+}
+
+def getRutaTabla(directorio, tabla):
+    return os.path.join(directorio, tabla)
+
+def existeTabla(directorio, tabla):
+    return os.path.isdir(os.path.join(getRutaTabla(directorio, tabla), '_delta_log'))
+
+def getEsquemaTabla(conn, tabla):
+    query = text("""SELECT column_name, data_type FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = :tabla
+                    ORDER BY ordinal_position""")
+    return {columna: tiposColumnas[tipo] for columna, tipo in conn.execute(query, {'tabla': tabla})}
+
+# Filas de una tabla, todas o solo las de los juegos juegos_id
+def leerTabla(conn, tabla, juegos_id=None):
+    esquema = getEsquemaTabla(conn, tabla)
+    columnas = ', '.join(f't.{columna}' for columna in esquema)
+    if juegos_id is None:
+        query = f"""SELECT {columnas} FROM {tabla} t"""
+    elif tabla == 'juego':
+        query = f"""SELECT {columnas} FROM {tabla} t WHERE t.juego_id = ANY(:juegos_id)"""
+    else:
+        # Las tablas del USING de filasJuegosTablas se agregan al FROM
+        using, filasJuegos = obtenerDatos.filasJuegosTablas[tabla]
+        query = f"""SELECT {columnas} FROM {tabla} t {using.replace('USING', ',')} WHERE {filasJuegos}"""
+    datos = pl.read_database(text(query), conn, execute_options={'parameters': {'juegos_id': juegos_id}}, schema_overrides=esquema)
+    return datos.select(list(esquema)).cast(esquema)
+
+# Juegos terminados de la base con su temporada y revision (schema_registro). Los juegos escritos antes de que
+# existiera revision_juego tienen la revision 0
+def leerJuegos(conn):
+    query = """SELECT j.juego_id, j.temporada, COALESCE(r.revision, 0) AS revision FROM juego j
+               LEFT JOIN revision_juego r ON r.juego_id = j.juego_id
+               WHERE NOT EXISTS (SELECT 1 FROM juego_en_vivo v WHERE v.juego_id = j.juego_id)
+               ORDER BY j.juego_id"""
+    return pl.read_database(text(query), conn, schema_overrides=schema_registro).cast(schema_registro)
+
+# Compara los juegos de la base con el registro del lago. Regresa los juegos por exportar (nuevos o con otra
+# revision) y los juegos del lago que hay que eliminar antes (los que cambiaron y los que ya no estan en la base)
+def getJuegosPendientes(directorio, juegos):
+    if not existeTabla(directorio, TABLA_REGISTRO):
+        return juegos, pl.DataFrame(schema=schema_registro)
+    exportados = pl.read_delta(getRutaTabla(directorio, TABLA_REGISTRO)).select(list(schema_registro)).cast(schema_registro)
+    pendientes = juegos.join(exportados, on=['juego_id', 'revision'], how='anti')
+    eliminados = exportados.join(juegos.select('juego_id', 'revision'), on=['juego_id', 'revision'], how='anti')
+    return pendientes, eliminados
+
+# Condicion de las filas de los juegos en una tabla del lago. lanzamiento no tiene juego_id, su turno_id es
+# juego_id * TURNOS_POR_JUEGO + numero del turno. En las tablas particionadas solo se revisan las temporadas
+# de los juegos
+def getCondicionJuegos(tabla, juegos):
+    juegos_id = ', '.join(str(juego_id) for juego_id in sorted(juegos['juego_id']))
+    if tabla == 'lanzamiento':
+        condicion = f'turno_id / {obtenerDatos.TURNOS_POR_JUEGO} IN ({juegos_id})'
+    else:
+        condicion = f'juego_id IN ({juegos_id})'
+    if tabla in TABLAS_PARTICIONADAS:
+        temporadas = ', '.join(f"'{temporada}'" for temporada in sorted(juegos['temporada'].unique()))
+        condicion += f' AND temporada IN ({temporadas})'
+    return condicion
+
+# Elimina las filas de los juegos de todas las tablas del lago, primero del registro para que si se detiene a
+# medias los juegos se vuelvan a exportar
+def eliminarJuegos(directorio, juegos):
+    if juegos.is_empty():
+        return
+    for tabla in [TABLA_REGISTRO] + TABLAS_JUEGOS:
+        if existeTabla(directorio, tabla):
+            DeltaTable(getRutaTabla(directorio, tabla)).delete(getCondicionJuegos(tabla, juegos))
+
+def escribirTablaCompleta(directorio, tabla, datos):
+    datos.write_delta(getRutaTabla(directorio, tabla), mode='overwrite', delta_write_options={'schema_mode': 'overwrite'})
+
+# Agrega las filas de los juegos de un lote. Si la tabla ya existe se hace un merge sobre la llave primaria que
+# solo inserta las filas que faltan, en las tablas particionadas solo se revisan las temporadas del lote
+def agregarFilasJuegos(directorio, tabla, datos):
+    if datos.is_empty():
+        return
+    ruta = getRutaTabla(directorio, tabla)
+    particiones = ['temporada'] if tabla in TABLAS_PARTICIONADAS else None
+    if not existeTabla(directorio, tabla):
+        datos.write_delta(ruta, mode='append', delta_write_options={'partition_by': particiones})
+        return
+    condicion = ' AND '.join(f's.{columna} = t.{columna}' for columna in llavesTablas[tabla])
+    if particiones is not None:
+        temporadas = ', '.join(f"'{temporada}'" for temporada in sorted(datos['temporada'].unique()))
+        condicion += f' AND t.temporada IN ({temporadas})'
+    (datos.write_delta(ruta, mode='merge', delta_merge_options={'predicate': condicion, 'source_alias': 's', 'target_alias': 't'})
+     .when_not_matched_insert_all()
+     .execute())
+
+# Escribe las tablas de un lote de juegos (schema_registro) y al final los registra. Antes se eliminan las filas
+# anteriores de los juegosCambiados (con la temporada con la que se exportaron)
+def escribirLote(directorio, juegos, datosTablas, juegosCambiados):
+    with metricas.medir('exportacion_eliminacion', juegos=juegosCambiados.height):
+        eliminarJuegos(directorio, juegosCambiados)
+    metricas.contar('juegos_reexportados', juegosCambiados.height)
+    for tabla in TABLAS_JUEGOS:
+        with metricas.medir(f'exportacion_{tabla}', juegos=juegos.height):
+            agregarFilasJuegos(directorio, tabla, datosTablas[tabla])
+        metricas.contar('filas_exportadas', datosTablas[tabla].height, tabla)
+    agregarFilasJuegos(directorio, TABLA_REGISTRO, juegos.select(list(schema_registro)))
+    metricas.contar('juegos_exportados', juegos.height)
+
+# Exporta los juegos nuevos o que cambiaron y elimina del lago los que ya no estan en la base. juegos son los
+# juegos de la base (leerJuegos) y leerLote(juegos_id) regresa las filas de esos juegos de cada tabla de TABLAS_JUEGOS
+def exportarJuegos(directorio, juegos, leerLote, juegosPorLote=200):
+    juegosPendientes, juegosEliminados = getJuegosPendientes(directorio, juegos)
+    # Los juegos que cambiaron se eliminan en el lote en el que se vuelven a exportar
+    juegosCambiados = juegosEliminados.join(juegosPendientes, on='juego_id', how='semi')
+    juegosEliminados = juegosEliminados.join(juegosPendientes, on='juego_id', how='anti')
+    print(f'Lago: {juegosPendientes.height} juegos por exportar, {juegosEliminados.height} juegos por eliminar')
+    with metricas.medir('exportacion_eliminacion', juegos=juegosEliminados.height):
+        eliminarJuegos(directorio, juegosEliminados)
+    metricas.contar('juegos_eliminados_lago', juegosEliminados.height)
+    for inicio in range(0, juegosPendientes.height, juegosPorLote):
+        juegosLote = juegosPendientes.slice(inicio, juegosPorLote)
+        datosTablas = leerLote(juegosLote['juego_id'].to_list())
+        escribirLote(directorio, juegosLote, datosTablas, juegosCambiados.join(juegosLote, on='juego_id', how='semi'))
+        print(f'Lago: {inicio + juegosLote.height} de {juegosPendientes.height} juegos exportados')
+
+def exportarLago(directorio=directorioLago, juegosPorLote=200, completo=False, compactar=False):
+    # Un lago exportado antes de que existiera el registro no sabe que revision tiene cada juego
+    if not existeTabla(directorio, TABLA_REGISTRO) and existeTabla(directorio, 'juego'):
+        print(f'Lago: {directorio} no tiene registro de los juegos exportados, se vuelve a exportar completo')
+        completo = True
+    if completo:
+        shutil.rmtree(directorio, ignore_errors=True)
+    # leerJuegos consulta juego_en_vivo, que no existe en las bases creadas antes de la ingesta en vivo
+    obtenerDatos.actualizarEsquema()
+    engine = obtenerDatos.contexto.engine
+
+    for tabla in TABLAS_COMPLETAS:
+        with metricas.medir(f'exportacion_{tabla}', juegos=0), engine.connect() as conn:
+            datos = leerTabla(conn, tabla)
+            escribirTablaCompleta(directorio, tabla, datos)
+        metricas.contar('filas_exportadas', datos.height, tabla)
+
+    # Todas las tablas de un lote se leen con la misma transaccion para que sean consistentes entre si
+    def leerLote(juegos_id):
+        datosTablas = {}
+        with engine.connect().execution_options(isolation_level='REPEATABLE READ') as conn, conn.begin():
+            for tabla in TABLAS_JUEGOS:
+                with metricas.medir(f'lectura_{tabla}', juegos=len(juegos_id)):
+                    datosTablas[tabla] = leerTabla(conn, tabla, juegos_id)
+        return datosTablas
+    with engine.connect() as conn:
+        juegos = leerJuegos(conn)
+    exportarJuegos(directorio, juegos, leerLote, juegosPorLote)
+
+    if compactar:
+        for tabla in TABLAS_COMPLETAS + TABLAS_JUEGOS + [TABLA_REGISTRO]:
+            if existeTabla(directorio, tabla):
+                with metricas.medir(f'compactacion_{tabla}', juegos=0):
+                    DeltaTable(getRutaTabla(directorio, tabla)).optimize.compact()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exportar las tablas de la base a un lago local de tablas Delta')
+    parser.add_argument('--directorio', default=directorioLago, help='Directorio del lago')
+    parser.add_argument('--juegos-por-lote', type=int, default=200, help='Juegos que se exportan juntos en cada escritura')
+    parser.add_argument('--completo', action='store_true', help='Borrar el lago y volver a exportar todos los juegos')
+    parser.add_argument('--compactar', action='store_true', help='Juntar los archivos chicos de cada tabla despues de exportar')
+    parser.add_argument('--metricas', default=metricas.directorioMetricas, help='Directorio donde se escriben el resumen JSON y las metricas de Prometheus de la corrida')
+    args = parser.parse_args()
+
+    metricas.registro.reiniciar()
+    exitosa = False
+    try:
+        exportarLago(args.directorio, args.juegos_por_lote, args.completo, args.compactar)
+        exitosa = True
+    finally:
+        print(f'Metricas de la corrida: {metricas.escribirMetricas(args.metricas, exitosa)}')
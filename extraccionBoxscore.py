@@ -0,0 +1,119 @@
+# Extraccion de las estadisticas del boxscore para juego_pitcher y juego_bateador a partir de una especificacion.
+# Cada tabla indica de que estadisticas del jugador se lee (stats.pitching o stats.batting) y sus columnas en el
+# orden de la tabla como (columna, expresion, tipo). Las expresiones son de Polars sobre los campos originales
+# del boxscore (camelCase) y las columnas del jugador (juego_id, es_local, jugador_id). Para agregar una
+# estadistica basta con agregar su linea a la especificacion.
+# Cada especificacion se compila una vez en un Extractor que lee a todos los jugadores de todos los juegos
+# en una sola tabla de Arrow y calcula todas las columnas con un solo select
+
+import polars as pl
+import pyarrow as pa
+
+# Columnas que vienen de las jugadas (aplanadoJugadas), no del boxscore
+columnas_jugador = ['juego_id', 'es_local', 'jugador_id']
+
+hits = pl.col('hits') - pl.col('doubles') - pl.col('triples') - pl.col('homeRuns')
+
+especificacion_juego_pitcher = {
+    'estadisticas': 'pitching',
+    'columnas': [
+        ('juego_id', pl.col('juego_id'), pl.Int64),
+        ('pitcher_id', pl.col('jugador_id'), pl.Int64),
+        ('es_local', pl.col('es_local'), pl.Boolean),
+        # Los pitchers de cada equipo vienen en el orden en que aparecen, el primero es el abridor
+        ('es_abridor', pl.struct('juego_id', 'es_local').is_first_distinct(), pl.Boolean),
+        ('es_ganador', pl.col('wins') == 1, pl.Boolean),
+        ('es_perdedor', pl.col('losses') == 1, pl.Boolean),
+        ('oportunidad_salvamento', pl.col('saveOpportunities') == 1, pl.Boolean),
+        ('es_salvamento', pl.col('saves') == 1, pl.Boolean),
+        ('at_bats', pl.col('atBats'), pl.Int64),
+        ('strike_outs', pl.col('strikeOuts'), pl.Int64),
+        ('outs', pl.col('outs'), pl.Int64),
+        ('balls', pl.col('balls'), pl.Int64),
+        ('strikes', pl.col('strikes'), pl.Int64),
+        ('singles', hits, pl.Int64),
+        ('doubles', pl.col('doubles'), pl.Int64),
+        ('triples', pl.col('triples'), pl.Int64),
+        ('home_runs', pl.col('homeRuns'), pl.Int64),
+        ('base_on_balls', pl.col('baseOnBalls'), pl.Int64),
+        ('intentional_walks', pl.col('intentionalWalks'), pl.Int64),
+        ('hit_by_pitch', pl.col('hitByPitch'), pl.Int64),
+        ('wild_pitches', pl.col('wildPitches'), pl.Int64),
+        ('balks', pl.col('balks'), pl.Int64),
+        ('runs', pl.col('runs'), pl.Int64),
+        ('earned_runs', pl.col('earnedRuns'), pl.Int64)
+    ]
+}
+
+especificacion_juego_bateador = {
+    'estadisticas': 'batting',
+    'columnas': [
+        ('juego_id', pl.col('juego_id'), pl.Int64),
+        ('bateador_id', pl.col('jugador_id'), pl.Int64),
+        ('es_local', pl.col('es_local'), pl.Boolean),
+        ('at_bats', pl.col('atBats'), pl.Int64),
+        ('air_outs', pl.col('airOuts'), pl.Int64),
+        ('fly_outs', pl.col('flyOuts'), pl.Int64),
+        ('ground_outs', pl.col('groundOuts'), pl.Int64),
+        ('line_outs', pl.col('lineOuts'), pl.Int64),
+        ('pop_outs', pl.col('popOuts'), pl.Int64),
+        ('strike_outs', pl.col('strikeOuts'), pl.Int64),
+        ('ground_into_double_play', pl.col('groundIntoDoublePlay'), pl.Int64),
+        ('ground_into_triple_play', pl.col('groundIntoTriplePlay'), pl.Int64),
+        ('left_on_base', pl.col('leftOnBase'), pl.Int64),
+        ('sac_bunts', pl.col('sacBunts'), pl.Int64),
+        ('sac_flies', pl.col('sacFlies'), pl.Int64),
+        ('singles', hits, pl.Int64),
+        ('doubles', pl.col('doubles'), pl.Int64),
+        ('triples', pl.col('triples'), pl.Int64),
+        ('home_runs', pl.col('homeRuns'), pl.Int64),
+        ('base_on_balls', pl.col('baseOnBalls'), pl.Int64),
+        ('intentional_walks', pl.col('intentionalWalks'), pl.Int64),
+        ('hit_by_pitch', pl.col('hitByPitch'), pl.Int64),
+        ('runs', pl.col('runs'), pl.Int64),
+        ('rbi', pl.col('rbi'), pl.Int64)
+    ]
+}
+
+class Extractor:
+    def __init__(self, especificacion):
+        self.estadisticas = especificacion['estadisticas']
+        self.schema = {columna: tipo for columna, _, tipo in especificacion['columnas']}
+        self.expresiones = [expresion.alias(columna) for columna, expresion, _ in especificacion['columnas']]
+
+        # Campos del boxscore que usan las expresiones, todas las estadisticas son conteos enteros
+        self.campos = []
+        for _, expresion, _ in especificacion['columnas']:
+            for campo in expresion.meta.root_names():
+                if campo not in columnas_jugador and campo not in self.campos:
+                    self.campos.append(campo)
+        self.tipo = pa.struct([(campo, pa.int64()) for campo in self.campos])
+
+    # jugadores: juego_id, es_local, jugador_id de todos los juegos de datosJuegosRaw
+    def extraer(self, datosJuegosRaw, jugadores):
+        equipos = {}
+        for datosJuegoRaw in datosJuegosRaw:
+            juego_id = int(datosJuegoRaw['gameData']['game']['pk'])
+            equiposBoxscore = datosJuegoRaw['liveData']['boxscore']['teams']
+            equipos[(juego_id, True)] = equiposBoxscore['home']['players']
+            equipos[(juego_id, False)] = equiposBoxscore['away']['players']
+
+        estadisticas = [
+            equipos[(juego_id, es_local)][f'ID{jugador_id}']['stats'][self.estadisticas]
+            for juego_id, es_local, jugador_id in jugadores.select(columnas_jugador).iter_rows()
+        ]
+        datos = pl.from_arrow(pa.array(estadisticas, type=self.tipo)).struct.unnest()
+
+        # Igual que al leer el boxscore campo por campo, si a un jugador le falta una estadistica falla el juego
+        for campo in self.campos:
+            if datos[campo].null_count() > 0:
+                raise KeyError(campo)
+
+        return (
+            pl.concat([jugadores.select(columnas_jugador), datos], how='horizontal')
+            .select(self.expresiones)
+            .cast(self.schema)
+        )
+
+extractorJuego_pitcher = Extractor(especificacion_juego_pitcher)
+extractorJuego_bateador = Extractor(especificacion_juego_bateador)
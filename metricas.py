@@ -0,0 +1,197 @@
+# Metricas de la ingesta: tiempo de cada etapa (en total y por juego) y contadores como bytes descargados,
+# filas escritas por tabla y reintentos. Al final de cada corrida se escribe un resumen en JSON y un archivo
+# de texto con formato de Prometheus (para el textfile collector de node_exporter).
+# Con varios procesos cada proceso tiene sus propias metricas y el proceso principal las combina, por eso
+# la suma de los tiempos de las etapas puede ser mayor que la duracion de la corrida
+
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import dotenv
+
+dotenv.load_dotenv()
+directorioMetricas = os.getenv('DIRECTORIO_METRICAS', 'metricas')
+
+# Nombre de la etiqueta de Prometheus de los contadores con etiquetas
+etiquetasContadores = {
+    'filas_escritas': 'tabla',
+    'reintentos': 'tipo',
+    'juegos_cola': 'estado',
+    'filas_exportadas': 'tabla'
+}
+
+class Metricas:
+    def __init__(self):
+        self.candado = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.inicio = time.time()
+        self.etapas = {} # etapa -> llamadas, juegos, segundos y maximo
+        # nombre -> valor, o etiqueta -> valor si el contador tiene etiquetas. Los reintentos siempre se
+        # reportan aunque sean 0 para poder alertar cuando aumentan
+        self.contadores = {'reintentos': {'api': 0, 'juego': 0}}
+        self.juegos = {} # juego_id -> etapa -> segundos
+
+    @contextmanager
+    def medir(self, etapa, juego_id=None, juegos=1):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrarTiempo(etapa, time.perf_counter() - inicio, juego_id, juegos)
+
+    def registrarTiempo(self, etapa, segundos, juego_id=None, juegos=1):
+        with self.candado:
+            datos = self.etapas.setdefault(etapa, {'llamadas': 0, 'juegos': 0, 'segundos': 0.0, 'maximo': 0.0})
+            datos['llamadas'] += 1
+            datos['juegos'] += juegos
+            datos['segundos'] += segundos
+            datos['maximo'] = max(datos['maximo'], segundos)
+            if juego_id is not None:
+                tiemposJuego = self.juegos.setdefault(str(juego_id), {})
+                tiemposJuego[etapa] = tiemposJuego.get(etapa, 0.0) + segundos
+
+    def contar(self, nombre, valor=1, etiqueta=None):
+        with self.candado:
+            if etiqueta is None:
+                self.contadores[nombre] = self.contadores.get(nombre, 0) + valor
+            else:
+                contador = self.contadores.setdefault(nombre, {})
+                contador[etiqueta] = contador.get(etiqueta, 0) + valor
+
+    # Regresa las metricas acumuladas y las reinicia, para mandarlas de un proceso del pool al principal
+    def extraer(self):
+        with self.candado:
+            datos = {'etapas': self.etapas, 'contadores': self.contadores, 'juegos': self.juegos}
+            self.etapas = {}
+            self.contadores = {}
+            self.juegos = {}
+        return datos
+
+    def combinar(self, datos):
+        for etapa, datosEtapa in datos['etapas'].items():
+            with self.candado:
+                actual = self.etapas.setdefault(etapa, {'llamadas': 0, 'juegos': 0, 'segundos': 0.0, 'maximo': 0.0})
+                actual['llamadas'] += datosEtapa['llamadas']
+                actual['juegos'] += datosEtapa['juegos']
+                actual['segundos'] += datosEtapa['segundos']
+                actual['maximo'] = max(actual['maximo'], datosEtapa['maximo'])
+        for nombre, valor in datos['contadores'].items():
+            if isinstance(valor, dict):
+                for etiqueta, valorEtiqueta in valor.items():
+                    self.contar(nombre, valorEtiqueta, etiqueta)
+            else:
+                self.contar(nombre, valor)
+        with self.candado:
+            for juego_id, tiempos in datos['juegos'].items():
+                tiemposJuego = self.juegos.setdefault(juego_id, {})
+                for etapa, segundos in tiempos.items():
+                    tiemposJuego[etapa] = tiemposJuego.get(etapa, 0.0) + segundos
+
+    def getResumen(self, exitosa):
+        fin = time.time()
+        return {
+            'inicio': datetime.fromtimestamp(self.inicio).isoformat(timespec='seconds'),
+            'fin': datetime.fromtimestamp(fin).isoformat(timespec='seconds'),
+            'duracion_segundos': round(fin - self.inicio, 3),
+            'exitosa': exitosa,
+            'etapas': {etapa: {**datos, 'segundos': round(datos['segundos'], 6), 'maximo': round(datos['maximo'], 6)}
+                       for etapa, datos in sorted(self.etapas.items())},
+            'contadores': self.contadores,
+            'juegos': {juego_id: {etapa: round(segundos, 6) for etapa, segundos in tiempos.items()}
+                       for juego_id, tiempos in self.juegos.items()}
+        }
+
+# Metricas del proceso actual
+registro = Metricas()
+
+def medir(etapa, juego_id=None, juegos=1):
+    return registro.medir(etapa, juego_id, juegos)
+
+def contar(nombre, valor=1, etiqueta=None):
+    registro.contar(nombre, valor, etiqueta)
+
+def escribirArchivo(ruta, contenido):
+    # Se escribe a un archivo temporal y se renombra para que el textfile collector nunca lea un archivo a medias
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    rutaTemporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(rutaTemporal, 'w') as f:
+        f.write(contenido)
+    os.replace(rutaTemporal, ruta)
+
+def getTextoPrometheus(resumen):
+    lineas = []
+    def agregar(nombre, descripcion, valores):
+        lineas.append(f'# HELP lmb_ingesta_{nombre} {descripcion}')
+        lineas.append(f'# TYPE lmb_ingesta_{nombre} gauge')
+        for etiquetas, valor in valores:
+            lineas.append(f'lmb_ingesta_{nombre}{etiquetas} {valor}')
+
+    etapas = resumen['etapas'].items()
+    agregar('exitosa', 'La ultima corrida termino sin errores', [('', int(resumen['exitosa']))])
+    agregar('duracion_segundos', 'Duracion de la ultima corrida', [('', resumen['duracion_segundos'])])
+    agregar('fin_timestamp_segundos', 'Fin de la ultima corrida', [('', int(datetime.fromisoformat(resumen['fin']).timestamp()))])
+    agregar('etapa_segundos', 'Tiempo acumulado de cada etapa', [(f'{{etapa="{etapa}"}}', datos['segundos']) for etapa, datos in etapas])
+    agregar('etapa_segundos_maximo', 'Llamada mas lenta de cada etapa', [(f'{{etapa="{etapa}"}}', datos['maximo']) for etapa, datos in etapas])
+    agregar('etapa_llamadas', 'Llamadas de cada etapa', [(f'{{etapa="{etapa}"}}', datos['llamadas']) for etapa, datos in etapas])
+    agregar('etapa_juegos', 'Juegos procesados por cada etapa', [(f'{{etapa="{etapa}"}}', datos['juegos']) for etapa, datos in etapas])
+    for nombre, valor in sorted(resumen['contadores'].items()):
+        if isinstance(valor, dict):
+            etiqueta = etiquetasContadores.get(nombre, 'etiqueta')
+            agregar(nombre, nombre.replace('_', ' '), [(f'{{{etiqueta}="{valorEtiqueta}"}}', total) for valorEtiqueta, total in sorted(valor.items())])
+        else:
+            agregar(nombre, nombre.replace('_', ' '), [('', valor)])
+    return '\n'.join(lineas) + '\n'
+
+# Escribe el resumen de la corrida en directorio/resumen_<fecha>.json y las metricas en directorio/lmb_ingesta.prom
+def escribirMetricas(directorio, exitosa):
+    resumen = registro.getResumen(exitosa)
+    fecha = datetime.fromisoformat(resumen['inicio']).strftime('%Y%m%d_%H%M%S')
+    rutaResumen = os.path.join(directorio, f'resumen_{fecha}.json')
+    escribirArchivo(rutaResumen, json.dumps(resumen, indent=2))
+    escribirArchivo(os.path.join(directorio, 'lmb_ingesta.prom'), getTextoPrometheus(resumen))
+    return rutaResumen
+
+# Con --profile la corrida se ejecuta con cProfile (tiempo por funcion, solo del hilo y proceso principal)
+# o con tracemalloc (memoria por linea y pico de memoria). El resultado se guarda junto a las metricas
+@contextmanager
+def perfilar(modo, directorio):
+    if modo is None:
+        yield
+        return
+    fecha = datetime.now().strftime('%Y%m%d_%H%M%S')
+    os.makedirs(directorio, exist_ok=True)
+    if modo == 'cprofile':
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            ruta = os.path.join(directorio, f'perfil_{fecha}.prof')
+            perfil.dump_stats(ruta)
+            pstats.Stats(perfil).sort_stats('cumulative').print_stats(25)
+            print(f'Perfil guardado en {ruta} (se puede abrir con python -m pstats)')
+    elif modo == 'tracemalloc':
+        tracemalloc.start(10)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            contar('memoria_pico_bytes', pico)
+            ruta = os.path.join(directorio, f'memoria_{fecha}.txt')
+            lineas = [f'Pico de memoria: {pico / 1024 / 1024:.1f} MB']
+            lineas += [str(estadistica) for estadistica in snapshot.statistics('lineno')[:50]]
+            escribirArchivo(ruta, '\n'.join(lineas) + '\n')
+            print(f'Pico de memoria: {pico / 1024 / 1024:.1f} MB, detalle en {ruta}')
+    else:
+        raise ValueError(f'Modo de perfil desconocido: {modo}')
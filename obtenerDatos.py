@@ -2,14 +2,31 @@
 # Si ya esxisten juegos actualiza solo los juegos pendientes
 
 import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 import json
 from datetime import datetime
 import polars as pl
 import psycopg2
 from sqlalchemy import create_engine, text
+import archivoJuegos
+import decodificador
+import aplanadoJugadas
+import extraccionBoxscore
+import cargaMasiva
+import resumenEquipos
+import cacheConsultas
+import metricas
 import dotenv
 import os
+import io
+import argparse
+import hashlib
 from time import sleep
+from collections import deque
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 
 # Datos conexion a la base de datos
 def crearEngine(coneccion_local=True):
@@ -30,320 +47,460 @@ def crearEngine(coneccion_local=True):
         connection_url=f'postgresql://{user}:{password}@{host}/{database}?sslmode=require'
 
     return create_engine(connection_url), connection_url
-engine, connection_url = crearEngine(coneccion_local=True)
+NULO_COPY = r'\N' # representacion de NULL en los COPY
+# El turno_id de cada turno es juego_id * TURNOS_POR_JUEGO + numero del turno en el juego, asi volver a
+# procesar un juego genera los mismos ids. Cabe en INTEGER mientras juego_id < 2,147,483
+TURNOS_POR_JUEGO = 1000
 # URLs de la API de MLB
 urlBaseV1 = f'https://statsapi.mlb.com/api/v1/'
 urlBaseV1_1 = 'https://statsapi.mlb.com/api/v1.1/'
 
+# Una sola sesion para todas las llamadas a la API, asi las conexiones se reutilizan (keep-alive)
+# en lugar de abrir una conexion TCP/TLS nueva por cada peticion
+TIEMPO_ESPERA_API = (5, 60) # segundos para conectar y para leer la respuesta
+sesionApi = requests.Session()
+sesionApi.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+sesionApi.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+PERSONAS_POR_CONSULTA = 50 # ids por llamada a people?personIds=
+
+# Temporadas que se ingieren
+#temporadas = [2021] #! Esto solo es para las pruebas
+temporadas = list(range(2021, 2026))
+
+class ErrorServidorApi(Exception):
+    pass
+
+def contarReintentoApi(estado):
+    metricas.contar('reintentos', etiqueta='api')
+
+# Los errores de conexion, timeouts y respuestas 5xx se reintentan con espera exponencial,
+# los errores 4xx se regresan tal cual para que los valide quien hizo la llamada
+reintentarApi = retry(
+    retry=retry_if_exception_type((requests.ConnectionError, requests.Timeout, ErrorServidorApi)),
+    wait=wait_exponential(multiplier=0.5, max=30),
+    stop=stop_after_attempt(6),
+    before_sleep=contarReintentoApi,
+    reraise=True
+)
+
+@reintentarApi
+def getApiRaw(url):
+    respuesta = sesionApi.get(url, timeout=TIEMPO_ESPERA_API)
+    if respuesta.status_code >= 500:
+        raise ErrorServidorApi(f'Error {respuesta.status_code} al consultar {url}')
+    metricas.contar('llamadas_api')
+    metricas.contar('bytes_descargados', len(respuesta.content))
+    return respuesta.content
+
+# Peticion condicional con los validadores de la respuesta anterior, si no cambio la API responde 304
+# sin contenido. Regresa el contenido (None si no cambio) y los validadores nuevos
+@reintentarApi
+def getApiCondicional(url, etag=None, ultimaModificacion=None):
+    encabezados = {}
+    if etag is not None:
+        encabezados['If-None-Match'] = etag
+    if ultimaModificacion is not None:
+        encabezados['If-Modified-Since'] = ultimaModificacion
+    respuesta = sesionApi.get(url, headers=encabezados, timeout=TIEMPO_ESPERA_API)
+    if respuesta.status_code >= 500:
+        raise ErrorServidorApi(f'Error {respuesta.status_code} al consultar {url}')
+    metricas.contar('llamadas_api')
+    if respuesta.status_code == 304:
+        metricas.contar('respuestas_sin_cambios')
+        return None, etag, ultimaModificacion
+    metricas.contar('bytes_descargados', len(respuesta.content))
+    return respuesta.content, respuesta.headers.get('ETag'), respuesta.headers.get('Last-Modified')
+
+def getApi(url):
+    return decodificador.decodificar(getApiRaw(url))
+
+# En modo replay no se hacen llamadas a la API, todo se lee del archivo local (ver archivoJuegos.py)
+modoReplay = False
+# En modo refresco los juegos se vuelven a descargar aunque esten en el archivo local, para tomar feeds corregidos
+modoRefresco = False
+
+# Las respuestas de los catalogos se guardan en el archivo local con esta clave para poder reconstruir sin red
+def getClaveArchivoApi(url):
+    urlRelativa = url.removeprefix(urlBaseV1_1).removeprefix(urlBaseV1)
+    return f'api/{hashlib.sha1(urlRelativa.encode()).hexdigest()}'
+
 def getJugadoresRegistrados():
     query = text("""SELECT jugador_id FROM jugador""")
-    with engine.connect() as conn:
+    with contexto.engine.connect() as conn:
         jugadores = conn.execute(query)
         jugadores = [jugador[0] for jugador in jugadores]
     return set(jugadores)
 
+# Los jugadores que ya se consultaron y la API no regreso con nombre estan marcados en el archivo y no se cargan
+def getJugadoresSinNombre():
+    query = text("""SELECT jugador_id FROM jugador WHERE nombre IS NULL""")
+    with contexto.engine.connect() as conn:
+        jugadores = conn.execute(query)
+        jugadores = [jugador[0] for jugador in jugadores if not archivoJuegos.existe(f'personas_sin_nombre/{jugador[0]}')]
+    return set(jugadores)
+
 def getUmpiresRegistrados():
     query = text("""SELECT umpire_id FROM umpire""")
-    with engine.connect() as conn:
+    with contexto.engine.connect() as conn:
         umpires = conn.execute(query)
         umpires = [umpire[0] for umpire in umpires]
     return set(umpires)
 
 def getEstadiosRegistrados():
     query = text("""SELECT estadio_id FROM estadio""")
-    with engine.connect() as conn:
+    with contexto.engine.connect() as conn:
         estadios = conn.execute(query)
         estadios = [estadio[0] for estadio in estadios]
     return set(estadios)
 
 def getEquiposRegistrados():
     query = text("""SELECT equipo_id FROM equipo""")
-    with engine.connect() as conn:
+    with contexto.engine.connect() as conn:
         equipos = conn.execute(query)
         equipos = [equipo[0] for equipo in equipos]
     return set(equipos)
 
-def getTurno_idActual():
-    query = text("""SELECT MAX(turno_id) 
-                FROM turno""")
-    with engine.connect() as conn:
-        turno_id = conn.execute(query)
-        turno_id = turno_id.fetchone()[0]
-    if turno_id is None:
-        turno_id = 0
-    return turno_id
-
-jugadoresRegistrados = getJugadoresRegistrados() # Para evitar busquedas en la base para validar cada jugador
-umpiresRegistrados = getUmpiresRegistrados() # Para evitar busquedas en la base para validar cada umpire
-estadiosRegistrados = getEstadiosRegistrados() # Para evitar busquedas en la base para validar cada estadio
-equiposRegistrados = getEquiposRegistrados() # Para filtrar solo los juegos de los equipos de la liga
-
-turno_id = getTurno_idActual()
-
-def agregarDatosTablaPosicion():
-    datosPosicionesRaw = requests.get(urlBaseV1 + 'positions').content
-    datosPosicionesRaw = json.loads(datosPosicionesRaw)
-    
-    posiciones = {'posicion_id': [], 'descripcion': []}
-    for posicion in datosPosicionesRaw:
-        try:
-            indice_posicion_id = posiciones['posicion_id'].index(posicion['code'])
-            posiciones['descripcion'][indice_posicion_id] += f'/{posicion["fullName"]}'
-        except ValueError:
-            posiciones['posicion_id'].append(posicion['code'])
-            posiciones['descripcion'].append(posicion['fullName'])
-    
-    schema_df_posiciones = {
-        'posicion_id': pl.String,
-        'descripcion': pl.String,
-    }
-
-    df = pl.DataFrame(posiciones, schema=schema_df_posiciones)
-    df.write_database(
-        table_name='posicion',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def agregarDatosTablaTipo_juego():
-    datosTipo_juegoRaw = requests.get(urlBaseV1 + 'gameTypes').content
-    datosTipo_juegoRaw = json.loads(datosTipo_juegoRaw)
-    
-    tipo_juegos = {'tipo_juego_id': [], 'descripcion': []}
-    for tipo_juego in datosTipo_juegoRaw:
-        try:
-            indice_tipo_juego_id = tipo_juegos['tipo_juego_id'].index(tipo_juego['id'])
-            tipo_juegos['descripcion'][indice_tipo_juego_id] += f'/{tipo_juego["description"]}'
-        except ValueError:
-            tipo_juegos['tipo_juego_id'].append(tipo_juego['id'])
-            tipo_juegos['descripcion'].append(tipo_juego['description'])
-
-    schema_df_tipo_juegos = {
-        'tipo_juego_id': pl.String,
-        'descripcion': pl.String,
-    }
-
-    df = pl.DataFrame(tipo_juegos, schema=schema_df_tipo_juegos)
-    df.write_database(
-        table_name='tipo_juego',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def agregarDatosTablaStatus_juego():
-    datosStatus_juegoRaw = requests.get(urlBaseV1 + 'gameStatus').content
-    datosStatus_juegoRaw = json.loads(datosStatus_juegoRaw)
-    
-    status_juegos = {'status_juego_id': [], 'descripcion': []}
-    for status_juego in datosStatus_juegoRaw:
-        try:
-            indice_status_juego_id = status_juegos['status_juego_id'].index(status_juego['statusCode'])
-            status_juegos['descripcion'][indice_status_juego_id] += f'/{status_juego["detailedState"]}'
-        except ValueError:
-            status_juegos['status_juego_id'].append(status_juego['statusCode'])
-            status_juegos['descripcion'].append(status_juego['detailedState'])
-    
-    schema_df_status_juegos = {
-        'status_juego_id': pl.String,
-        'descripcion': pl.String,
-    }
-
-    df = pl.DataFrame(status_juegos, schema=schema_df_status_juegos)
-    df.write_database(
-        table_name='status_juego',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def agregarDatosTablaTipo_turno():
-    datosTipo_turnoRaw = requests.get(urlBaseV1 + 'eventTypes').content
-    datosTipo_turnoRaw = json.loads(datosTipo_turnoRaw)
-    
-    tipo_turnos = {'tipo_turno_id': [], 'descripcion': []}
-    for tipo_turno in datosTipo_turnoRaw:
-        try:
-            indice_tipo_turno_id = tipo_turnos['tipo_turno_id'].index(tipo_turno['code'])
-            tipo_turnos['descripcion'][indice_tipo_turno_id] += f'/{tipo_turno["description"]}'
-        except ValueError:
-            tipo_turnos['tipo_turno_id'].append(tipo_turno['code'])
-            tipo_turnos['descripcion'].append(tipo_turno['description'])
-    
-    schema_df_tipo_turno = {
-        'tipo_turno_id': pl.String,
-        'descripcion': pl.String,
-    }
-
-    df = pl.DataFrame(tipo_turnos, schema=schema_df_tipo_turno)
-    df.write_database(
-        table_name='tipo_turno',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def agregarDatosTipo_lanzamiento():
-    datosTipo_lanzamientoRaw = requests.get(urlBaseV1 + 'pitchCodes').content
-    datosTipo_lanzamientoRaw = json.loads(datosTipo_lanzamientoRaw)
-    
-    tipo_lanzamientos = {'tipo_lanzamiento_id': [], 'descripcion': []}
-    for tipo_lanzamiento in datosTipo_lanzamientoRaw:
-        try:
-            indice_tipo_lanzamiento_id = tipo_lanzamientos['tipo_lanzamiento_id'].index(tipo_lanzamiento['code'])
-            tipo_lanzamientos['descripcion'][indice_tipo_lanzamiento_id] += f'/{tipo_lanzamiento["description"]}'
-        except ValueError:
-            tipo_lanzamientos['tipo_lanzamiento_id'].append(tipo_lanzamiento['code'])
-            tipo_lanzamientos['descripcion'].append(tipo_lanzamiento['description'])
-    
-    schema_df_tipo_lanzamiento = {
-        'tipo_lanzamiento_id': pl.String,
-        'descripcion': pl.String,
-    }
-
-    df = pl.DataFrame(tipo_lanzamientos, schema=schema_df_tipo_lanzamiento)
-
-    df.write_database(
-        table_name='tipo_lanzamiento',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def agregarDatosEquipo():
-    datosEquipoRaw = requests.get(urlBaseV1 + 'teams?leagueId=125').content
-    datosEquipoRaw = json.loads(datosEquipoRaw)['teams']
-    
-    equipos = {'equipo_id': [], 'nombre': [], 'abreviacion': [], 'zona': []}
-    for equipo in datosEquipoRaw:
-        equipo_id = int(equipo['id'])
-        nombre = str(equipo['name'])
-        abreviacion = str(equipo['abbreviation'])
-        zona = str(equipo['division']['name'][15:])
-
-        equipos['equipo_id'].append(equipo_id)
-        equipos['nombre'].append(nombre)
-        equipos['abreviacion'].append(abreviacion)
-        equipos['zona'].append(zona)
-
-    # Agregar datos de Mariaches de Guadalajara (no aparence en la API)Add commentMore actions
-    equipos['equipo_id'].append(5566)
-    equipos['nombre'].append('Mariachis de Guadalajara')
-    equipos['abreviacion'].append('GDL')
-    equipos['zona'].append('Norte')
-    
-    schema_df_equipo = {
-        'equipo_id': pl.Int64,
-        'nombre': pl.String,
-        'abreviacion': pl.String,
-        'zona': pl.String
-    }
-
-    df = pl.DataFrame(equipos, schema=schema_df_equipo)
-
-    df.write_database(
-        table_name='equipo',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
+# Contexto de la ingesta: la conexion a la base y los registros en memoria se crean hasta que se usan
+# por primera vez, asi importar este modulo no se conecta a la base. Las funciones que solo transforman
+# datos (getDatosTablaJuego, procesarTurnos, ...) se pueden usar sin base asignando los registros que
+# necesitan, por ejemplo contexto.jugadoresRegistrados = set()
+class ContextoIngesta:
+    def __init__(self, coneccion_local=True):
+        self.coneccion_local = coneccion_local
+
+    @cached_property
+    def conexion(self):
+        return crearEngine(self.coneccion_local)
+
+    @property
+    def engine(self):
+        return self.conexion[0]
+
+    @property
+    def connection_url(self):
+        return self.conexion[1]
+
+    @cached_property
+    def jugadoresRegistrados(self): # Para evitar busquedas en la base para validar cada jugador
+        return getJugadoresRegistrados()
+
+    @cached_property
+    def jugadoresSinNombre(self): # Jugadores pendientes de completar con people?personIds=
+        return getJugadoresSinNombre()
+
+    @cached_property
+    def umpiresRegistrados(self): # Para evitar busquedas en la base para validar cada umpire
+        return getUmpiresRegistrados()
+
+    @cached_property
+    def estadiosRegistrados(self): # Para evitar busquedas en la base para validar cada estadio
+        return getEstadiosRegistrados()
+
+    @cached_property
+    def equiposRegistrados(self): # Para filtrar solo los juegos de los equipos de la liga
+        return getEquiposRegistrados()
+
+contexto = ContextoIngesta(coneccion_local=True)
+
+# Catalogos (tablas independientes): tabla -> endpoint de la API, llave, columnas y la funcion que convierte
+# la respuesta a {llave: (columnas...)}
+def getFilasCodigos(campoLlave, campoDescripcion):
+    # Un codigo que aparece varias veces junta sus descripciones con /
+    def getFilas(datosRaw):
+        filas = {}
+        for elemento in datosRaw:
+            llave = str(elemento[campoLlave])
+            if llave in filas:
+                filas[llave] = (f'{filas[llave][0]}/{elemento[campoDescripcion]}',)
+            else:
+                filas[llave] = (str(elemento[campoDescripcion]),)
+        return filas
+    return getFilas
+
+def getFilasEquipo(datosRaw):
+    filas = {}
+    for equipo in datosRaw['teams']:
+        filas[int(equipo['id'])] = (str(equipo['name']), str(equipo['abbreviation']), str(equipo['division']['name'][15:]))
+    # Agregar datos de Mariaches de Guadalajara (no aparence en la API)
+    filas[5566] = ('Mariachis de Guadalajara', 'GDL', 'Norte')
+    return filas
+
+catalogos = {
+    'posicion': ('positions', 'posicion_id', ['descripcion'], getFilasCodigos('code', 'fullName')),
+    'tipo_juego': ('gameTypes', 'tipo_juego_id', ['descripcion'], getFilasCodigos('id', 'description')),
+    'status_juego': ('gameStatus', 'status_juego_id', ['descripcion'], getFilasCodigos('statusCode', 'detailedState')),
+    'tipo_turno': ('eventTypes', 'tipo_turno_id', ['descripcion'], getFilasCodigos('code', 'description')),
+    'tipo_lanzamiento': ('pitchCodes', 'tipo_lanzamiento_id', ['descripcion'], getFilasCodigos('code', 'description')),
+    'equipo': ('teams?leagueId=125', 'equipo_id', ['nombre', 'abreviacion', 'zona'], getFilasEquipo)
+}
+
+# Para bases creadas antes de que se guardaran los validadores de cada catalogo
+def crearTablaSincronizacion():
+    query = text("""CREATE TABLE IF NOT EXISTS sincronizacion_catalogo
+                    (
+                        tabla                TEXT NOT NULL ,
+                        etag                 TEXT ,
+                        ultima_modificacion  TEXT ,
+                        actualizado          TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+                        PRIMARY KEY (tabla)
+                    )""")
+    with contexto.engine.begin() as conn:
+        conn.execute(query)
+
+def getValidadoresCatalogos():
+    query = text("""SELECT tabla, etag, ultima_modificacion FROM sincronizacion_catalogo""")
+    with contexto.engine.connect() as conn:
+        validadores = conn.execute(query)
+        validadores = {validador[0]: (validador[1], validador[2]) for validador in validadores}
+    return validadores
+
+# Regresa el contenido del catalogo y sus validadores nuevos (ETag y Last-Modified), el contenido es None si
+# no cambio desde la ultima sincronizacion (304) o si en modo replay no esta en el archivo local
+def descargarCatalogo(tabla, etag, ultimaModificacion):
+    url = urlBaseV1 + catalogos[tabla][0]
+    claveArchivo = getClaveArchivoApi(url)
+    if modoReplay:
+        return archivoJuegos.leer(claveArchivo), etag, ultimaModificacion
+
+    contenido, etag, ultimaModificacion = getApiCondicional(url, etag, ultimaModificacion)
+    if contenido is not None:
+        datos = decodificador.decodificar(contenido)
+        if isinstance(datos, dict) and 'error' in datos:
+            raise ValueError(f'Error al obtener el catalogo {tabla}. Status {datos.get("status")}: {datos["error"]}')
+        archivoJuegos.guardar(claveArchivo, contenido)
+    return contenido, etag, ultimaModificacion
+
+# Sincroniza los catalogos con la API: se descargan todos en paralelo con peticiones condicionales, cada uno
+# se compara en memoria con las filas de su tabla y solo se insertan o actualizan las filas que cambiaron,
+# todo en una sola transaccion. Las filas que ya no vienen en la API no se eliminan, otras tablas las refieren.
+# Asi los codigos nuevos (tipos de lanzamiento, eventos, ...) se agregan antes de ingerir los juegos que los usan
 def validarTablasIndependientes():
-    query = """SELECT COUNT(*)=0
-               FROM {}"""
+    crearTablaSincronizacion()
+    validadores = getValidadoresCatalogos()
+    with metricas.medir('catalogos', juegos=0):
+        with ThreadPoolExecutor(max_workers=len(catalogos)) as executor:
+            descargas = {tabla: executor.submit(descargarCatalogo, tabla, *validadores.get(tabla, (None, None))) for tabla in catalogos}
+            respuestas = {tabla: descarga.result() for tabla, descarga in descargas.items()}
+
+        query_validadores = text("""INSERT INTO sincronizacion_catalogo (tabla, etag, ultima_modificacion, actualizado)
+                                    VALUES (:tabla, :etag, :ultima_modificacion, NOW())
+                                    ON CONFLICT (tabla) DO UPDATE
+                                    SET etag = EXCLUDED.etag,
+                                        ultima_modificacion = EXCLUDED.ultima_modificacion,
+                                        actualizado = EXCLUDED.actualizado""")
+        hayCambios = False
+        with contexto.engine.begin() as conn:
+            for tabla, (contenido, etag, ultimaModificacion) in respuestas.items():
+                _, llave, columnas, getFilas = catalogos[tabla]
+                if contenido is None:
+                    if modoReplay and conn.execute(text(f"""SELECT COUNT(*) = 0 FROM {tabla}""")).scalar():
+                        raise ValueError(f'El catalogo {tabla} no esta en el archivo local')
+                    continue
+
+                filasActuales = conn.execute(text(f"""SELECT {llave}, {', '.join(columnas)} FROM {tabla}"""))
+                filasActuales = {fila[0]: tuple(fila[1:]) for fila in filasActuales}
+                filas = getFilas(decodificador.decodificar(contenido))
+                cambios = {llaveFila: valores for llaveFila, valores in filas.items() if filasActuales.get(llaveFila) != valores}
+                if len(cambios) > 0:
+                    query = text(f"""INSERT INTO {tabla} ({llave}, {', '.join(columnas)})
+                                     VALUES (:{llave}, {', '.join(f':{columna}' for columna in columnas)})
+                                     ON CONFLICT ({llave}) DO UPDATE
+                                     SET {', '.join(f'{columna} = EXCLUDED.{columna}' for columna in columnas)}""")
+                    conn.execute(query, [{llave: llaveFila, **dict(zip(columnas, valores))} for llaveFila, valores in cambios.items()])
+                    nuevas = len([llaveFila for llaveFila in cambios if llaveFila not in filasActuales])
+                    print(f'Catalogo {tabla}: {nuevas} filas nuevas, {len(cambios) - nuevas} actualizadas')
+                    metricas.contar('filas_escritas', len(cambios), tabla)
+                    hayCambios = True
+                    if tabla == 'equipo':
+                        contexto.__dict__.pop('equiposRegistrados', None)
+                if not modoReplay:
+                    conn.execute(query_validadores, {'tabla': tabla, 'etag': etag, 'ultima_modificacion': ultimaModificacion})
+            # Los resultados del cache que unen nombres de equipos o descripciones de los catalogos ya no son validos
+            if hayCambios:
+                cacheConsultas.avanzarRevision(conn)
     
-    with engine.connect() as conn:
-        # Verificar si la tabla posicion esta vacia
-        len_posicion = conn.execute(text(query.format('posicion')))
-        if len_posicion.fetchone()[0]:
-            agregarDatosTablaPosicion()
-
-        # Verificar si la tabla tipo_juego esta vacia
-        len_tipo_juego = conn.execute(text(query.format('tipo_juego')))
-        if len_tipo_juego.fetchone()[0]:
-            agregarDatosTablaTipo_juego()
-        
-        # Verificar si la tabla status_juego esta vacia
-        len_status_juego = conn.execute(text(query.format('status_juego')))
-        if len_status_juego.fetchone()[0]:
-            agregarDatosTablaStatus_juego()
-        
-        # Verificar si la tabla tipo_turno esta vacia
-        len_tipo_turno = conn.execute(text(query.format('tipo_turno')))
-        if len_tipo_turno.fetchone()[0]:
-            agregarDatosTablaTipo_turno()
-
-        # Verificar si la tabla tipo_lanzamiento esta vacia
-        len_tipo_lanzamiento = conn.execute(text(query.format('tipo_lanzamiento')))
-        if len_tipo_lanzamiento.fetchone()[0]:
-            agregarDatosTipo_lanzamiento()
-
-        # Verificar si la tabla equipo esta vacia
-        len_equipo = conn.execute(text(query.format('equipo')))
-        if len_equipo.fetchone()[0]:
-            agregarDatosEquipo()
-    
-def getUltimoPartidoRegistrado():
-    query = text("""SELECT (MAX(DATE_TRUNC('day',primer_lanzamiento)::date ))
-                FROM juego""")
-    with engine.connect() as conn:
-        ultimoPartidoRegistrad = conn.execute(query)
-        ultimoPartidoRegistrado = ultimoPartidoRegistrad.fetchone()[0]
-    if ultimoPartidoRegistrado is None:
-        ultimoPartidoRegistrado = datetime(2021, 1, 1).date()
-    return ultimoPartidoRegistrado
-
-def getClavesJuegosUltimoDiaRegistrado():
-    query = text("""SELECT juego_id FROM juego
-                WHERE DATE_TRUNC('day', primer_lanzamiento) = (SELECT MAX(DATE_TRUNC('day', primer_lanzamiento)) 
-                FROM juego)""")
-    with engine.connect() as conn:
-        clavesJuegosUltimoDiaRegistrado = conn.execute(query)
-        clavesJuegosUltimoDiaRegistrado = [juego[0] for juego in clavesJuegosUltimoDiaRegistrado]
-    return set(clavesJuegosUltimoDiaRegistrado)
+# Estado de la ingesta por temporada: la marca de agua es el ultimo dia del calendario que ya se reviso
+# y juego_pendiente guarda los juegos de esa ventana que todavia no terminaban. Asi cada corrida solo
+# pide el calendario desde la marca de agua y las temporadas cerradas ya no se consultan
+
+# Para bases creadas antes de que se guardara el estado de cada temporada o de que existiera la ingesta en vivo.
+# juego_en_vivo se crea aqui aunque solo la escribe enVivo.py porque los resumenes, la exportacion y los
+# analisis la consultan para no contar los juegos en curso
+def crearTablasEstado():
+    query_estado = text("""CREATE TABLE IF NOT EXISTS estado_temporada
+                           (
+                               temporada      TEXT NOT NULL ,
+                               marca_agua     DATE NOT NULL ,
+                               cerrada        BOOLEAN NOT NULL DEFAULT FALSE ,
+                               actualizado    TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+                               PRIMARY KEY (temporada)
+                           )""")
+    query_pendiente = text("""CREATE TABLE IF NOT EXISTS juego_pendiente
+                              (
+                                  juego_id      INTEGER NOT NULL ,
+                                  temporada     TEXT NOT NULL ,
+                                  fecha         DATE NOT NULL ,
+
+                                  PRIMARY KEY (juego_id)
+                              )""")
+    query_en_vivo = text("""CREATE TABLE IF NOT EXISTS juego_en_vivo
+                            (
+                                juego_id      INTEGER NOT NULL ,
+                                timecode      TEXT ,
+                                actualizado   TIMESTAMP(0) WITH TIME ZONE NOT NULL DEFAULT NOW(),
 
+                                PRIMARY KEY (juego_id)
+                            )""")
+    with contexto.engine.begin() as conn:
+        conn.execute(query_estado)
+        conn.execute(query_pendiente)
+        conn.execute(query_en_vivo)
+
+# Crea las tablas que no existian en las bases creadas con versiones anteriores de crearTablas.sql, se llama al
+# inicio de cada corrida que escribe juegos
+def actualizarEsquema():
+    crearTablasEstado()
+    with contexto.engine.begin() as conn:
+        resumenEquipos.crearTablasResumen(conn)
+        cacheConsultas.crearTablaRevision(conn)
+    particionarTablas()
+
+def getEstadoTemporada(temporada):
+    query = text("""SELECT marca_agua, cerrada FROM estado_temporada WHERE temporada = :temporada""")
+    with contexto.engine.connect() as conn:
+        estado = conn.execute(query, {'temporada': str(temporada)}).fetchone()
+    if estado is None:
+        return None
+    return {'marca_agua': estado[0], 'cerrada': estado[1]}
+
+def getJuegosPendientes(temporada):
+    query = text("""SELECT juego_id FROM juego_pendiente WHERE temporada = :temporada""")
+    with contexto.engine.connect() as conn:
+        juegos = conn.execute(query, {'temporada': str(temporada)})
+        juegos = [juego[0] for juego in juegos]
+    return set(juegos)
+
+def getJuegosRegistradosDe(clavesJuegos):
+    if len(clavesJuegos) == 0:
+        return set()
+    query = text("""SELECT juego_id FROM juego WHERE juego_id = ANY(:claves)""")
+    with contexto.engine.connect() as conn:
+        juegos = conn.execute(query, {'claves': list(clavesJuegos)})
+        juegos = [juego[0] for juego in juegos]
+    return set(juegos)
+
+def getFinTemporada(temporada):
+    datosTemporada = getApi(urlBaseV1 + f'seasons/{temporada}?sportId=23')
+    if len(datosTemporada.get('seasons', [])) == 0:
+        return None
+    datosTemporada = datosTemporada['seasons'][0]
+    return datosTemporada.get('postSeasonEndDate', datosTemporada.get('seasonEndDate'))
+
+def guardarEstadoTemporada(temporada, estadoTemporada):
+    query_estado = text("""INSERT INTO estado_temporada (temporada, marca_agua, cerrada, actualizado)
+                           VALUES (:temporada, :marca_agua, :cerrada, NOW())
+                           ON CONFLICT (temporada) DO UPDATE
+                           SET marca_agua = EXCLUDED.marca_agua,
+                               cerrada = EXCLUDED.cerrada,
+                               actualizado = EXCLUDED.actualizado""")
+    query_eliminar = text("""DELETE FROM juego_pendiente WHERE temporada = :temporada""")
+    query_pendiente = text("""INSERT INTO juego_pendiente (juego_id, temporada, fecha)
+                              VALUES (:juego_id, :temporada, :fecha)""")
+    temporada = str(temporada)
+    with contexto.engine.begin() as conn:
+        conn.execute(query_estado, {'temporada': temporada, 'marca_agua': estadoTemporada['marca_agua'], 'cerrada': estadoTemporada['cerrada']})
+        conn.execute(query_eliminar, {'temporada': temporada})
+        pendientes = [{'juego_id': juego_id, 'temporada': temporada, 'fecha': fecha} for juego_id, fecha in estadoTemporada['pendientes'].items()]
+        if len(pendientes) > 0:
+            conn.execute(query_pendiente, pendientes)
+
+# Regresa los juegos finalizados que faltan por agregar y el estado nuevo de la temporada,
+# el estado es None si la temporada ya esta cerrada
 def getClavesJuegosTemporada(temporada):
-    juegosTemporada = requests.get(urlBaseV1 + f'schedule?sportId=23&leageId=125&season={temporada}').content
-    juegosTemporada = json.loads(juegosTemporada)
-    juegosTemporada = juegosTemporada['dates']
+    estadoTemporada = getEstadoTemporada(temporada)
+    if estadoTemporada is not None and estadoTemporada['cerrada']:
+        return [], None
 
-    ultimoPartidoRegistrado = getUltimoPartidoRegistrado().strftime('%Y-%m-%d')
     diaActual = datetime.now().strftime('%Y-%m-%d')
-    clavesJuegosUltimoDiaRegistrado = getClavesJuegosUltimoDiaRegistrado()
-        
-    clavesJuegosTemporada = []
+    if estadoTemporada is None:
+        inicio = f'{temporada}-01-01'
+    else:
+        # Se vuelve a revisar el dia de la marca de agua por si se agregaron juegos despues de la ultima corrida
+        inicio = estadoTemporada['marca_agua'].strftime('%Y-%m-%d')
+    with metricas.medir('calendario', juegos=0):
+        juegosTemporada = getApi(urlBaseV1 + f'schedule?sportId=23&leageId=125&season={temporada}&startDate={inicio}&endDate={diaActual}')
+        juegosTemporada = juegosTemporada['dates']
+
+        # Los juegos pendientes pueden ser de antes de la ventana (suspendidos o reprogramados), se consultan por id
+        juegosPendientes = getJuegosPendientes(temporada)
+        if len(juegosPendientes) > 0:
+            clavesPendientes = ','.join(str(juego_id) for juego_id in sorted(juegosPendientes))
+            juegosTemporada = juegosTemporada + getApi(urlBaseV1 + f'schedule?sportId=23&gamePks={clavesPendientes}')['dates']
+
+    juegosCalendario = {}
     for dia in juegosTemporada:
-        if dia['date'] < ultimoPartidoRegistrado:
-            continue
         if dia['date'] > diaActual:
-            break
+            continue
         for juego in dia['games']:
             local_id = juego['teams']['home']['team']['id']
             visitante_id = juego['teams']['away']['team']['id']
             juego_id = juego['gamePk']
             codedGameState = juego['status']['codedGameState']
 
-            if juego_id in clavesJuegosUltimoDiaRegistrado:
+            if (local_id not in contexto.equiposRegistrados) or (visitante_id not in contexto.equiposRegistrados):
                 continue
 
-            if (local_id not in equiposRegistrados) or (visitante_id not in equiposRegistrados):
-                continue
-            
-            if juego_id in clavesJuegosTemporada:
-                continue
-                
-            if codedGameState != 'F':
-                continue
+            # Un juego suspendido aparece en mas de un dia, se toma el ultimo dia y todos sus estados
+            fecha, estados = juegosCalendario.get(juego_id, (dia['date'], set()))
+            juegosCalendario[juego_id] = (max(fecha, dia['date']), estados | {codedGameState})
 
-            clavesJuegosTemporada.append(juego['gamePk'])
-    
-    return clavesJuegosTemporada
+    juegosRegistrados = getJuegosRegistradosDe(juegosCalendario.keys())
+    clavesJuegosTemporada = []
+    pendientes = {}
+    for juego_id, (fecha, estados) in sorted(juegosCalendario.items(), key=lambda juego: (juego[1][0], juego[0])):
+        if juego_id in juegosRegistrados:
+            continue
+        if 'F' in estados:
+            clavesJuegosTemporada.append(juego_id)
+        elif estados <= {'D', 'C'}:
+            continue # pospuesto o cancelado
+        else:
+            pendientes[juego_id] = fecha
+
+    finTemporada = getFinTemporada(temporada)
+    cerrada = finTemporada is not None and diaActual > finTemporada and len(pendientes) == 0
+    return clavesJuegosTemporada, {'marca_agua': diaActual, 'cerrada': cerrada, 'pendientes': pendientes}
 
 def getDatosJuegoRaw(juego_id):
-    datosJuegoRaw = requests.get(urlBaseV1_1 + f'game/{juego_id}/feed/live').content
-    datosJuegoRaw = json.loads(datosJuegoRaw)
+    # Los juegos finalizados ya no cambian, si estan en el archivo local no se vuelven a descargar
+    contenido = None
+    if not modoRefresco:
+        with metricas.medir('lectura_archivo', juego_id):
+            contenido = archivoJuegos.leer(f'juegos/{juego_id}')
+    if contenido is not None:
+        with metricas.medir('decodificacion', juego_id):
+            return decodificador.decodificarJuego(contenido)
+    if modoReplay:
+        raise ValueError(f'El juego {juego_id} no esta en el archivo local')
+
+    with metricas.medir('descarga_feed', juego_id):
+        contenido = getApiRaw(urlBaseV1_1 + f'game/{juego_id}/feed/live')
+    with metricas.medir('decodificacion', juego_id):
+        datosJuegoRaw = decodificador.decodificarJuego(contenido)
 
     if 'error' in datosJuegoRaw:
-        raise ValueError(f'Error al obtener datos del juego {juego_id}. Status {datosJuegoRaw['status']}: {datosJuegoRaw['error']}')
+        raise ValueError(f'Error al obtener datos del juego {juego_id}. Status {datosJuegoRaw["status"]}: {datosJuegoRaw["error"]}')
     
     if datosJuegoRaw['gameData']['status']['codedGameState'] in ['D', 'C']:
         return None
 
+    if datosJuegoRaw['gameData']['status']['codedGameState'] == 'F':
+        with metricas.medir('guardado_archivo', juego_id):
+            archivoJuegos.guardar(f'juegos/{juego_id}', contenido)
+
     return datosJuegoRaw
 
 def getDatosTablaJuego(datosJuegoRaw):
@@ -411,28 +568,134 @@ def getDatosTablaJuego(datosJuegoRaw):
 
     return datosTablaJuego
 
+# Consulta varias personas (umpires o jugadores) en una sola llamada a people?personIds=a,b,c
+# Cada persona se guarda por separado en el archivo local para que el replay no dependa de como se agruparon
+def getPersonas(personas_id):
+    personas = {}
+    personasFaltantes = []
+    for persona_id in sorted(personas_id):
+        contenido = archivoJuegos.leer(f'personas/{persona_id}')
+        if contenido is not None:
+            personas[persona_id] = decodificador.decodificar(contenido)
+        else:
+            personasFaltantes.append(persona_id)
+    if modoReplay:
+        return personas
+
+    for i in range(0, len(personasFaltantes), PERSONAS_POR_CONSULTA):
+        lote = personasFaltantes[i:i + PERSONAS_POR_CONSULTA]
+        datosPersonasRaw = getApi(urlBaseV1 + f'people?personIds={",".join(str(persona_id) for persona_id in lote)}')
+        for persona in datosPersonasRaw.get('people', []):
+            persona_id = int(persona['id'])
+            personas[persona_id] = persona
+            archivoJuegos.guardar(f'personas/{persona_id}', json.dumps(persona).encode())
+    return personas
+
+# Umpires de los juegos con el nombre que trae el feed (puede no traerlo)
+def getUmpiresJuegos(datosJuegosRaw):
+    umpires = {}
+    for datosJuegoRaw in datosJuegosRaw:
+        for umpire in datosJuegoRaw['liveData']['boxscore']['officials']:
+            if umpire['officialType'] not in ['Home Plate', 'First Base', 'Second Base', 'Third Base']:
+                continue
+            umpires[int(umpire['official']['id'])] = umpire['official'].get('fullName')
+    return umpires
+
+def registrarUmpiresFaltantes(datosJuegosRaw):
+    registrarUmpires(getUmpiresJuegos(datosJuegosRaw))
+
+def registrarUmpires(umpiresJuegos):
+    umpiresFaltantes = {umpire_id: nombre_feed for umpire_id, nombre_feed in umpiresJuegos.items() if umpire_id not in contexto.umpiresRegistrados}
+    if len(umpiresFaltantes) == 0:
+        return
+    with metricas.medir('registro_umpires', juegos=0):
+        insertarUmpires(umpiresFaltantes)
+
+def insertarUmpires(umpiresFaltantes):
+    personas = getPersonas(umpiresFaltantes.keys())
+    umpires = []
+    for umpire_id, nombre_feed in umpiresFaltantes.items():
+        if umpire_id in personas:
+            nombre_umpire = str(personas[umpire_id]['fullName'])
+        elif nombre_feed is not None:
+            nombre_umpire = str(nombre_feed)
+        else:
+            raise ValueError(f'No se encontraron datos del umpire {umpire_id}')
+        umpires.append({'umpire_id': umpire_id, 'nombre': nombre_umpire})
+
+    valores = ', '.join(f'(:umpire_id_{i}, :nombre_{i})' for i in range(len(umpires)))
+    query = text(f"""INSERT INTO umpire
+                    (
+                        umpire_id, nombre
+                    )
+                    VALUES {valores}
+                    ON CONFLICT (umpire_id) DO NOTHING""")
+    datos = {}
+    for i, umpire in enumerate(umpires):
+        datos[f'umpire_id_{i}'] = umpire['umpire_id']
+        datos[f'nombre_{i}'] = umpire['nombre']
+    with contexto.engine.connect() as conn:
+        conn.execute(query, datos)
+        cacheConsultas.avanzarRevision(conn)
+        conn.commit()
+    contexto.umpiresRegistrados.update(umpiresFaltantes.keys())
+
+# Completa los jugadores que se registraron sin nombre porque el feed del juego no traia sus datos
+def completarJugadoresSinNombre():
+    if len(contexto.jugadoresSinNombre) == 0:
+        return
+    with metricas.medir('completar_jugadores', juegos=0):
+        actualizarJugadoresSinNombre()
+
+def actualizarJugadoresSinNombre():
+    consultados = set(contexto.jugadoresSinNombre)
+    personas = getPersonas(consultados)
+    jugadores = [getDatosJugador(persona) for persona in personas.values() if 'fullName' in persona]
+    # Los que la API no regresa o regresa sin nombre no se vuelven a consultar en cada lote ni en las siguientes
+    # corridas: se quitan de los pendientes y se marcan en el archivo como consultados
+    sinNombre = consultados.difference(jugador['jugador_id'] for jugador in jugadores)
+    if not modoReplay:
+        for jugador_id in sinNombre:
+            archivoJuegos.guardar(f'personas_sin_nombre/{jugador_id}', b'')
+    contexto.jugadoresSinNombre.difference_update(sinNombre)
+    if len(jugadores) == 0:
+        return
+
+    valores = ', '.join(
+        f"""(:jugador_id_{i}, :nombre_{i}, CAST(:fecha_nacimiento_{i} AS DATE), :pais_nacimiento_{i}, :lado_bateo_{i},
+            :lado_lanzamiento_{i}, CAST(:zona_strike_top_{i} AS REAL), CAST(:zona_strike_bottom_{i} AS REAL), :posicion_id_{i})"""
+        for i in range(len(jugadores))
+    )
+    query = text(f"""UPDATE jugador AS j
+                    SET nombre = v.nombre,
+                        fecha_nacimiento = COALESCE(v.fecha_nacimiento, j.fecha_nacimiento),
+                        pais_nacimiento = COALESCE(v.pais_nacimiento, j.pais_nacimiento),
+                        lado_bateo = COALESCE(v.lado_bateo, j.lado_bateo),
+                        lado_lanzamiento = COALESCE(v.lado_lanzamiento, j.lado_lanzamiento),
+                        zona_strike_top = COALESCE(v.zona_strike_top, j.zona_strike_top),
+                        zona_strike_bottom = COALESCE(v.zona_strike_bottom, j.zona_strike_bottom),
+                        posicion_id = COALESCE(v.posicion_id, j.posicion_id)
+                    FROM (VALUES {valores}) AS v
+                    (
+                        jugador_id, nombre, fecha_nacimiento, pais_nacimiento, lado_bateo,
+                        lado_lanzamiento, zona_strike_top, zona_strike_bottom, posicion_id
+                    )
+                    WHERE j.jugador_id = v.jugador_id""")
+    datos = {}
+    for i, jugador in enumerate(jugadores):
+        for columna, valor in jugador.items():
+            datos[f'{columna}_{i}'] = valor
+    with contexto.engine.connect() as conn:
+        conn.execute(query, datos)
+        cacheConsultas.avanzarRevision(conn)
+        conn.commit()
+    contexto.jugadoresSinNombre.difference_update(jugador['jugador_id'] for jugador in jugadores)
+    print(f'Jugadores completados con datos de la API: {len(jugadores)}')
+
+# Regresa los datos del estadio si todavia no esta registrado, los umpires se registran antes de transformar el juego
 def validarFkTablaJuego(FkTablaJuego, datosJuegoRaw):
-    query_estadio = text("""INSERT INTO estadio
-                            (
-                                estadio_id, nombre, ciudad, capacidad, 
-                                tipo_pasto, jardin_izquierdo, jardin_central, jardin_derecho
-                            )
-                            VALUES
-                            (
-                                :estadio_id, :nombre, :ciudad, :capacidad, 
-                                :tipo_pasto, :jardin_izquierdo, :jardin_central, :jardin_derecho
-                            )""")
-    query_umpire = text("""INSERT INTO umpire
-                            (
-                                umpire_id, nombre
-                            )
-                            VALUES 
-                            (
-                                :umpire_id, :nombre
-                            )""")
-    
-    if FkTablaJuego['estadio_id'] not in estadiosRegistrados:
-        estadiosRegistrados.add(FkTablaJuego['estadio_id'])
+    datos = None
+    if FkTablaJuego['estadio_id'] not in contexto.estadiosRegistrados:
         nombre_estadio = str(datosJuegoRaw['gameData']['venue']['name'])
         ciudad_estadio = str(datosJuegoRaw['gameData']['venue']['location']['city'])
         capacidad_estadio = int(datosJuegoRaw['gameData']['venue']['fieldInfo']['capacity'])
@@ -457,100 +720,103 @@ def validarFkTablaJuego(FkTablaJuego, datosJuegoRaw):
                     'jardin_central': jardin_central,
                     'jardin_derecho': jardin_derecho
                 }
-        with engine.connect() as conn:
-            conn.execute(query_estadio, datos)
-            conn.commit()
+    return datos
+
+def insertDatosTablaEstadio(datosTablaEstadio, conn):
+    query_estadio = text("""INSERT INTO estadio
+                            (
+                                estadio_id, nombre, ciudad, capacidad, 
+                                tipo_pasto, jardin_izquierdo, jardin_central, jardin_derecho
+                            )
+                            VALUES
+                            (
+                                :estadio_id, :nombre, :ciudad, :capacidad, 
+                                :tipo_pasto, :jardin_izquierdo, :jardin_central, :jardin_derecho
+                            )
+                            ON CONFLICT (estadio_id) DO NOTHING""")
+    conn.execute(query_estadio, datosTablaEstadio)
+
+def insertDatosTablaJuego(datosTablaJuego, conn, modoEscritura='copy', juegos_id=None):
+    schema_df_juego = {
+        'juego_id': pl.Int64,
+        'temporada': pl.String,
+        'primer_lanzamiento': pl.String,
+        'duracion': pl.Int64,
+        'retraso': pl.Int64,
+        'numero_entradas': pl.Int64,
+        'temperatura': pl.Int64,
+        'viento': pl.String,
+        'asistencia': pl.Int64,
+        'carreras_local': pl.Int64,
+        'carreras_visitante': pl.Int64,
+        'gano_local': pl.Boolean,
+        'local_id': pl.Int64,
+        'visitante_id': pl.Int64,
+        'tipo_juego_id': pl.String,
+        'estadio_id': pl.Int64,
+        'status_juego_id': pl.String,
+        'umpire_home_id': pl.Int64,
+        'umpire_1b_id': pl.Int64,
+        'umpire_2b_id': pl.Int64,
+        'umpire_3b_id': pl.Int64
+    }
+    escribirDatosTabla(conn, 'juego', pl.DataFrame(datosTablaJuego, schema=schema_df_juego), modoEscritura, juegos_id)
+
+def getDatosJugador(jugador):
+    jugador_id = int(jugador['id'])
+
+    nombre = None
+    if 'fullName' in jugador:
+        nombre = str(jugador['fullName'])
     
-    for umpire_id in [FkTablaJuego['umpire_home_id'], FkTablaJuego['umpire_1b_id'], FkTablaJuego['umpire_2b_id'], FkTablaJuego['umpire_3b_id']]:
-        if umpire_id is None:
-            continue
-        if umpire_id in umpiresRegistrados:
-            continue
-        umpiresRegistrados.add(umpire_id)
-        datosUmpireRaw = requests.get(urlBaseV1 + f'people/{umpire_id}').content
-        datosUmpireRaw = json.loads(datosUmpireRaw)
-        nombre_umpire = str(datosUmpireRaw['people'][0]['fullName'])
-        datos = {
-            'umpire_id': umpire_id,
-            'nombre': nombre_umpire
-        }
-        with engine.connect() as conn:
-            conn.execute(query_umpire, datos)
-            conn.commit()
-
-def insertDatosTablaJuego(datosTablaJuego):
-    query = text("""INSERT INTO juego 
-                (
-                    juego_id, temporada, primer_lanzamiento, duracion, retraso, numero_entradas, temperatura, viento, 
-                    asistencia, carreras_local, carreras_visitante,gano_local, local_id, visitante_id, tipo_juego_id, 
-                    estadio_id, status_juego_id, umpire_home_id, umpire_1b_id, umpire_2b_id, umpire_3b_id
-                ) 
-                VALUES 
-                (
-                    :juego_id, :temporada, :primer_lanzamiento, :duracion, :retraso, :numero_entradas, :temperatura, :viento, 
-                    :asistencia, :carreras_local, :carreras_visitante,:gano_local, :local_id, :visitante_id, :tipo_juego_id, :estadio_id, :status_juego_id, :umpire_home_id, 
-                    :umpire_1b_id, :umpire_2b_id, :umpire_3b_id
-                )""")
+    fecha_nacimiento = None
+    if 'birthDate' in jugador:
+        fecha_nacimiento = str(jugador['birthDate'])
+        fecha_nacimiento = datetime.strptime(fecha_nacimiento, "%Y-%m-%d").date()
     
-    with engine.connect() as conn:
-        conn.execute(query, datosTablaJuego)
-        conn.commit()
-    pass
+    pais_nacimiento = None
+    if 'birthCountry' in jugador:
+        pais_nacimiento = str(jugador['birthCountry'])
+    
+    lado_bateo = None
+    lado_lanzamiento = None
+    if 'batSide' in jugador:
+        lado_bateo = str(jugador['batSide']['code'])
+    if 'pitchHand' in jugador:
+        lado_lanzamiento = str(jugador['pitchHand']['code'])
+    
+    zona_strike_top = None
+    zona_strike_bottom = None
+    if 'strikeZoneTop'  in jugador:
+        zona_strike_top = float(jugador['strikeZoneTop'])
+    if 'strikeZoneBottom'  in jugador:
+        zona_strike_bottom = float(jugador['strikeZoneBottom'])
+    
+    posicion_id = None
+    if 'primaryPosition' in jugador:
+        posicion_id = str(jugador['primaryPosition']['code'])
+
+    return {
+        'jugador_id': jugador_id,
+        'nombre': nombre,
+        'fecha_nacimiento': fecha_nacimiento,
+        'pais_nacimiento': pais_nacimiento,
+        'lado_bateo': lado_bateo,
+        'lado_lanzamiento': lado_lanzamiento,
+        'zona_strike_top': zona_strike_top,
+        'zona_strike_bottom': zona_strike_bottom,
+        'posicion_id': posicion_id
+    }
 
-def getDatosTablaJugador(datosJugadoresRaw, juego_id):
+def getDatosTablaJugador(datosJugadoresRaw):
     jugadores = []
     for jugador in datosJugadoresRaw.values():
         jugador_id = int(jugador['id'])
         
-        if jugador_id in jugadoresRegistrados:
+        if jugador_id in contexto.jugadoresRegistrados:
             continue
         
-        jugadoresRegistrados.add(jugador_id)
-        nombre = None
-        if 'fullName' in jugador:
-            nombre = str(jugador['fullName'])
-        
-        fecha_nacimiento = None
-        if 'birthDate' in jugador:
-            fecha_nacimiento = str(jugador['birthDate'])
-            fecha_nacimiento = datetime.strptime(fecha_nacimiento, "%Y-%m-%d").date()
-        
-        pais_nacimiento = None
-        if 'birthCountry' in jugador:
-            pais_nacimiento = str(jugador['birthCountry'])
-        
-        lado_bateo = None
-        lado_lanzamiento = None
-        if 'batSide' in jugador:
-            lado_bateo = str(jugador['batSide']['code'])
-        if 'pitchHand' in jugador:
-            lado_lanzamiento = str(jugador['pitchHand']['code'])
-        
-        zona_strike_top = None
-        zona_strike_bottom = None
-        if 'strikeZoneTop'  in jugador:
-            zona_strike_top = float(jugador['strikeZoneTop'])
-        if 'strikeZoneBottom'  in jugador:
-            zona_strike_bottom = float(jugador['strikeZoneBottom'])
-        
-        posicion_id = None
-        if 'primaryPosition' in jugador:
-            posicion_id = str(jugador['primaryPosition']['code'])
-        
-        if nombre is None:
-            print(f'jugador: {jugador_id} -> faltan datos del jugador. Juego: {juego_id}')
-
-        jugadores.append({
-            'jugador_id': jugador_id,
-            'nombre': nombre,
-            'fecha_nacimiento': fecha_nacimiento,
-            'pais_nacimiento': pais_nacimiento,
-            'lado_bateo': lado_bateo,
-            'lado_lanzamiento': lado_lanzamiento,
-            'zona_strike_top': zona_strike_top,
-            'zona_strike_bottom': zona_strike_bottom,
-            'posicion_id': posicion_id
-        })
+        jugadores.append(getDatosJugador(jugador))
 
     schema_df_jugadores = {
         'jugador_id': pl.Int64,
@@ -565,579 +831,758 @@ def getDatosTablaJugador(datosJugadoresRaw, juego_id):
     }
     return pl.DataFrame(jugadores, schema=schema_df_jugadores)
         
-def insertarDatosTablaJugador(jugadoresFaltantes):
-    if jugadoresFaltantes.is_empty():
-        return
-    jugadoresFaltantes.write_database(
-        table_name='jugador',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def insertarDatosTablaTurno(datosTablaTurno):
-    if datosTablaTurno.is_empty():
+# Escribe un DataFrame con COPY FROM STDIN dentro de la transaccion de conn, mucho mas rapido que un INSERT por fila
+def copiarDatosTabla(conn, tabla, datos):
+    if datos.is_empty():
         return
-    datosTablaTurno.write_database(
-        table_name='turno',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def insertarDatosTablaLanzamiento(datosTablaLanzamiento):
-    if datosTablaLanzamiento.is_empty():
+    buffer = io.BytesIO()
+    datos.write_csv(buffer, include_header=False, null_value=NULO_COPY)
+    buffer.seek(0)
+    columnas = ', '.join(datos.columns)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {tabla} ({columnas}) FROM STDIN WITH (FORMAT csv, NULL '{NULO_COPY}')", buffer)
+
+# Llave primaria de cada tabla para el upsert
+llavesTablas = {
+    'juego': ['juego_id'],
+    'jugador': ['jugador_id'],
+    'turno': ['turno_id', 'temporada'],
+    'lanzamiento': ['turno_id', 'numero_lanzamiento', 'temporada'],
+    'juego_pitcher': ['juego_id', 'pitcher_id'],
+    'juego_bateador': ['juego_id', 'bateador_id']
+}
+
+# Filas de cada tabla que pertenecen a los juegos :juegos_id (tabla con alias t, mas las tablas del USING)
+filasJuegosTablas = {
+    'turno': ('', 't.juego_id = ANY(:juegos_id)'),
+    'lanzamiento': ('USING turno', 't.turno_id = turno.turno_id AND t.temporada = turno.temporada AND turno.juego_id = ANY(:juegos_id)'),
+    'juego_pitcher': ('', 't.juego_id = ANY(:juegos_id)'),
+    'juego_bateador': ('', 't.juego_id = ANY(:juegos_id)')
+}
+
+# Upsert de los datos de los juegos juegos_id: los datos se copian a una tabla temporal y se mezclan con
+# INSERT ... ON CONFLICT sobre la llave primaria. Las filas que no cambiaron no se reescriben y las filas
+# de estos juegos que ya no vienen en el feed (un feed corregido con menos turnos) se eliminan.
+# Los jugadores no se actualizan, sus datos se completan con people?personIds= (completarJugadoresSinNombre)
+def upsertDatosTabla(conn, tabla, datos, juegos_id):
+    llave = llavesTablas[tabla]
+    conn.execute(text(f"""CREATE TEMP TABLE nuevos_{tabla} (LIKE {tabla}) ON COMMIT DROP"""))
+    copiarDatosTabla(conn, f'nuevos_{tabla}', datos)
+
+    if tabla in filasJuegosTablas:
+        using, filasJuegos = filasJuegosTablas[tabla]
+        mismaLlave = ' AND '.join(f'n.{columna} = t.{columna}' for columna in llave)
+        conn.execute(text(f"""DELETE FROM {tabla} t {using}
+                              WHERE {filasJuegos}
+                                AND NOT EXISTS (SELECT 1 FROM nuevos_{tabla} n WHERE {mismaLlave})"""),
+                     {'juegos_id': juegos_id})
+    if datos.is_empty():
         return
-    datosTablaLanzamiento.write_database(
-        table_name='lanzamiento',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def procesarTurnos(datosJuegoRaw):
-    pitchers_local = []
-    pitchers_visitante = []
-
-    bateadores_local = set()
-    bateadores_visitante = set()
-
-    juego_id = int(datosJuegoRaw['gameData']['game']['pk'])
-
-    datosTablaTurno = {
-        'turno_id': [],
-        'at_bat_descripcion': [],
-        'entrada': [],
-        'es_parte_alta': [],
-        'cuenta_outs': [],
-        'carreras_anotadas': [],
-        'llego_1b': [],
-        'llego_2b': [],
-        'llego_3b': [],
-        'llego_home': [],
-        'es_corredor_emergente': [],
-        'juego_id': [],
-        'bateador_id': [],
-        'pitcher_id': [],
-        'tipo_turno_id': []
-    }
-    datosTablaLanzamiento = {
-        'turno_id': [],
-        'numero_lanzamiento': [],
-        'es_jugada': [],
-        'es_bola': [],
-        'es_strike': [],
-        'es_foul': [],
-        'es_out': [],
-        'cuenta_bolas': [],
-        'cuenta_strikes': [],
-        'x': [],
-        'y': [],
-        'tipo_lanzamiento_id': []
-    }
-    jugadoresEnBase = {}
-    contador_outs = 0
-    contador_carreras_local = 0
-    contador_carreras_visitante = 0
-
-    for jugada in datosJuegoRaw['liveData']['plays']['allPlays']:
-        # Validar que tenga informacion
-        if 'eventType' not in jugada['result']:
-            continue
-        # Procesar turno
-        global turno_id
-        turno_id += 1
-        at_bat_descripcion = str(jugada['result']['description'])
-        entrada = int(jugada['about']['inning'])
-        es_parte_alta = bool(jugada['about']['isTopInning'])
-        cuenta_outs = contador_outs
-        contador_outs = int(jugada['count']['outs'])
-        if cuenta_outs == 3:
-            contador_outs = 0
-            jugadoresEnBase = {}
-        marcador_local = int(jugada['result']['homeScore'])
-        marcador_visitante = int(jugada['result']['awayScore'])
-        if es_parte_alta:
-            carreras_anotadas = marcador_visitante - contador_carreras_visitante
-            contador_carreras_visitante = marcador_visitante
-        else:
-            carreras_anotadas = marcador_local - contador_carreras_local
-            contador_carreras_local = marcador_local
-        
-        bateador_id = int(jugada['matchup']['batter']['id'])
-        pitcher_id = int(jugada['matchup']['pitcher']['id'])
-        tipo_turno_id = str(jugada['result']['eventType'])
-
-        datosTablaTurno['turno_id'].append(turno_id)
-        datosTablaTurno['at_bat_descripcion'].append(at_bat_descripcion)
-        datosTablaTurno['entrada'].append(entrada)
-        datosTablaTurno['es_parte_alta'].append(es_parte_alta)
-        datosTablaTurno['cuenta_outs'].append(cuenta_outs)
-        datosTablaTurno['carreras_anotadas'].append(carreras_anotadas)
-        datosTablaTurno['llego_1b'].append(False)
-        datosTablaTurno['llego_2b'].append(False)
-        datosTablaTurno['llego_3b'].append(False)
-        datosTablaTurno['llego_home'].append(False)
-        datosTablaTurno['es_corredor_emergente'].append(False)
-
-        datosTablaTurno['juego_id'].append(juego_id)
-        datosTablaTurno['bateador_id'].append(bateador_id)
-        datosTablaTurno['pitcher_id'].append(pitcher_id)
-        datosTablaTurno['tipo_turno_id'].append(tipo_turno_id)
-
-        if es_parte_alta and pitcher_id not in pitchers_local:
-            pitchers_local.append(pitcher_id)
-        elif not es_parte_alta and pitcher_id not in pitchers_visitante:
-            pitchers_visitante.append(pitcher_id)
-
-        if es_parte_alta and bateador_id not in bateadores_visitante:
-            bateadores_visitante.add(bateador_id)
-        elif not es_parte_alta and bateador_id not in bateadores_local:
-            bateadores_local.add(bateador_id)
-
-        # Procesar lanzamiento
-        contador_bolas = 0
-        contador_strikes = 0
-        numero_lanzamiento = 0
-        for lanzamiento in jugada['playEvents']:
-            if 'eventType' in lanzamiento['details']:
-                if lanzamiento['details']['eventType'] == 'offensive_substitution':
-                    if es_parte_alta:
-                        bateadores_visitante.add(int(lanzamiento['player']['id']))
-                    else:
-                        bateadores_local.add(int(lanzamiento['player']['id']))
-                    corredor_anterior = int(lanzamiento['replacedPlayer']['id'])
-                    nuevo_corredor = int(lanzamiento['player']['id'])
-                    if corredor_anterior in jugadoresEnBase:
-                        datosTablaTurno['es_corredor_emergente'][jugadoresEnBase[corredor_anterior]] = True
-                        jugadoresEnBase[nuevo_corredor] = jugadoresEnBase[corredor_anterior]
-                elif lanzamiento['details']['eventType'] == 'pitching_substitution':
-                    if es_parte_alta and lanzamiento['player']['id'] not in pitchers_local:
-                        pitchers_local.append(int(lanzamiento['player']['id']))
-                    elif not es_parte_alta and lanzamiento['player']['id'] not in pitchers_visitante:
-                        pitchers_visitante.append(int(lanzamiento['player']['id']))
-                continue
 
-            numero_lanzamiento += 1
-            if 'isInPlay' in lanzamiento['details']:
-                es_jugada = bool(lanzamiento['details']['isInPlay'])
-            else:
-                es_jugada = False
-            if 'isBall' in lanzamiento['details']:
-                es_bola = bool(lanzamiento['details']['isBall'])
-            else:
-                es_bola = False
-            if 'isStrike' in lanzamiento['details']:
-                es_strike = bool(lanzamiento['details']['isStrike'])
-            else:
-                es_strike = False
-            es_out = bool(lanzamiento['details']['isOut'])
-            if contador_strikes == 2 and es_strike and not es_out:
-                es_foul = True
-            else:
-                es_foul = False
-            cuenta_bolas = contador_bolas
-            contador_bolas = int(lanzamiento['count']['balls'])
-            cuenta_strikes = contador_strikes
-            contador_strikes = int(lanzamiento['count']['strikes'])
-            if 'pitchData' in lanzamiento and 'x' in lanzamiento['pitchData']['coordinates'] and 'y' in lanzamiento['pitchData']['coordinates']:
-                x = -0.021 * (lanzamiento['pitchData']['coordinates']['x']) + 2.298
-                y = -0.021 * (lanzamiento['pitchData']['coordinates']['y']) + 5.803
-            else:
-                x = None
-                y = None
-            tipo_lanzamiento_id = str(lanzamiento['details']['code'])
-
-            datosTablaLanzamiento['turno_id'].append(turno_id)
-            datosTablaLanzamiento['numero_lanzamiento'].append(numero_lanzamiento)
-            datosTablaLanzamiento['es_jugada'].append(es_jugada)
-            datosTablaLanzamiento['es_bola'].append(es_bola)
-            datosTablaLanzamiento['es_strike'].append(es_strike)
-            datosTablaLanzamiento['es_foul'].append(es_foul)
-            datosTablaLanzamiento['es_out'].append(es_out)
-            datosTablaLanzamiento['cuenta_bolas'].append(cuenta_bolas)
-            datosTablaLanzamiento['cuenta_strikes'].append(cuenta_strikes)
-            datosTablaLanzamiento['x'].append(x)
-            datosTablaLanzamiento['y'].append(y)
-            datosTablaLanzamiento['tipo_lanzamiento_id'].append(tipo_lanzamiento_id)
-
-        # Procesar corredores
-        for corredor in jugada['runners']:
-            corredor_id = int(corredor['details']['runner']['id'])
-            start = str(corredor['movement']['start'])
-            end = str(corredor['movement']['end'])
-            if start == 'None':
-                jugadoresEnBase[corredor_id] = len(datosTablaTurno['turno_id']) - 1
-            i = jugadoresEnBase[corredor_id]
-            match end:
-                case '1B':
-                    datosTablaTurno['llego_1b'][i] = True
-                case '2B':
-                    datosTablaTurno['llego_1b'][i] = True
-                    datosTablaTurno['llego_2b'][i] = True
-                case '3B':
-                    datosTablaTurno['llego_1b'][i] = True
-                    datosTablaTurno['llego_2b'][i] = True
-                    datosTablaTurno['llego_3b'][i] = True
-                case 'score':
-                    datosTablaTurno['llego_1b'][i] = True
-                    datosTablaTurno['llego_2b'][i] = True
-                    datosTablaTurno['llego_3b'][i] = True
-                    datosTablaTurno['llego_home'][i] = True
-                    del jugadoresEnBase[corredor_id]
-                case _:
-                    del jugadoresEnBase[corredor_id]
-            
-    schema_df_turno = {
-        'turno_id': pl.Int64,
-        'at_bat_descripcion': pl.String,
-        'entrada': pl.Int64,
-        'es_parte_alta': pl.Boolean,
-        'cuenta_outs': pl.Int64,
-        'carreras_anotadas': pl.Int64,
-        'llego_1b': pl.Boolean,
-        'llego_2b': pl.Boolean,
-        'llego_3b': pl.Boolean,
-        'llego_home': pl.Boolean,
-        'es_corredor_emergente': pl.Boolean,
-        'juego_id': pl.Int64,
-        'bateador_id': pl.Int64,
-        'pitcher_id': pl.Int64,
-        'tipo_turno_id': pl.String
-    }
-    insertarDatosTablaTurno(pl.DataFrame(datosTablaTurno, schema=schema_df_turno))
-
-    schema_df_lanzamiento = {
-        'turno_id': pl.Int64,
-        'numero_lanzamiento': pl.Int64,
-        'es_jugada': pl.Boolean,
-        'es_bola': pl.Boolean,
-        'es_strike': pl.Boolean,
-        'es_foul': pl.Boolean,
-        'es_out': pl.Boolean,
-        'cuenta_bolas': pl.Int64,
-        'cuenta_strikes': pl.Int64,
-        'x': pl.Float32,
-        'y': pl.Float32,
-        'tipo_lanzamiento_id': pl.String
-    }
-    insertarDatosTablaLanzamiento(pl.DataFrame(datosTablaLanzamiento, schema=schema_df_lanzamiento))
-    
-    return pitchers_visitante, pitchers_local, bateadores_visitante, bateadores_local
-    
-def getDatosTablaJuego_pitcher(pitchers, datosJuegoRaw, es_local):
-    if es_local:
-        datosPitcherRaw = datosJuegoRaw['liveData']['boxscore']['teams']['home']['players']
+    columnas = ', '.join(datos.columns)
+    actualizar = [columna for columna in datos.columns if columna not in llave]
+    if tabla == 'jugador' or len(actualizar) == 0:
+        conflicto = 'DO NOTHING'
     else:
-        datosPitcherRaw = datosJuegoRaw['liveData']['boxscore']['teams']['away']['players']
-    
-    datosTablaJuego_pitcher = {
-        'juego_id': [],
-        'pitcher_id': [],
-        'es_local': [],
-        'es_abridor': [],
-        'es_ganador': [],
-        'es_perdedor': [],
-        'oportunidad_salvamento': [],
-        'es_salvamento': [],
-        'at_bats': [],
-        'strike_outs': [],
-        'outs': [],
-        'balls': [],
-        'strikes': [],
-        'singles': [],
-        'doubles': [],
-        'triples': [],
-        'home_runs': [],
-        'base_on_balls': [],
-        'intentional_walks': [],
-        'hit_by_pitch': [],
-        'wild_pitches': [],
-        'balks': [],
-        'runs': [],
-        'earned_runs': []
-    }
-    
-    juego_id = int(datosJuegoRaw['gameData']['game']['pk'])
-    for i, pitcher in enumerate(pitchers):
-        datosPitcher = datosPitcherRaw[f'ID{pitcher}']
-
-        pitcher_id = int(pitcher)
-        if i == 0:
-            es_abridor = True
-        else:
-            es_abridor = False
-        es_ganador = datosPitcher['stats']['pitching']['wins'] == 1
-        es_perdedor = datosPitcher['stats']['pitching']['losses'] == 1
-        oportunidad_salvamento = datosPitcher['stats']['pitching']['saveOpportunities'] == 1
-        es_salvamento = datosPitcher['stats']['pitching']['saves'] == 1
-        at_bats = int(datosPitcher['stats']['pitching']['atBats'])
-        strike_outs = int(datosPitcher['stats']['pitching']['strikeOuts'])
-        outs = int(datosPitcher['stats']['pitching']['outs'])
-        balls = int(datosPitcher['stats']['pitching']['balls'])
-        strikes = int(datosPitcher['stats']['pitching']['strikes'])
-        doubles = int(datosPitcher['stats']['pitching']['doubles'])
-        triples = int(datosPitcher['stats']['pitching']['triples'])
-        home_runs = int(datosPitcher['stats']['pitching']['homeRuns'])
-        singles = int(datosPitcher['stats']['pitching']['hits']) - doubles - triples - home_runs
-        base_on_balls = int(datosPitcher['stats']['pitching']['baseOnBalls'])
-        intentional_walks = int(datosPitcher['stats']['pitching']['intentionalWalks'])
-        hit_by_pitch = int(datosPitcher['stats']['pitching']['hitByPitch'])
-        wild_pitches = int(datosPitcher['stats']['pitching']['wildPitches'])
-        balks = int(datosPitcher['stats']['pitching']['balks'])
-        runs = int(datosPitcher['stats']['pitching']['runs'])
-        earned_runs = int(datosPitcher['stats']['pitching']['earnedRuns'])
-
-        datosTablaJuego_pitcher['juego_id'].append(juego_id)
-        datosTablaJuego_pitcher['pitcher_id'].append(pitcher_id)
-        datosTablaJuego_pitcher['es_local'].append(es_local)
-        datosTablaJuego_pitcher['es_abridor'].append(es_abridor)
-        datosTablaJuego_pitcher['es_ganador'].append(es_ganador)
-        datosTablaJuego_pitcher['es_perdedor'].append(es_perdedor)
-        datosTablaJuego_pitcher['oportunidad_salvamento'].append(oportunidad_salvamento)
-        datosTablaJuego_pitcher['es_salvamento'].append(es_salvamento)
-        datosTablaJuego_pitcher['at_bats'].append(at_bats)
-        datosTablaJuego_pitcher['strike_outs'].append(strike_outs)
-        datosTablaJuego_pitcher['outs'].append(outs)
-        datosTablaJuego_pitcher['balls'].append(balls)
-        datosTablaJuego_pitcher['strikes'].append(strikes)
-        datosTablaJuego_pitcher['singles'].append(singles)
-        datosTablaJuego_pitcher['doubles'].append(doubles)
-        datosTablaJuego_pitcher['triples'].append(triples)
-        datosTablaJuego_pitcher['home_runs'].append(home_runs)
-        datosTablaJuego_pitcher['base_on_balls'].append(base_on_balls)
-        datosTablaJuego_pitcher['intentional_walks'].append(intentional_walks)
-        datosTablaJuego_pitcher['hit_by_pitch'].append(hit_by_pitch)
-        datosTablaJuego_pitcher['wild_pitches'].append(wild_pitches)
-        datosTablaJuego_pitcher['balks'].append(balks)
-        datosTablaJuego_pitcher['runs'].append(runs)
-        datosTablaJuego_pitcher['earned_runs'].append(earned_runs)
-
-    schema_df_juego_pitcher = {
-        'juego_id': pl.Int64,
-        'pitcher_id': pl.Int64,
-        'es_local': pl.Boolean,
-        'es_abridor': pl.Boolean,
-        'es_ganador': pl.Boolean,
-        'es_perdedor': pl.Boolean,
-        'oportunidad_salvamento': pl.Boolean,
-        'es_salvamento': pl.Boolean,
-        'at_bats': pl.Int64,
-        'strike_outs': pl.Int64,
-        'outs': pl.Int64,
-        'balls': pl.Int64,
-        'strikes': pl.Int64,
-        'singles': pl.Int64,
-        'doubles': pl.Int64,
-        'triples': pl.Int64,
-        'home_runs': pl.Int64,
-        'base_on_balls': pl.Int64,
-        'intentional_walks': pl.Int64,
-        'hit_by_pitch': pl.Int64,
-        'wild_pitches': pl.Int64,
-        'balks': pl.Int64,
-        'runs': pl.Int64,
-        'earned_runs': pl.Int64
-    }
-    return pl.DataFrame(datosTablaJuego_pitcher, schema=schema_df_juego_pitcher)
-
-def insertarDatosTablaJuego_pitcher(datosTablaJuego_pitcher):
-    if datosTablaJuego_pitcher.is_empty():
-        return
-    datosTablaJuego_pitcher.write_database(
-        table_name='juego_pitcher',
-        connection=connection_url,
-        if_table_exists='append'
-    )
-
-def getDatosTablaJuego_bateador(bateadores, datosJuegoRaw, es_local):
-    if es_local:
-        datosBateadorRaw = datosJuegoRaw['liveData']['boxscore']['teams']['home']['players']
+        nuevos = ', '.join(f'EXCLUDED.{columna}' for columna in actualizar)
+        actuales = ', '.join(f'{tabla}.{columna}' for columna in actualizar)
+        conflicto = f"""DO UPDATE SET ({', '.join(actualizar)}) = ROW({nuevos})
+                        WHERE ROW({actuales}) IS DISTINCT FROM ROW({nuevos})"""
+    conn.execute(text(f"""INSERT INTO {tabla} ({columnas})
+                          SELECT {columnas} FROM nuevos_{tabla}
+                          ON CONFLICT ({', '.join(llave)}) {conflicto}"""))
+
+# turno y lanzamiento estan particionadas por temporada, una particion por temporada (turno_2024, ...)
+TABLAS_PARTICIONADAS = ['turno', 'lanzamiento']
+
+def getParticion(tabla, temporada):
+    return f'{tabla}_{temporada}'
+
+def getParticiones(conn, tabla):
+    query = text("""SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = CAST(:tabla AS regclass)""")
+    particiones = conn.execute(query, {'tabla': tabla})
+    return set(particion[0] for particion in particiones)
+
+# Crea las particiones que faltan para las temporadas de los datos dentro de la transaccion de conn, en la
+# misma transaccion que los escribe para no esperar los bloqueos que ya tiene esa transaccion.
+# Varios trabajadores pueden empezar una temporada nueva al mismo tiempo: cada particion se crea con un bloqueo
+# de la particion (se toman en orden para no bloquearse entre ellos) y despues del bloqueo se revisa otra vez si
+# ya existe, asi el que espera ve la particion que creo el otro en lugar de fallar con la tabla duplicada
+def registrarParticiones(conn, tabla, temporadas):
+    query_bloqueo = text("""SELECT pg_advisory_xact_lock(hashtext(:llave))""")
+    query_existe = text("""SELECT to_regclass(:particion) IS NOT NULL""")
+    particiones = getParticiones(conn, tabla)
+    for temporada in sorted(temporadas):
+        if not str(temporada).isdigit():
+            raise ValueError(f'Temporada invalida para particionar {tabla}: {temporada}')
+        particion = getParticion(tabla, temporada)
+        if particion in particiones:
+            continue
+        conn.execute(query_bloqueo, {'llave': f'particion/{particion}'})
+        if not conn.execute(query_existe, {'particion': particion}).scalar():
+            conn.execute(text(f"""CREATE TABLE {particion} PARTITION OF {tabla} FOR VALUES IN ('{temporada}')"""))
+
+# Para bases creadas antes de que turno y lanzamiento se particionaran por temporada. En una transaccion se crean
+# las tablas particionadas (sin llaves ni indices para que la copia sea rapida) con una particion por cada
+# temporada que tiene turnos, se copian los datos con la temporada de su juego, se eliminan las tablas anteriores,
+# se cambian los nombres y se crean las llaves e indices de dB/crearTablas.sql. Si algo falla no cambia nada
+def particionarTablas():
+    query_tipo = text("""SELECT relkind FROM pg_class WHERE oid = CAST('turno' AS regclass)""")
+    query_turno = text("""CREATE TABLE IF NOT EXISTS turno_particionada
+                            (
+                                turno_id      INTEGER NOT NULL ,
+                                at_bat_descripcion     TEXT NOT NULL,
+                                entrada        SMALLINT NOT NULL ,
+                                es_parte_alta      BOOLEAN NOT NULL ,
+                                cuenta_outs SMALLINT NOT NULL ,
+                                carreras_anotadas SMALLINT NOT NULL ,
+                                llego_1b BOOLEAN NOT NULL ,
+                                llego_2b BOOLEAN NOT NULL ,
+                                llego_3b BOOLEAN NOT NULL ,
+                                llego_home BOOLEAN NOT NULL ,
+                                es_corredor_emergente BOOLEAN NOT NULL ,
+
+                                juego_id      INTEGER NOT NULL ,
+                                temporada     TEXT NOT NULL ,
+                                bateador_id   INTEGER NOT NULL ,
+                                pitcher_id   INTEGER NOT NULL ,
+                                tipo_turno_id TEXT NOT NULL
+                            ) PARTITION BY LIST (temporada)""")
+    query_lanzamiento = text("""CREATE TABLE IF NOT EXISTS lanzamiento_particionada
+                                  (
+                                      turno_id      INTEGER NOT NULL ,
+                                      numero_lanzamiento SMALLINT NOT NULL ,
+                                      es_jugada BOOLEAN NOT NULL ,
+                                      es_bola BOOLEAN NOT NULL ,
+                                      es_strike BOOLEAN NOT NULL ,
+                                      es_foul BOOLEAN NOT NULL ,
+                                      es_out BOOLEAN NOT NULL ,
+                                      cuenta_bolas SMALLINT NOT NULL ,
+                                      cuenta_strikes SMALLINT NOT NULL ,
+                                      x REAL,
+                                      y REAL,
+
+                                      tipo_lanzamiento_id TEXT NOT NULL ,
+                                      temporada     TEXT NOT NULL
+                                  ) PARTITION BY LIST (temporada)""")
+    query_temporadas = text("""SELECT DISTINCT j.temporada FROM juego j
+                                 WHERE EXISTS (SELECT 1 FROM turno t WHERE t.juego_id = j.juego_id)""")
+    query_copia_turno = text("""INSERT INTO turno_particionada
+                                  SELECT t.turno_id, t.at_bat_descripcion, t.entrada, t.es_parte_alta, t.cuenta_outs, t.carreras_anotadas,
+                                         t.llego_1b, t.llego_2b, t.llego_3b, t.llego_home, t.es_corredor_emergente,
+                                         t.juego_id, j.temporada, t.bateador_id, t.pitcher_id, t.tipo_turno_id
+                                  FROM turno t JOIN juego j ON j.juego_id = t.juego_id""")
+    query_copia_lanzamiento = text("""INSERT INTO lanzamiento_particionada
+                                        SELECT l.turno_id, l.numero_lanzamiento, l.es_jugada, l.es_bola, l.es_strike, l.es_foul, l.es_out,
+                                               l.cuenta_bolas, l.cuenta_strikes, l.x, l.y, l.tipo_lanzamiento_id, j.temporada
+                                        FROM lanzamiento l JOIN turno t ON t.turno_id = l.turno_id JOIN juego j ON j.juego_id = t.juego_id""")
+    query_llaves = [
+        """ALTER TABLE turno ADD PRIMARY KEY (turno_id, temporada),
+               ADD CONSTRAINT fk_turno_juego_id FOREIGN KEY (juego_id) REFERENCES juego(juego_id) ON DELETE CASCADE,
+               ADD CONSTRAINT fk_turno_bateador_id FOREIGN KEY (bateador_id) REFERENCES jugador(jugador_id),
+               ADD CONSTRAINT fk_turno_pitcher_id FOREIGN KEY (pitcher_id) REFERENCES jugador(jugador_id),
+               ADD CONSTRAINT fk_turno_tipo_turno_id FOREIGN KEY (tipo_turno_id) REFERENCES tipo_turno(tipo_turno_id)""",
+        """ALTER TABLE lanzamiento ADD PRIMARY KEY (turno_id, numero_lanzamiento, temporada),
+               ADD CONSTRAINT fk_jugada_turno_id FOREIGN KEY (turno_id, temporada) REFERENCES turno(turno_id, temporada) ON DELETE CASCADE,
+               ADD CONSTRAINT fk_jugada_tipo_lanzamiento_id FOREIGN KEY (tipo_lanzamiento_id) REFERENCES tipo_lanzamiento(tipo_lanzamiento_id)""",
+        """CREATE INDEX idx_turno_juego_id ON turno (juego_id)""",
+        """CREATE INDEX idx_turno_bateador_id ON turno (bateador_id)""",
+        """CREATE INDEX idx_turno_pitcher_id ON turno (pitcher_id)""",
+        """CREATE INDEX idx_turno_tipo_turno_id ON turno (tipo_turno_id)""",
+        """CREATE INDEX idx_lanzamiento_tipo_lanzamiento_id ON lanzamiento (tipo_lanzamiento_id)"""
+    ]
+    with contexto.engine.begin() as conn:
+        if conn.execute(query_tipo).scalar() == 'p':
+            return
+        print('Particionando turno y lanzamiento por temporada')
+        conn.execute(query_turno)
+        conn.execute(query_lanzamiento)
+        temporadas = [temporada[0] for temporada in conn.execute(query_temporadas)]
+        for tabla in TABLAS_PARTICIONADAS:
+            # Las particiones quedan con su nombre final (turno_2024, ...) al cambiar el nombre de la tabla
+            for temporada in sorted(temporadas):
+                if not str(temporada).isdigit():
+                    raise ValueError(f'Temporada invalida para particionar {tabla}: {temporada}')
+                conn.execute(text(f"""CREATE TABLE IF NOT EXISTS {getParticion(tabla, temporada)} PARTITION OF {tabla}_particionada FOR VALUES IN ('{temporada}')"""))
+        turnos = conn.execute(query_copia_turno).rowcount
+        lanzamientos = conn.execute(query_copia_lanzamiento).rowcount
+        # lanzamiento primero porque refiere a turno
+        conn.execute(text("""DROP TABLE lanzamiento"""))
+        conn.execute(text("""DROP TABLE turno"""))
+        for tabla in TABLAS_PARTICIONADAS:
+            conn.execute(text(f"""ALTER TABLE {tabla}_particionada RENAME TO {tabla}"""))
+        for query in query_llaves:
+            conn.execute(text(query))
+    print(f'turno y lanzamiento particionadas por temporada: {len(temporadas)} temporadas, {turnos} turnos y {lanzamientos} lanzamientos copiados')
+
+# Modos de escritura: copy escribe con COPY directo a la tabla, upsert actualiza los datos de los juegos juegos_id
+# y carga escribe con COPY a la tabla de la carga masiva (ver cargaMasiva.py)
+def escribirDatosTabla(conn, tabla, datos, modoEscritura='copy', juegos_id=None):
+    if tabla in TABLAS_PARTICIONADAS and not datos.is_empty():
+        registrarParticiones(conn, tabla, datos['temporada'].unique().to_list())
+    if modoEscritura == 'upsert':
+        upsertDatosTabla(conn, tabla, datos, juegos_id)
+    elif modoEscritura == 'carga':
+        copiarDatosTabla(conn, cargaMasiva.getTablaCarga(tabla), datos)
     else:
-        datosBateadorRaw = datosJuegoRaw['liveData']['boxscore']['teams']['away']['players']
-    
-    datosTablaJuego_bateador = {
-        'juego_id': [],
-        'bateador_id': [],
-        'es_local': [],
-        'at_bats': [],
-        'air_outs': [],
-        'fly_outs': [],
-        'ground_outs': [],
-        'line_outs': [],
-        'pop_outs': [],
-        'strike_outs': [],
-        'ground_into_double_play': [],
-        'ground_into_triple_play': [],
-        'left_on_base': [],
-        'sac_bunts': [],
-        'sac_flies': [],
-        'singles': [],
-        'doubles': [],
-        'triples': [],
-        'home_runs': [],
-        'base_on_balls': [],
-        'intentional_walks': [],
-        'hit_by_pitch': [],
-        'runs': [],
-        'rbi': []
-    }
+        copiarDatosTabla(conn, tabla, datos)
+
+def insertarDatosTablaJugador(jugadoresFaltantes, conn, modoEscritura='copy', juegos_id=None):
+    escribirDatosTabla(conn, 'jugador', jugadoresFaltantes, modoEscritura, juegos_id)
+
+def insertarDatosTablaTurno(datosTablaTurno, conn, modoEscritura='copy', juegos_id=None):
+    escribirDatosTabla(conn, 'turno', datosTablaTurno, modoEscritura, juegos_id)
+
+def insertarDatosTablaLanzamiento(datosTablaLanzamiento, conn, modoEscritura='copy', juegos_id=None):
+    escribirDatosTabla(conn, 'lanzamiento', datosTablaLanzamiento, modoEscritura, juegos_id)
+
+# Aplana las jugadas de varios juegos a la vez (ver aplanadoJugadas.py) y asigna los turno_id.
+# Regresa por juego_id los turnos, lanzamientos, pitchers y bateadores de cada equipo
+def procesarTurnos(datosJuegosRaw):
+    datosTablaTurno, datosTablaLanzamiento, pitchers, bateadores = aplanadoJugadas.aplanarJugadasJuegos(datosJuegosRaw)
+
+    # Los turnos vienen numerados desde 0 en el orden de los juegos, el numero dentro de cada juego da el turno_id
+    numeroTurno = datosTablaTurno.select(pl.int_range(pl.len()).over('juego_id'))[:, 0]
+    if numeroTurno.max() is not None and numeroTurno.max() >= TURNOS_POR_JUEGO:
+        raise ValueError(f'Un juego tiene mas de {TURNOS_POR_JUEGO} turnos')
+    juego_id = datosTablaTurno['juego_id']
+    turno_id = juego_id * TURNOS_POR_JUEGO + numeroTurno
+    # La temporada de cada turno y lanzamiento es la llave de particion de sus tablas
+    temporadasJuegos = {int(datosJuegoRaw['gameData']['game']['pk']): str(datosJuegoRaw['gameData']['game']['season']) for datosJuegoRaw in datosJuegosRaw}
+    temporada = juego_id.replace_strict(temporadasJuegos, return_dtype=pl.String).alias('temporada')
+    datosTablaTurno = datosTablaTurno.with_columns(turno_id.alias('turno'), temporada).rename({'turno': 'turno_id'})
+    datosTablaLanzamiento = datosTablaLanzamiento.with_columns(
+        turno_id.gather(datosTablaLanzamiento['turno']).alias('turno'),
+        juego_id.gather(datosTablaLanzamiento['turno']).alias('juego_id'),
+        temporada.gather(datosTablaLanzamiento['turno'])
+    ).rename({'turno': 'turno_id'})
+
+    turnosJuegos = datosTablaTurno.partition_by('juego_id', as_dict=True)
+    lanzamientosJuegos = datosTablaLanzamiento.partition_by('juego_id', as_dict=True, include_key=False)
+
+    turnos = {}
+    for datosJuegoRaw in datosJuegosRaw:
+        clave = (int(datosJuegoRaw['gameData']['game']['pk']),)
+        turnos[clave[0]] = (
+            turnosJuegos.get(clave, datosTablaTurno.clear()),
+            lanzamientosJuegos.get(clave, datosTablaLanzamiento.drop('juego_id').clear())
+        )
+    return turnos, pitchers, bateadores
     
-    juego_id = int(datosJuegoRaw['gameData']['game']['pk'])
-    for bateador in bateadores:
-        datosBateador = datosBateadorRaw[f'ID{bateador}']
-
-        bateador_id = int(bateador)
-        at_bats = int(datosBateador['stats']['batting']['atBats'])
-        air_outs = int(datosBateador['stats']['batting']['airOuts'])
-        fly_outs = int(datosBateador['stats']['batting']['flyOuts'])
-        ground_outs = int(datosBateador['stats']['batting']['groundOuts'])
-        line_outs = int(datosBateador['stats']['batting']['lineOuts'])
-        pop_outs = int(datosBateador['stats']['batting']['popOuts'])
-        strike_outs = int(datosBateador['stats']['batting']['strikeOuts'])
-        ground_into_double_play = int(datosBateador['stats']['batting']['groundIntoDoublePlay'])
-        ground_into_triple_play = int(datosBateador['stats']['batting']['groundIntoTriplePlay'])
-        left_on_base = int(datosBateador['stats']['batting']['leftOnBase'])
-        sac_bunts = int(datosBateador['stats']['batting']['sacBunts'])
-        sac_flies = int(datosBateador['stats']['batting']['sacFlies'])
-        doubles = int(datosBateador['stats']['batting']['doubles'])
-        triples = int(datosBateador['stats']['batting']['triples'])
-        home_runs = int(datosBateador['stats']['batting']['homeRuns'])
-        singles = int(datosBateador['stats']['batting']['hits']) - doubles - triples - home_runs
-        base_on_balls = int(datosBateador['stats']['batting']['baseOnBalls'])
-        intentional_walks = int(datosBateador['stats']['batting']['intentionalWalks'])
-        hit_by_pitch = int(datosBateador['stats']['batting']['hitByPitch'])
-        runs = int(datosBateador['stats']['batting']['runs'])
-        rbi = int(datosBateador['stats']['batting']['rbi'])
-
-        datosTablaJuego_bateador['juego_id'].append(juego_id)
-        datosTablaJuego_bateador['bateador_id'].append(bateador_id)
-        datosTablaJuego_bateador['es_local'].append(es_local)
-        datosTablaJuego_bateador['at_bats'].append(at_bats)
-        datosTablaJuego_bateador['air_outs'].append(air_outs)
-        datosTablaJuego_bateador['fly_outs'].append(fly_outs)
-        datosTablaJuego_bateador['ground_outs'].append(ground_outs)
-        datosTablaJuego_bateador['line_outs'].append(line_outs)
-        datosTablaJuego_bateador['pop_outs'].append(pop_outs)
-        datosTablaJuego_bateador['strike_outs'].append(strike_outs)
-        datosTablaJuego_bateador['ground_into_double_play'].append(ground_into_double_play)
-        datosTablaJuego_bateador['ground_into_triple_play'].append(ground_into_triple_play)
-        datosTablaJuego_bateador['left_on_base'].append(left_on_base)
-        datosTablaJuego_bateador['sac_bunts'].append(sac_bunts)
-        datosTablaJuego_bateador['sac_flies'].append(sac_flies)
-        datosTablaJuego_bateador['singles'].append(singles)
-        datosTablaJuego_bateador['doubles'].append(doubles)
-        datosTablaJuego_bateador['triples'].append(triples)
-        datosTablaJuego_bateador['home_runs'].append(home_runs)
-        datosTablaJuego_bateador['base_on_balls'].append(base_on_balls)
-        datosTablaJuego_bateador['intentional_walks'].append(intentional_walks)
-        datosTablaJuego_bateador['hit_by_pitch'].append(hit_by_pitch)
-        datosTablaJuego_bateador['runs'].append(runs)
-        datosTablaJuego_bateador['rbi'].append(rbi)
-
-    schema_df_juego_bateador = {
-        'juego_id': pl.Int64,
-        'bateador_id': pl.Int64,
-        'es_local': pl.Boolean,
-        'at_bats': pl.Int64,
-        'air_outs': pl.Int64,
-        'fly_outs': pl.Int64,
-        'ground_outs': pl.Int64,
-        'line_outs': pl.Int64,
-        'pop_outs': pl.Int64,
-        'strike_outs': pl.Int64,
-        'ground_into_double_play': pl.Int64,
-        'ground_into_triple_play': pl.Int64,
-        'left_on_base': pl.Int64,
-        'sac_bunts': pl.Int64,
-        'sac_flies': pl.Int64,
-        'singles': pl.Int64,
-        'doubles': pl.Int64,
-        'triples': pl.Int64,
-        'home_runs': pl.Int64,
-        'base_on_balls': pl.Int64,
-        'intentional_walks': pl.Int64,
-        'hit_by_pitch': pl.Int64,
-        'runs': pl.Int64,
-        'rbi': pl.Int64
-    }
-    return pl.DataFrame(datosTablaJuego_bateador, schema=schema_df_juego_bateador)
+def insertarDatosTablaJuego_pitcher(datosTablaJuego_pitcher, conn, modoEscritura='copy', juegos_id=None):
+    escribirDatosTabla(conn, 'juego_pitcher', datosTablaJuego_pitcher, modoEscritura, juegos_id)
 
-def insertarDatosTablaJuego_bateador(datosTablaJuego_bateador):
-    if datosTablaJuego_bateador.is_empty():
-        return
-    datosTablaJuego_bateador.write_database(
-        table_name='juego_bateador',
-        connection=connection_url,
-        if_table_exists='append'
-    )
+def insertarDatosTablaJuego_bateador(datosTablaJuego_bateador, conn, modoEscritura='copy', juegos_id=None):
+    escribirDatosTabla(conn, 'juego_bateador', datosTablaJuego_bateador, modoEscritura, juegos_id)
 
 def elimiarJuego(juego_id):
     query = text("""DELETE FROM juego WHERE juego_id = :juego_id""")
     datos = {
                 'juego_id': juego_id
             }
-    with engine.connect() as conn:
+    with contexto.engine.connect() as conn:
         conn.execute(query, datos)
+        cacheConsultas.avanzarRevision(conn)
         conn.commit()
     print(f'Juego {juego_id} eliminado debido a un error en el procesamiento.')
 
-def procesarTemporada(temporada):
-    erroresGenerados = 0
-    clavesJuegosTemporadaorada = getClavesJuegosTemporada(temporada)
-    print(f'Temporada: {temporada} juegos a agregar: {len(clavesJuegosTemporadaorada)}')
-    while len(clavesJuegosTemporadaorada) > 0:
-        juego_id = clavesJuegosTemporadaorada.pop(0)
+# Las jugadas de todos los juegos se aplanan juntas, el resto se transforma juego por juego
+def transformarJuegos(datosJuegosRaw):
+    with metricas.medir('aplanado_jugadas', juegos=len(datosJuegosRaw)):
+        turnosJuegos, pitchers, bateadores = procesarTurnos(datosJuegosRaw)
+    with metricas.medir('extraccion_juego_pitcher', juegos=len(datosJuegosRaw)):
+        juego_pitcherJuegos = extraccionBoxscore.extractorJuego_pitcher.extraer(datosJuegosRaw, pitchers)
+    with metricas.medir('extraccion_juego_bateador', juegos=len(datosJuegosRaw)):
+        juego_bateadorJuegos = extraccionBoxscore.extractorJuego_bateador.extraer(datosJuegosRaw, bateadores)
+    juego_pitcherJuegos = juego_pitcherJuegos.partition_by('juego_id', as_dict=True)
+    juego_bateadorJuegos = juego_bateadorJuegos.partition_by('juego_id', as_dict=True)
+    juegos = []
+    for datosJuegoRaw in datosJuegosRaw:
+        juego_id = int(datosJuegoRaw['gameData']['game']['pk'])
+        with metricas.medir('transformacion_juego', juego_id):
+            datosTablaJuego = getDatosTablaJuego(datosJuegoRaw)
+        FkTablaJuego = {
+            'estadio_id': datosTablaJuego['estadio_id'],
+            'umpire_home_id': datosTablaJuego['umpire_home_id'],
+            'umpire_1b_id': datosTablaJuego['umpire_1b_id'],
+            'umpire_2b_id': datosTablaJuego['umpire_2b_id'],
+            'umpire_3b_id': datosTablaJuego['umpire_3b_id']
+        }
+        with metricas.medir('validacion_fk', juego_id):
+            datosTablaEstadio = validarFkTablaJuego(FkTablaJuego, datosJuegoRaw)
+        with metricas.medir('transformacion_jugador', juego_id):
+            datosTablaJugador = getDatosTablaJugador(datosJuegoRaw['gameData']['players'])
+        datosTablaTurno, datosTablaLanzamiento = turnosJuegos[juego_id]
+        datosTablaJuego_pitcher = juego_pitcherJuegos.get((juego_id,), pl.DataFrame(schema=extraccionBoxscore.extractorJuego_pitcher.schema))
+        datosTablaJuego_bateador = juego_bateadorJuegos.get((juego_id,), pl.DataFrame(schema=extraccionBoxscore.extractorJuego_bateador.schema))
+
+        juegos.append({
+            'juego_id': juego_id,
+            'estadio': datosTablaEstadio,
+            'juego': datosTablaJuego,
+            'jugador': datosTablaJugador,
+            'turno': datosTablaTurno,
+            'lanzamiento': datosTablaLanzamiento,
+            'juego_pitcher': datosTablaJuego_pitcher,
+            'juego_bateador': datosTablaJuego_bateador
+        })
+    return juegos
+
+def transformarJuego(datosJuegoRaw):
+    return transformarJuegos([datosJuegoRaw])[0]
+
+# Escribe varios juegos ya transformados con una sola conexion y un COPY por tabla. Con upsert los juegos
+# que ya estaban en la base se actualizan en su lugar, sin borrarlos antes, y con carga se escriben a las
+# tablas de la carga masiva
+def escribirJuegos(juegos, conn, modoEscritura='copy'):
+    juegos_id = [juego['juego_id'] for juego in juegos]
+    # Los resumenes de los equipos que tenian los juegos antes del upsert tambien se actualizan
+    llavesAnteriores = resumenEquipos.getLlavesJuegos(conn, juegos_id) if modoEscritura == 'upsert' else []
+    with metricas.medir('escritura_estadio', juegos=len(juegos)):
+        for juego in juegos:
+            if juego['estadio'] is not None:
+                insertDatosTablaEstadio(juego['estadio'], conn)
+    with metricas.medir('escritura_juego', juegos=len(juegos)):
+        insertDatosTablaJuego([juego['juego'] for juego in juegos], conn, modoEscritura, juegos_id)
+    with metricas.medir('escritura_jugador', juegos=len(juegos)):
+        insertarDatosTablaJugador(pl.concat([juego['jugador'] for juego in juegos]), conn, modoEscritura, juegos_id)
+    with metricas.medir('escritura_turno', juegos=len(juegos)):
+        insertarDatosTablaTurno(pl.concat([juego['turno'] for juego in juegos]), conn, modoEscritura, juegos_id)
+    with metricas.medir('escritura_lanzamiento', juegos=len(juegos)):
+        insertarDatosTablaLanzamiento(pl.concat([juego['lanzamiento'] for juego in juegos]), conn, modoEscritura, juegos_id)
+    with metricas.medir('escritura_juego_pitcher', juegos=len(juegos)):
+        insertarDatosTablaJuego_pitcher(pl.concat([juego['juego_pitcher'] for juego in juegos]), conn, modoEscritura, juegos_id)
+    with metricas.medir('escritura_juego_bateador', juegos=len(juegos)):
+        insertarDatosTablaJuego_bateador(pl.concat([juego['juego_bateador'] for juego in juegos]), conn, modoEscritura, juegos_id)
+    # En la carga masiva los resumenes y la revision se actualizan al fusionar
+    if modoEscritura != 'carga':
+        with metricas.medir('resumen_equipos', juegos=len(juegos)):
+            resumenEquipos.actualizarResumenesJuegos(conn, juegos_id, llavesAnteriores)
+        cacheConsultas.registrarRevisionJuegos(conn, juegos_id)
+        cacheConsultas.avanzarRevision(conn)
+
+# Acumula juegos transformados y los escribe juntos en una sola transaccion cuando se llega
+# al limite de juegos, de filas o de bytes. Si la transaccion del lote falla se vuelve a intentar
+# cada juego del lote en su propia transaccion, asi solo se pierden los juegos que tienen el error
+class LoteJuegos:
+    def __init__(self, maxJuegos=20, maxFilas=50_000, maxBytes=32 * 1024 * 1024, modoEscritura='copy'):
+        self.maxJuegos = maxJuegos
+        self.modoEscritura = modoEscritura
+        self.maxFilas = maxFilas
+        self.maxBytes = maxBytes
+        self.juegos = []
+        self.filas = 0
+        self.bytes = 0
+        self.errores = {} # juego_id -> error de los juegos que no se pudieron escribir
+
+    def agregar(self, juego):
+        # Los registros en memoria se actualizan desde ahora para que otro juego del mismo lote
+        # no vuelva a insertar el mismo estadio o jugador, si el juego falla se revierten.
+        # Los juegos que se transformaron juntos pueden traer el mismo estadio o jugador nuevo
+        if juego['estadio'] is not None and juego['estadio']['estadio_id'] in contexto.estadiosRegistrados:
+            juego['estadio'] = None
+        if juego['estadio'] is not None:
+            contexto.estadiosRegistrados.add(juego['estadio']['estadio_id'])
+        juego['jugador'] = juego['jugador'].filter(~pl.col('jugador_id').is_in(list(contexto.jugadoresRegistrados)))
+        contexto.jugadoresRegistrados.update(juego['jugador']['jugador_id'].to_list())
+        for jugador_id in juego['jugador'].filter(pl.col('nombre').is_null())['jugador_id']:
+            print(f'jugador: {jugador_id} -> faltan datos del jugador. Juego: {juego["juego_id"]}')
+
+        self.juegos.append(juego)
+        for tabla in ['turno', 'lanzamiento', 'juego_pitcher', 'juego_bateador']:
+            self.filas += juego[tabla].height
+            self.bytes += juego[tabla].estimated_size()
+
+    def estaLleno(self):
+        return len(self.juegos) >= self.maxJuegos or self.filas >= self.maxFilas or self.bytes >= self.maxBytes
+
+    def revertirRegistros(self, juego):
+        if juego['estadio'] is not None:
+            contexto.estadiosRegistrados.discard(juego['estadio']['estadio_id'])
+        contexto.jugadoresRegistrados.difference_update(juego['jugador']['jugador_id'].to_list())
+
+    def confirmarRegistros(self, juego):
+        contexto.jugadoresSinNombre.update(juego['jugador'].filter(pl.col('nombre').is_null())['jugador_id'].to_list())
+        metricas.contar('juegos_escritos')
+        metricas.contar('filas_escritas', 1, 'juego')
+        if juego['estadio'] is not None:
+            metricas.contar('filas_escritas', 1, 'estadio')
+        for tabla in TABLAS_JUEGO:
+            metricas.contar('filas_escritas', juego[tabla].height, tabla)
+
+    # Regresa los juego_id que no se pudieron escribir
+    def vaciar(self):
+        if len(self.juegos) == 0:
+            return []
+        juegos = self.juegos
+        self.juegos = []
+        self.filas = 0
+        self.bytes = 0
+
         try:
-            datosJuegoRaw = getDatosJuegoRaw(juego_id)
-            if datosJuegoRaw is None:
-                pass
-            else:
-                datosTablaJuego = getDatosTablaJuego(datosJuegoRaw)
-                FkTablaJuego = {
-                    'estadio_id': datosTablaJuego['estadio_id'],
-                    'umpire_home_id': datosTablaJuego['umpire_home_id'],
-                    'umpire_1b_id': datosTablaJuego['umpire_1b_id'],
-                    'umpire_2b_id': datosTablaJuego['umpire_2b_id'],
-                    'umpire_3b_id': datosTablaJuego['umpire_3b_id']
-                }
-                validarFkTablaJuego(FkTablaJuego, datosJuegoRaw)
-                insertDatosTablaJuego(datosTablaJuego)
-                datosTablaJugador = getDatosTablaJugador(datosJuegoRaw['gameData']['players'], juego_id)
-                insertarDatosTablaJugador(datosTablaJugador)
-                pitchers_visitante, pitchers_local, bateadores_visitante, bateadores_local = procesarTurnos(datosJuegoRaw)
-                datosTablaJuego_pitcher_visitante = getDatosTablaJuego_pitcher(pitchers_visitante, datosJuegoRaw, False)
-                insertarDatosTablaJuego_pitcher(datosTablaJuego_pitcher_visitante)
-                datosTablaJuego_pitcher_local = getDatosTablaJuego_pitcher(pitchers_local, datosJuegoRaw, True)
-                insertarDatosTablaJuego_pitcher(datosTablaJuego_pitcher_local)
-                datosTablaJuego_bateador_visitante = getDatosTablaJuego_bateador(bateadores_visitante, datosJuegoRaw, False)
-                insertarDatosTablaJuego_bateador(datosTablaJuego_bateador_visitante)
-                datosTablaJuego_bateador_local = getDatosTablaJuego_bateador(bateadores_local, datosJuegoRaw, True)
-                insertarDatosTablaJuego_bateador(datosTablaJuego_bateador_local)
+            with metricas.medir('escritura_lote', juegos=len(juegos)), contexto.engine.begin() as conn:
+                escribirJuegos(juegos, conn, self.modoEscritura)
+            for juego in juegos:
+                self.confirmarRegistros(juego)
+            return []
         except Exception as err:
-            print(f'----\n{err}')
+            if len(juegos) == 1:
+                print(f'----\n{err}')
+                self.revertirRegistros(juegos[0])
+                self.errores[juegos[0]['juego_id']] = str(err)
+                return [juegos[0]['juego_id']]
+            print(f'----\nError al escribir un lote de {len(juegos)} juegos, se escriben uno por uno\n{err}')
+
+        juegosFallidos = []
+        for juego in juegos:
+            try:
+                with contexto.engine.begin() as conn:
+                    escribirJuegos([juego], conn, self.modoEscritura)
+                self.confirmarRegistros(juego)
+            except Exception as err:
+                print(f'----\n{err}')
+                self.revertirRegistros(juego)
+                self.errores[juego['juego_id']] = str(err)
+                juegosFallidos.append(juego['juego_id'])
+        return juegosFallidos
+
+def getJuegosDescargados(descargas):
+    juegosDescargados = []
+    for _, descarga in descargas:
+        if descarga.done() and descarga.exception() is None and descarga.result() is not None:
+            juegosDescargados.append(descarga.result())
+    return juegosDescargados
+
+# Pipeline con varios procesos: los procesos del pool obtienen y transforman grupos de juegos y el proceso
+# principal es el unico que escribe en la base y el unico dueño de los registros en memoria (jugadores,
+# umpires y estadios). Las tablas de cada grupo regresan en formato Arrow IPC, un buffer por tabla, asi
+# no se serializa fila por fila
+TABLAS_JUEGO = ['jugador', 'turno', 'lanzamiento', 'juego_pitcher', 'juego_bateador']
+
+def serializarJuegos(juegos):
+    tablas = {}
+    for tabla in TABLAS_JUEGO:
+        buffer = io.BytesIO()
+        pl.concat([juego[tabla] for juego in juegos]).write_ipc(buffer)
+        tablas[tabla] = (buffer.getvalue(), [juego[tabla].height for juego in juegos])
+    juegos = [{clave: valor for clave, valor in juego.items() if clave not in TABLAS_JUEGO} for juego in juegos]
+    return juegos, tablas
+
+def deserializarJuegos(juegos, tablas):
+    for tabla, (contenido, filas) in tablas.items():
+        datos = pl.read_ipc(io.BytesIO(contenido))
+        inicio = 0
+        for juego, filasJuego in zip(juegos, filas):
+            juego[tabla] = datos.slice(inicio, filasJuego)
+            inicio += filasJuego
+    return juegos
+
+def iniciarProcesoTransformacion(replay, refresco):
+    global modoReplay, modoRefresco
+    modoReplay = replay
+    modoRefresco = refresco
+    # Los registros en memoria son del proceso que escribe, aqui se regresan todos los jugadores
+    # y estadios de cada juego y el proceso que escribe descarta los que ya estan registrados
+    contexto.jugadoresRegistrados = set()
+    contexto.estadiosRegistrados = set()
+
+# Se ejecuta en un proceso del pool, regresa los juegos transformados y serializados, los umpires
+# de esos juegos y los juegos que no se pudieron obtener o transformar con su error
+def transformarGrupoProceso(clavesJuegos, trabajadores):
+    errores = []
+    grupo = []
+    with ThreadPoolExecutor(max_workers=trabajadores) as executor:
+        descargas = [(juego_id, executor.submit(getDatosJuegoRaw, juego_id)) for juego_id in clavesJuegos]
+        for juego_id, descarga in descargas:
+            try:
+                datosJuegoRaw = descarga.result()
+                if datosJuegoRaw is not None:
+                    grupo.append((juego_id, datosJuegoRaw))
+            except Exception as err:
+                errores.append((juego_id, str(err)))
+
+    try:
+        umpires = getUmpiresJuegos([datosJuegoRaw for _, datosJuegoRaw in grupo])
+        juegos = transformarJuegos([datosJuegoRaw for _, datosJuegoRaw in grupo])
+    except Exception:
+        # Se transforma cada juego por separado para descartar solo los juegos con error
+        umpires = {}
+        juegos = []
+        for juego_id, datosJuegoRaw in grupo:
+            try:
+                umpiresJuego = getUmpiresJuegos([datosJuegoRaw])
+                juegos.append(transformarJuego(datosJuegoRaw))
+                umpires.update(umpiresJuego)
+            except Exception as err:
+                errores.append((juego_id, str(err)))
+    if len(juegos) == 0:
+        return [], {}, {}, errores, metricas.registro.extraer()
+    with metricas.medir('serializacion', juegos=len(juegos)):
+        juegos, tablas = serializarJuegos(juegos)
+    return juegos, tablas, umpires, errores, metricas.registro.extraer()
+
+# Los grupos se reparten entre los procesos y sus resultados se escriben en el orden en que se enviaron.
+# Cada grupo tiene hasta juegosPorLote juegos, pero si hay pocos juegos se reparten entre todos los procesos
+def procesarJuegosProcesos(clavesJuegos, trabajadores, juegosPorLote, procesos, lote, registrarError, vaciarLote):
+    tamanoGrupo = max(1, min(juegosPorLote, -(-len(clavesJuegos) // procesos)))
+
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=iniciarProcesoTransformacion, initargs=(modoReplay, modoRefresco)) as executor:
+        grupos = deque()
+        while len(clavesJuegos) > 0 or len(grupos) > 0:
+            while len(clavesJuegos) > 0 and len(grupos) < procesos * 2:
+                grupo = [clavesJuegos.popleft() for _ in range(min(tamanoGrupo, len(clavesJuegos)))]
+                grupos.append((grupo, executor.submit(transformarGrupoProceso, grupo, trabajadores)))
+
+            grupo, transformacion = grupos.popleft()
+            try:
+                juegos, tablas, umpires, errores, metricasProceso = transformacion.result()
+                metricas.registro.combinar(metricasProceso)
+                with metricas.medir('deserializacion', juegos=len(juegos)):
+                    juegos = deserializarJuegos(juegos, tablas)
+                registrarUmpires(umpires)
+            except Exception as err:
+                print(f'----\n{err}')
+                errores = [(juego_id, None) for juego_id in grupo]
+                juegos = []
+            for juego_id, err in errores:
+                if err is not None:
+                    print(f'----\n{err}')
+                registrarError(juego_id)
+
+            for juego in juegos:
+                lote.agregar(juego)
+                if lote.estaLleno():
+                    vaciarLote()
+            if len(clavesJuegos) == 0 and len(grupos) == 0:
+                vaciarLote()
+
+# Con upsert los juegos se escriben con INSERT ... ON CONFLICT (ver upsertDatosTabla), volver a procesar un
+# juego que ya esta en la base lo actualiza y un juego con error solo se vuelve a encolar. Con copy se
+# escribe con COPY, que falla si el juego ya existe, por eso antes de reintentar un juego se elimina.
+# Con carga los juegos se escriben a las tablas de la carga masiva y se fusionan al terminar (ver cargaMasiva.py)
+def procesarJuegos(clavesJuegos, descripcion, trabajadores=1, juegosPorLote=20, procesos=0, modoEscritura='copy', reconstruirIndices=False):
+    if len(clavesJuegos) == 0:
+        return
+    if modoEscritura == 'carga':
+        cargaMasiva.prepararCarga(contexto.engine)
+    erroresGenerados = 0
+    clavesJuegos = deque(clavesJuegos)
+    lote = LoteJuegos(maxJuegos=juegosPorLote, modoEscritura=modoEscritura)
+
+    def registrarError(juego_id):
+        nonlocal erroresGenerados
+        metricas.contar('reintentos', etiqueta='juego')
+        if modoEscritura == 'copy':
             elimiarJuego(juego_id)
-            clavesJuegosTemporadaorada.append(juego_id)
-            erroresGenerados += 1
-            if erroresGenerados > 10:
-                raise Exception(f'Se han generado demasiados errores ({erroresGenerados}) en la temporada {temporada}. Deteniendo el proceso.')
-        sleep(0.1)
+        clavesJuegos.append(juego_id)
+        erroresGenerados += 1
+        if erroresGenerados > 10:
+            raise Exception(f'Se han generado demasiados errores ({erroresGenerados}) en {descripcion}. Deteniendo el proceso.')
+
+    def vaciarLote():
+        for juego_id in lote.vaciar():
+            registrarError(juego_id)
+        # En la carga masiva los jugadores nuevos todavia no estan en jugador, se completan despues de fusionar
+        if len(contexto.jugadoresSinNombre) >= PERSONAS_POR_CONSULTA and modoEscritura != 'carga':
+            completarJugadoresSinNombre()
+
+    if procesos > 0:
+        procesarJuegosProcesos(clavesJuegos, trabajadores, juegosPorLote, procesos, lote, registrarError, vaciarLote)
+    else:
+        procesarJuegosHilos(clavesJuegos, trabajadores, juegosPorLote, lote, registrarError, vaciarLote)
+
+    if modoEscritura == 'carga':
+        juegosInvalidos = cargaMasiva.fusionarCarga(contexto.engine, TURNOS_POR_JUEGO, reconstruirIndices)
+        completarJugadoresSinNombre()
+        # Los juegos que no pasaron la validacion se vuelven a procesar uno por uno con copy,
+        # asi cada juego reporta su error y se reintenta como en una corrida normal
+        if len(juegosInvalidos) > 0:
+            procesarJuegos(juegosInvalidos, descripcion, trabajadores, 1, 0, 'copy')
+        return
+    completarJugadoresSinNombre()
 
-def main():
-    #temporadas = [2021] #! Esto solo es para las pruebas
-    temporadas = list(range(2021, 2026)) 
+def procesarJuegosHilos(clavesJuegos, trabajadores, juegosPorLote, lote, registrarError, vaciarLote):
+
+    # Las descargas se hacen en paralelo, pero los juegos se transforman en este hilo en orden,
+    # asi los registros en memoria (jugadores, estadios, umpires) no necesitan candados. El turno_id no depende
+    # del orden (juego_id * TURNOS_POR_JUEGO + numero del turno en el juego). Los juegos que ya estan
+    # descargados se transforman juntos (hasta juegosPorLote) para aplanar sus jugadas de una vez
+    # Con un solo trabajador contra la API se espera entre juegos, ahi solo se adelantan dos descargas
+    if trabajadores == 1 and not modoReplay:
+        maxDescargas = 2
+    else:
+        maxDescargas = max(trabajadores * 2, juegosPorLote)
+    with ThreadPoolExecutor(max_workers=trabajadores) as executor:
+        descargas = deque()
+        while len(clavesJuegos) > 0 or len(descargas) > 0:
+            while len(clavesJuegos) > 0 and len(descargas) < maxDescargas:
+                juego_id = clavesJuegos.popleft()
+                descargas.append((juego_id, executor.submit(getDatosJuegoRaw, juego_id)))
+
+            grupo = []
+            while len(descargas) > 0 and len(grupo) < juegosPorLote and (len(grupo) == 0 or descargas[0][1].done()):
+                juego_id, descarga = descargas.popleft()
+                try:
+                    datosJuegoRaw = descarga.result()
+                    if datosJuegoRaw is not None:
+                        grupo.append((juego_id, datosJuegoRaw))
+                except Exception as err:
+                    print(f'----\n{err}')
+                    registrarError(juego_id)
+
+            juegos = []
+            if len(grupo) > 0:
+                try:
+                    # Los umpires nuevos de estos juegos y de los juegos ya descargados se consultan juntos
+                    registrarUmpiresFaltantes([datosJuegoRaw for _, datosJuegoRaw in grupo] + getJuegosDescargados(descargas))
+                    juegos = transformarJuegos([datosJuegoRaw for _, datosJuegoRaw in grupo])
+                except Exception:
+                    # Se transforma cada juego por separado para descartar solo los juegos con error
+                    for juego_id, datosJuegoRaw in grupo:
+                        try:
+                            registrarUmpiresFaltantes([datosJuegoRaw])
+                            juegos.append(transformarJuego(datosJuegoRaw))
+                        except Exception as err:
+                            print(f'----\n{err}')
+                            registrarError(juego_id)
+
+            for juego in juegos:
+                lote.agregar(juego)
+                if lote.estaLleno():
+                    vaciarLote()
+            # Si ya no hay mas juegos por descargar se escribe lo que quede, los juegos fallidos se vuelven a encolar
+            if len(clavesJuegos) == 0 and len(descargas) == 0:
+                vaciarLote()
+            if trabajadores == 1 and not modoReplay:
+                sleep(0.1 * max(len(grupo), 1))
+
+def procesarTemporada(temporada, trabajadores=1, juegosPorLote=20, procesos=0, modoEscritura='copy', reconstruirIndices=False):
+    clavesJuegosTemporadaorada, estadoTemporada = getClavesJuegosTemporada(temporada)
+    if estadoTemporada is None:
+        print(f'Temporada: {temporada} cerrada')
+        return
+    print(f'Temporada: {temporada} juegos a agregar: {len(clavesJuegosTemporadaorada)} pendientes: {len(estadoTemporada["pendientes"])}')
+    procesarJuegos(clavesJuegosTemporadaorada, f'la temporada {temporada}', trabajadores, juegosPorLote, procesos, modoEscritura, reconstruirIndices)
+    # La marca de agua solo avanza cuando todos los juegos de la ventana ya se insertaron
+    guardarEstadoTemporada(temporada, estadoTemporada)
+
+def getJuegosRegistrados():
+    query = text("""SELECT juego_id FROM juego""")
+    with contexto.engine.connect() as conn:
+        juegos = conn.execute(query)
+        juegos = [juego[0] for juego in juegos]
+    return set(juegos)
+
+# Reconstruye la base de datos solo con los juegos del archivo local, sin hacer llamadas a la API
+def reconstruirDesdeArchivo(trabajadores=1, juegosPorLote=20, procesos=0, modoEscritura='copy', reconstruirIndices=False):
+    global modoReplay
+    modoReplay = True
+    validarTablasIndependientes()
+
+    juegosRegistrados = getJuegosRegistrados()
+    clavesJuegosArchivo = [int(clave.split('/')[-1]) for clave in archivoJuegos.getClaves('juegos')]
+    clavesJuegosArchivo = sorted(juego_id for juego_id in clavesJuegosArchivo if juego_id not in juegosRegistrados)
+    print(f'Replay: juegos a agregar desde el archivo local: {len(clavesJuegosArchivo)}')
+    procesarJuegos(clavesJuegosArchivo, 'el replay', trabajadores, juegosPorLote, procesos, modoEscritura, reconstruirIndices)
+
+# Vuelve a descargar juegos que ya estan en la base (por ejemplo feeds corregidos de juegos finalizados)
+# y los actualiza en su lugar con upsert, el archivo local se actualiza con el feed nuevo
+def refrescarJuegos(clavesJuegos, trabajadores=1, juegosPorLote=20, procesos=0):
+    global modoRefresco
+    modoRefresco = True
+    validarTablasIndependientes()
+    print(f'Juegos a refrescar: {len(clavesJuegos)}')
+    procesarJuegos(list(clavesJuegos), 'el refresco', trabajadores, juegosPorLote, procesos, 'upsert')
+
+# Para volver a ingerir una temporada completa sus particiones de turno y lanzamiento se desacoplan (es
+# inmediato, no borra fila por fila) y quedan como tablas sueltas turno_<temporada>_<fecha> hasta que se
+# eliminen a mano. Despues se eliminan los juegos y el estado de la temporada y la corrida la ingiere otra vez
+def desacoplarTemporada(temporada):
+    fecha = datetime.now().strftime('%Y%m%d_%H%M%S')
+    query_llaves = text("""SELECT conname FROM pg_constraint WHERE conrelid = CAST(:tabla AS regclass) AND contype = 'f'""")
+    temporada = str(temporada)
+    with contexto.engine.begin() as conn:
+        # lanzamiento primero porque refiere a turno
+        for tabla in ['lanzamiento', 'turno']:
+            particion = getParticion(tabla, temporada)
+            if particion not in getParticiones(conn, tabla):
+                continue
+            conn.execute(text(f"""ALTER TABLE {tabla} DETACH PARTITION {particion}"""))
+            # Sin sus llaves foraneas la tabla suelta ya no depende de las demas tablas
+            for llave in conn.execute(query_llaves, {'tabla': particion}).fetchall():
+                conn.execute(text(f"""ALTER TABLE {particion} DROP CONSTRAINT {llave[0]}"""))
+            conn.execute(text(f"""ALTER TABLE {particion} RENAME TO {particion}_{fecha}"""))
+        juegos = conn.execute(text("""DELETE FROM juego WHERE temporada = :temporada"""), {'temporada': temporada}).rowcount
+        conn.execute(text("""DELETE FROM juego_pendiente WHERE temporada = :temporada"""), {'temporada': temporada})
+        conn.execute(text("""DELETE FROM estado_temporada WHERE temporada = :temporada"""), {'temporada': temporada})
+        resumenEquipos.eliminarResumenesTemporada(conn, temporada)
+        cacheConsultas.avanzarRevision(conn)
+    print(f'Temporada: {temporada} desacoplada ({juegos} juegos eliminados), los datos anteriores quedan en turno_{temporada}_{fecha} y lanzamiento_{temporada}_{fecha}')
+
+def main(trabajadores=1, replay=False, juegosPorLote=20, procesos=0, modoEscritura='copy', refrescar=None, reconstruirIndices=False, reingestar=None):
+    actualizarEsquema()
+    for temporada in reingestar or []:
+        desacoplarTemporada(temporada)
+    if refrescar:
+        refrescarJuegos(refrescar, trabajadores, juegosPorLote, procesos)
+        return
+    if replay:
+        reconstruirDesdeArchivo(trabajadores, juegosPorLote, procesos, modoEscritura, reconstruirIndices)
+        return
 
     validarTablasIndependientes()
 
     for temporada in temporadas:
-        procesarTemporada(temporada)
+        procesarTemporada(temporada, trabajadores, juegosPorLote, procesos, modoEscritura, reconstruirIndices)
 
+# Las tablas que no existen en bases anteriores (juego_en_vivo, trabajo_juego, revision_juego, ...) se saltan.
+# La revision de la ingesta vuelve a empezar, por eso tambien se borra el cache local de consultas
 def limpiarTablas():
     query = """DELETE FROM {}"""
-    tablas = ['juego_pitcher', 'juego_bateador', 'lanzamiento', 'tipo_lanzamiento', 'turno', 'tipo_turno', 'jugador', 'posicion', 'juego',
+    query_existe = text("""SELECT TO_REGCLASS(:tabla) IS NOT NULL""")
+    tablas = ['estado_temporada', 'juego_pendiente', 'trabajo_juego', 'juego_en_vivo', 'sincronizacion_catalogo', 'revision_ingesta', 'revision_juego', 'resumen_equipo', 'resumen_equipo_fecha', 'juego_pitcher', 'juego_bateador', 'lanzamiento', 'tipo_lanzamiento', 'turno', 'tipo_turno', 'jugador', 'posicion', 'juego',
               'equipo', 'tipo_juego', 'estadio', 'status_juego', 'umpire']
-    with engine.connect() as conn:
+    with contexto.engine.connect() as conn:
         for tabla in tablas:
-            conn.execute(text(query.format(tabla)))
+            if conn.execute(query_existe, {'tabla': tabla}).scalar():
+                conn.execute(text(query.format(tabla)))
         conn.commit()
+    cacheConsultas.limpiarCache()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Obtener datos de la LMB y guardarlos en la base de datos')
+    parser.add_argument('--trabajadores', type=int, default=1, help='Numero de juegos que se descargan en paralelo')
+    parser.add_argument('--juegos-por-lote', type=int, default=20, help='Numero de juegos que se escriben juntos en una sola transaccion')
+    parser.add_argument('--procesos', type=int, default=0, help='Numero de procesos que transforman juegos en paralelo (0 transforma en el proceso principal)')
+    parser.add_argument('--replay', action='store_true', help='Reconstruir la base de datos desde el archivo local sin usar la API')
+    parser.add_argument('--upsert', action='store_true', help='Escribir con INSERT ... ON CONFLICT en lugar de COPY, los juegos que ya existen se actualizan')
+    parser.add_argument('--carga-masiva', action='store_true', help='Escribir a tablas UNLOGGED y fusionar con las tablas al terminar cada temporada o el replay')
+    parser.add_argument('--reconstruir-indices', action='store_true', help='Con --carga-masiva, eliminar los indices secundarios y llaves foraneas antes de fusionar y crearlos despues')
+    parser.add_argument('--refrescar', type=int, nargs='+', metavar='JUEGO_ID', help='Volver a descargar estos juegos y actualizarlos en la base con upsert')
+    parser.add_argument('--reingestar', type=int, nargs='+', metavar='TEMPORADA', help='Desacoplar las particiones de estas temporadas, eliminar sus juegos y volver a ingerirlas')
+    parser.add_argument('--metricas', default=metricas.directorioMetricas, help='Directorio donde se escriben el resumen JSON y las metricas de Prometheus de la corrida')
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], help='Ejecutar la corrida con cProfile o tracemalloc')
+    parser.add_argument('--reconstruir-resumenes', action='store_true', help='Calcular otra vez todos los resumenes de los equipos desde juego')
+    args = parser.parse_args()
+
+    if args.upsert and args.carga_masiva:
+        parser.error('--upsert y --carga-masiva no se pueden usar juntos')
+    modoEscritura = 'upsert' if args.upsert else 'carga' if args.carga_masiva else 'copy'
+
+    if args.reconstruir_resumenes:
+        actualizarEsquema()
+        resumenEquipos.reconstruirResumenes(contexto.engine)
+        raise SystemExit(0)
+
     #limpiarTablas()  #!Solo descomentar si se quiere reiniciar las tablas
-    main()
\ No newline at end of file
+    metricas.registro.reiniciar()
+    exitosa = False
+    try:
+        with metricas.perfilar(args.profile, args.metricas):
+            main(trabajadores=args.trabajadores, replay=args.replay, juegosPorLote=args.juegos_por_lote, procesos=args.procesos,
+                 modoEscritura=modoEscritura, refrescar=args.refrescar, reconstruirIndices=args.reconstruir_indices, reingestar=args.reingestar)
+        exitosa = True
+    finally:
+        print(f'Metricas de la corrida: {metricas.escribirMetricas(args.metricas, exitosa)}')
\ No newline at end of file
@@ -0,0 +1,168 @@
+# Resumenes de cada equipo por temporada, tipo de juego y localia (local, visitante y total): juegos, victorias,
+# derrotas, carreras anotadas (R) y carreras en contra (RA). resumen_equipo tiene los totales de la temporada y
+# resumen_equipo_fecha los acumulados hasta cada dia en que jugo el equipo, asi un tablero de un equipo es una
+# consulta por llave primaria en lugar de agrupar todos los juegos.
+# Se actualizan en la misma transaccion que escribe cada lote de juegos, solo para los equipos de esos juegos: los
+# totales se vuelven a calcular desde juego para cada llave y los acumulados solo desde el primer dia de los
+# juegos del lote. Calcular desde juego (en lugar de sumar cada juego) hace que escribir un juego otra vez con
+# upsert no lo cuente doble. Los juegos en vivo (juego_en_vivo) no se cuentan hasta que terminan
+
+from sqlalchemy import text
+import cacheConsultas
+
+# Zona horaria para el dia de cada juego, los juegos de la noche terminan el dia siguiente en UTC
+ZONA_HORARIA = 'America/Mexico_City'
+
+TABLAS_RESUMEN = ['resumen_equipo', 'resumen_equipo_fecha']
+
+# Para bases creadas antes de que existieran los resumenes
+def crearTablasResumen(conn):
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS resumen_equipo
+                         (
+                             temporada          TEXT NOT NULL ,
+                             equipo_id          SMALLINT NOT NULL ,
+                             tipo_juego_id      TEXT NOT NULL ,
+                             localia            TEXT NOT NULL ,
+                             juegos             SMALLINT NOT NULL ,
+                             victorias          SMALLINT NOT NULL ,
+                             derrotas           SMALLINT NOT NULL ,
+                             carreras           INTEGER NOT NULL ,
+                             carreras_en_contra INTEGER NOT NULL ,
+
+                             PRIMARY KEY (temporada, equipo_id, tipo_juego_id, localia),
+                             CONSTRAINT fk_resumen_equipo_equipo_id FOREIGN KEY (equipo_id) REFERENCES equipo(equipo_id),
+                             CONSTRAINT fk_resumen_equipo_tipo_juego_id FOREIGN KEY (tipo_juego_id) REFERENCES tipo_juego(tipo_juego_id),
+                             CONSTRAINT resumen_equipo_ck_localia CHECK (localia IN ('local', 'visitante', 'total'))
+                         )"""))
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS resumen_equipo_fecha
+                         (
+                             temporada          TEXT NOT NULL ,
+                             equipo_id          SMALLINT NOT NULL ,
+                             tipo_juego_id      TEXT NOT NULL ,
+                             localia            TEXT NOT NULL ,
+                             fecha              DATE NOT NULL ,
+                             juegos             SMALLINT NOT NULL ,
+                             victorias          SMALLINT NOT NULL ,
+                             derrotas           SMALLINT NOT NULL ,
+                             carreras           INTEGER NOT NULL ,
+                             carreras_en_contra INTEGER NOT NULL ,
+
+                             PRIMARY KEY (temporada, equipo_id, tipo_juego_id, localia, fecha),
+                             CONSTRAINT fk_resumen_equipo_fecha_equipo_id FOREIGN KEY (equipo_id) REFERENCES equipo(equipo_id),
+                             CONSTRAINT fk_resumen_equipo_fecha_tipo_juego_id FOREIGN KEY (tipo_juego_id) REFERENCES tipo_juego(tipo_juego_id),
+                             CONSTRAINT resumen_equipo_fecha_ck_localia CHECK (localia IN ('local', 'visitante', 'total'))
+                         )"""))
+
+# Llaves de los resumenes que se actualizan, con el primer dia desde el que cambian sus acumulados
+LLAVES_RESUMEN = """UNNEST(CAST(:temporadas AS TEXT[]), CAST(:equipos AS SMALLINT[]), CAST(:tipos AS TEXT[]), CAST(:desde AS DATE[]))
+                    AS l (temporada, equipo_id, tipo_juego_id, desde)"""
+
+# Cada juego terminado de las llaves una vez por equipo, con las carreras desde el punto de vista del equipo
+PARTIDOS_RESUMEN = f"""llaves AS (SELECT * FROM {LLAVES_RESUMEN}),
+                       partidos AS (
+                           SELECT l.temporada, l.equipo_id, l.tipo_juego_id, l.desde, 'local' AS localia,
+                                  CAST(j.primer_lanzamiento AT TIME ZONE '{ZONA_HORARIA}' AS DATE) AS fecha,
+                                  j.carreras_local AS carreras, j.carreras_visitante AS carreras_en_contra
+                           FROM llaves l
+                           JOIN juego j ON j.local_id = l.equipo_id AND j.temporada = l.temporada AND j.tipo_juego_id = l.tipo_juego_id
+                           WHERE NOT EXISTS (SELECT 1 FROM juego_en_vivo v WHERE v.juego_id = j.juego_id)
+                           UNION ALL
+                           SELECT l.temporada, l.equipo_id, l.tipo_juego_id, l.desde, 'visitante' AS localia,
+                                  CAST(j.primer_lanzamiento AT TIME ZONE '{ZONA_HORARIA}' AS DATE) AS fecha,
+                                  j.carreras_visitante AS carreras, j.carreras_local AS carreras_en_contra
+                           FROM llaves l
+                           JOIN juego j ON j.visitante_id = l.equipo_id AND j.temporada = l.temporada AND j.tipo_juego_id = l.tipo_juego_id
+                           WHERE NOT EXISTS (SELECT 1 FROM juego_en_vivo v WHERE v.juego_id = j.juego_id)
+                       )"""
+
+ESTADISTICAS_RESUMEN = """COUNT(*) AS juegos,
+                          COUNT(*) FILTER (WHERE carreras > carreras_en_contra) AS victorias,
+                          COUNT(*) FILTER (WHERE carreras < carreras_en_contra) AS derrotas,
+                          SUM(carreras) AS carreras,
+                          SUM(carreras_en_contra) AS carreras_en_contra"""
+
+# (temporada, equipo_id, tipo_juego_id, dia) de cada equipo de los juegos, para actualizar sus resumenes. En upsert se
+# piden antes y despues de escribir, si un juego corregido cambia de equipo o de dia se actualizan las dos llaves
+def getLlavesJuegos(conn, juegos_id):
+    if len(juegos_id) == 0:
+        return []
+    query = text(f"""SELECT j.temporada, e.equipo_id, j.tipo_juego_id, CAST(j.primer_lanzamiento AT TIME ZONE '{ZONA_HORARIA}' AS DATE)
+                     FROM juego j
+                     CROSS JOIN LATERAL (VALUES (j.local_id), (j.visitante_id)) AS e (equipo_id)
+                     WHERE j.juego_id = ANY(:juegos_id)""")
+    return [tuple(llave) for llave in conn.execute(query, {'juegos_id': list(juegos_id)})]
+
+def actualizarResumenes(conn, llavesJuegos):
+    llaves = {}
+    for temporada, equipo_id, tipo_juego_id, fecha in llavesJuegos:
+        llave = (temporada, equipo_id, tipo_juego_id)
+        llaves[llave] = min(fecha, llaves.get(llave, fecha))
+    if len(llaves) == 0:
+        return 0
+    llaves = sorted(llaves.items())
+    datos = {
+        'temporadas': [llave[0] for llave, _ in llaves],
+        'equipos': [llave[1] for llave, _ in llaves],
+        'tipos': [llave[2] for llave, _ in llaves],
+        'desde': [desde for _, desde in llaves]
+    }
+
+    # Cada llave se calcula con lo que ya esta confirmado en juego, dos transacciones que escriben juegos del mismo
+    # equipo al mismo tiempo se esperan aqui para que la segunda vea los juegos de la primera. Los bloqueos se toman
+    # en orden para no bloquearse entre ellas
+    conn.execute(text("""SELECT pg_advisory_xact_lock(hashtext(llave))
+                         FROM (SELECT UNNEST(CAST(:llaves AS TEXT[])) AS llave ORDER BY 1) AS l"""),
+                 {'llaves': [f'resumen_equipo/{temporada}/{equipo_id}/{tipo_juego_id}' for (temporada, equipo_id, tipo_juego_id), _ in llaves]})
+
+    conn.execute(text(f"""DELETE FROM resumen_equipo r USING {LLAVES_RESUMEN}
+                          WHERE r.temporada = l.temporada AND r.equipo_id = l.equipo_id AND r.tipo_juego_id = l.tipo_juego_id"""), datos)
+    conn.execute(text(f"""WITH {PARTIDOS_RESUMEN}
+                          INSERT INTO resumen_equipo (temporada, equipo_id, tipo_juego_id, localia, juegos, victorias, derrotas, carreras, carreras_en_contra)
+                          SELECT temporada, equipo_id, tipo_juego_id, COALESCE(localia, 'total'), {ESTADISTICAS_RESUMEN}
+                          FROM partidos
+                          GROUP BY GROUPING SETS ((temporada, equipo_id, tipo_juego_id, localia), (temporada, equipo_id, tipo_juego_id))"""), datos)
+
+    # Los acumulados antes del primer dia de los juegos no cambian
+    conn.execute(text(f"""DELETE FROM resumen_equipo_fecha r USING {LLAVES_RESUMEN}
+                          WHERE r.temporada = l.temporada AND r.equipo_id = l.equipo_id AND r.tipo_juego_id = l.tipo_juego_id
+                            AND r.fecha >= l.desde"""), datos)
+    conn.execute(text(f"""WITH {PARTIDOS_RESUMEN},
+                          dias AS (
+                              SELECT temporada, equipo_id, tipo_juego_id, COALESCE(localia, 'total') AS localia, fecha, MIN(desde) AS desde,
+                                     {ESTADISTICAS_RESUMEN}
+                              FROM partidos
+                              GROUP BY GROUPING SETS ((temporada, equipo_id, tipo_juego_id, localia, fecha), (temporada, equipo_id, tipo_juego_id, fecha))
+                          ),
+                          acumulados AS (
+                              SELECT temporada, equipo_id, tipo_juego_id, localia, fecha, desde,
+                                     SUM(juegos) OVER dia AS juegos,
+                                     SUM(victorias) OVER dia AS victorias,
+                                     SUM(derrotas) OVER dia AS derrotas,
+                                     SUM(carreras) OVER dia AS carreras,
+                                     SUM(carreras_en_contra) OVER dia AS carreras_en_contra
+                              FROM dias
+                              WINDOW dia AS (PARTITION BY temporada, equipo_id, tipo_juego_id, localia ORDER BY fecha)
+                          )
+                          INSERT INTO resumen_equipo_fecha (temporada, equipo_id, tipo_juego_id, localia, fecha, juegos, victorias, derrotas, carreras, carreras_en_contra)
+                          SELECT temporada, equipo_id, tipo_juego_id, localia, fecha, juegos, victorias, derrotas, carreras, carreras_en_contra
+                          FROM acumulados
+                          WHERE fecha >= desde"""), datos)
+    return len(llaves)
+
+def actualizarResumenesJuegos(conn, juegos_id, llavesAnteriores=None):
+    return actualizarResumenes(conn, (llavesAnteriores or []) + getLlavesJuegos(conn, juegos_id))
+
+def eliminarResumenesTemporada(conn, temporada):
+    for tabla in TABLAS_RESUMEN:
+        conn.execute(text(f"""DELETE FROM {tabla} WHERE temporada = :temporada"""), {'temporada': str(temporada)})
+
+# Calcula todos los resumenes desde juego, para bases que ya tenian juegos antes de los resumenes
+def reconstruirResumenes(engine):
+    with engine.begin() as conn:
+        crearTablasResumen(conn)
+        for tabla in TABLAS_RESUMEN:
+            conn.execute(text(f"""DELETE FROM {tabla}"""))
+        juegos_id = [juego[0] for juego in conn.execute(text("""SELECT juego_id FROM juego"""))]
+        llaves = actualizarResumenesJuegos(conn, juegos_id)
+        cacheConsultas.avanzarRevision(conn)
+    print(f'Resumenes de equipos reconstruidos: {llaves} equipos por temporada y tipo de juego, {len(juegos_id)} juegos')
@@ -0,0 +1,45 @@
+# Los modulos del proyecto estan en la raiz del repositorio, no en un paquete
+import contextlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy.exc import OperationalError
+import benchmarkIngesta
+import decodificador
+import obtenerDatos
+
+# Base de PostgreSQL temporal con las tablas de dB/crearTablas.sql en el servidor local (.env, DB_*_LOCAL), se
+# borra al terminar. Las pruebas que la usan se saltan si no hay un servidor local
+@pytest.fixture
+def baseDatos(monkeypatch):
+    with contextlib.ExitStack() as pila:
+        try:
+            conexion = pila.enter_context(benchmarkIngesta.baseTemporal())
+        except (OperationalError, ValueError):
+            pytest.skip('no hay un servidor de PostgreSQL local')
+        monkeypatch.setattr(obtenerDatos, 'contexto', obtenerDatos.ContextoIngesta())
+        obtenerDatos.contexto.conexion = conexion
+        yield conexion[0]
+
+# Escribe juegos transformados en la base temporal con LoteJuegos, en un solo lote
+@pytest.fixture
+def escribirJuegos(baseDatos):
+    def escribir(juegos, modoEscritura='copy'):
+        lote = obtenerDatos.LoteJuegos(maxJuegos=len(juegos), modoEscritura=modoEscritura)
+        for juego in juegos:
+            lote.agregar(dict(juego))
+        assert lote.vaciar() == []
+    return escribir
+
+# Los juegos de benchmark/feeds transformados y escritos en la base temporal
+@pytest.fixture
+def juegosBenchmark(baseDatos, escribirJuegos):
+    datosJuegosRaw = [decodificador.decodificarJuego(contenido) for contenido in benchmarkIngesta.leerFeeds().values()]
+    benchmarkIngesta.reiniciarRegistros()
+    juegos = obtenerDatos.transformarJuegos(datosJuegosRaw)
+    benchmarkIngesta.poblarCatalogos(baseDatos, juegos)
+    escribirJuegos(juegos)
+    return juegos
@@ -0,0 +1,518 @@
+# Pruebas del aplanado de jugadas (aplanadoJugadas.py). aplanarJugadasIterativo es la version original del
+# ciclo y es el oraculo: cada caso compara el aplanado con el oraculo y ademas revisa a mano los valores del caso.
+# Los feeds se arman con solo los campos que leen las dos versiones.
+# test_feedsBenchmark compara los feeds de benchmark/feeds y test_archivoLocal cada juego del archivo local
+# (DIRECTORIO_ARCHIVO) si hay alguno
+
+import copy
+import polars as pl
+import pytest
+import archivoJuegos
+import benchmarkIngesta
+import decodificador
+from aplanadoJugadas import aplanarJugadasJuegos, schema_df_turno, schema_df_lanzamiento
+
+# Version original del ciclo
+def aplanarJugadasIterativo(datosJuegoRaw):
+    pitchers_local = []
+    pitchers_visitante = []
+
+    bateadores_local = set()
+    bateadores_visitante = set()
+
+    juego_id = int(datosJuegoRaw['gameData']['game']['pk'])
+
+    datosTablaTurno = {
+        'turno': [],
+        'at_bat_descripcion': [],
+        'entrada': [],
+        'es_parte_alta': [],
+        'cuenta_outs': [],
+        'carreras_anotadas': [],
+        'llego_1b': [],
+        'llego_2b': [],
+        'llego_3b': [],
+        'llego_home': [],
+        'es_corredor_emergente': [],
+        'juego_id': [],
+        'bateador_id': [],
+        'pitcher_id': [],
+        'tipo_turno_id': []
+    }
+    datosTablaLanzamiento = {
+        'turno': [],
+        'numero_lanzamiento': [],
+        'es_jugada': [],
+        'es_bola': [],
+        'es_strike': [],
+        'es_foul': [],
+        'es_out': [],
+        'cuenta_bolas': [],
+        'cuenta_strikes': [],
+        'x': [],
+        'y': [],
+        'tipo_lanzamiento_id': []
+    }
+    jugadoresEnBase = {}
+    contador_outs = 0
+    contador_carreras_local = 0
+    contador_carreras_visitante = 0
+
+    for jugada in datosJuegoRaw['liveData']['plays']['allPlays']:
+        # Validar que tenga informacion
+        if 'eventType' not in jugada['result']:
+            continue
+        # Procesar turno
+        turno = len(datosTablaTurno['turno'])
+        at_bat_descripcion = str(jugada['result']['description'])
+        entrada = int(jugada['about']['inning'])
+        es_parte_alta = bool(jugada['about']['isTopInning'])
+        cuenta_outs = contador_outs
+        contador_outs = int(jugada['count']['outs'])
+        if cuenta_outs == 3:
+            contador_outs = 0
+            jugadoresEnBase = {}
+        marcador_local = int(jugada['result']['homeScore'])
+        marcador_visitante = int(jugada['result']['awayScore'])
+        if es_parte_alta:
+            carreras_anotadas = marcador_visitante - contador_carreras_visitante
+            contador_carreras_visitante = marcador_visitante
+        else:
+            carreras_anotadas = marcador_local - contador_carreras_local
+            contador_carreras_local = marcador_local
+        
+        bateador_id = int(jugada['matchup']['batter']['id'])
+        pitcher_id = int(jugada['matchup']['pitcher']['id'])
+        tipo_turno_id = str(jugada['result']['eventType'])
+
+        datosTablaTurno['turno'].append(turno)
+        datosTablaTurno['at_bat_descripcion'].append(at_bat_descripcion)
+        datosTablaTurno['entrada'].append(entrada)
+        datosTablaTurno['es_parte_alta'].append(es_parte_alta)
+        datosTablaTurno['cuenta_outs'].append(cuenta_outs)
+        datosTablaTurno['carreras_anotadas'].append(carreras_anotadas)
+        datosTablaTurno['llego_1b'].append(False)
+        datosTablaTurno['llego_2b'].append(False)
+        datosTablaTurno['llego_3b'].append(False)
+        datosTablaTurno['llego_home'].append(False)
+        datosTablaTurno['es_corredor_emergente'].append(False)
+
+        datosTablaTurno['juego_id'].append(juego_id)
+        datosTablaTurno['bateador_id'].append(bateador_id)
+        datosTablaTurno['pitcher_id'].append(pitcher_id)
+        datosTablaTurno['tipo_turno_id'].append(tipo_turno_id)
+
+        if es_parte_alta and pitcher_id not in pitchers_local:
+            pitchers_local.append(pitcher_id)
+        elif not es_parte_alta and pitcher_id not in pitchers_visitante:
+            pitchers_visitante.append(pitcher_id)
+
+        if es_parte_alta and bateador_id not in bateadores_visitante:
+            bateadores_visitante.add(bateador_id)
+        elif not es_parte_alta and bateador_id not in bateadores_local:
+            bateadores_local.add(bateador_id)
+
+        # Procesar lanzamiento
+        contador_bolas = 0
+        contador_strikes = 0
+        numero_lanzamiento = 0
+        for lanzamiento in jugada['playEvents']:
+            if 'eventType' in lanzamiento['details']:
+                if lanzamiento['details']['eventType'] == 'offensive_substitution':
+                    if es_parte_alta:
+                        bateadores_visitante.add(int(lanzamiento['player']['id']))
+                    else:
+                        bateadores_local.add(int(lanzamiento['player']['id']))
+                    corredor_anterior = int(lanzamiento['replacedPlayer']['id'])
+                    nuevo_corredor = int(lanzamiento['player']['id'])
+                    if corredor_anterior in jugadoresEnBase:
+                        datosTablaTurno['es_corredor_emergente'][jugadoresEnBase[corredor_anterior]] = True
+                        jugadoresEnBase[nuevo_corredor] = jugadoresEnBase[corredor_anterior]
+                elif lanzamiento['details']['eventType'] == 'pitching_substitution':
+                    if es_parte_alta and lanzamiento['player']['id'] not in pitchers_local:
+                        pitchers_local.append(int(lanzamiento['player']['id']))
+                    elif not es_parte_alta and lanzamiento['player']['id'] not in pitchers_visitante:
+                        pitchers_visitante.append(int(lanzamiento['player']['id']))
+                continue
+
+            numero_lanzamiento += 1
+            if 'isInPlay' in lanzamiento['details']:
+                es_jugada = bool(lanzamiento['details']['isInPlay'])
+            else:
+                es_jugada = False
+            if 'isBall' in lanzamiento['details']:
+                es_bola = bool(lanzamiento['details']['isBall'])
+            else:
+                es_bola = False
+            if 'isStrike' in lanzamiento['details']:
+                es_strike = bool(lanzamiento['details']['isStrike'])
+            else:
+                es_strike = False
+            es_out = bool(lanzamiento['details']['isOut'])
+            if contador_strikes == 2 and es_strike and not es_out:
+                es_foul = True
+            else:
+                es_foul = False
+            cuenta_bolas = contador_bolas
+            contador_bolas = int(lanzamiento['count']['balls'])
+            cuenta_strikes = contador_strikes
+            contador_strikes = int(lanzamiento['count']['strikes'])
+            if 'pitchData' in lanzamiento and 'x' in lanzamiento['pitchData']['coordinates'] and 'y' in lanzamiento['pitchData']['coordinates']:
+                x = -0.021 * (lanzamiento['pitchData']['coordinates']['x']) + 2.298
+                y = -0.021 * (lanzamiento['pitchData']['coordinates']['y']) + 5.803
+            else:
+                x = None
+                y = None
+            tipo_lanzamiento_id = str(lanzamiento['details']['code'])
+
+            datosTablaLanzamiento['turno'].append(turno)
+            datosTablaLanzamiento['numero_lanzamiento'].append(numero_lanzamiento)
+            datosTablaLanzamiento['es_jugada'].append(es_jugada)
+            datosTablaLanzamiento['es_bola'].append(es_bola)
+            datosTablaLanzamiento['es_strike'].append(es_strike)
+            datosTablaLanzamiento['es_foul'].append(es_foul)
+            datosTablaLanzamiento['es_out'].append(es_out)
+            datosTablaLanzamiento['cuenta_bolas'].append(cuenta_bolas)
+            datosTablaLanzamiento['cuenta_strikes'].append(cuenta_strikes)
+            datosTablaLanzamiento['x'].append(x)
+            datosTablaLanzamiento['y'].append(y)
+            datosTablaLanzamiento['tipo_lanzamiento_id'].append(tipo_lanzamiento_id)
+
+        # Procesar corredores
+        for corredor in jugada['runners']:
+            corredor_id = int(corredor['details']['runner']['id'])
+            start = str(corredor['movement']['start'])
+            end = str(corredor['movement']['end'])
+            if start == 'None':
+                jugadoresEnBase[corredor_id] = len(datosTablaTurno['turno']) - 1
+            i = jugadoresEnBase[corredor_id]
+            match end:
+                case '1B':
+                    datosTablaTurno['llego_1b'][i] = True
+                case '2B':
+                    datosTablaTurno['llego_1b'][i] = True
+                    datosTablaTurno['llego_2b'][i] = True
+                case '3B':
+                    datosTablaTurno['llego_1b'][i] = True
+                    datosTablaTurno['llego_2b'][i] = True
+                    datosTablaTurno['llego_3b'][i] = True
+                case 'score':
+                    datosTablaTurno['llego_1b'][i] = True
+                    datosTablaTurno['llego_2b'][i] = True
+                    datosTablaTurno['llego_3b'][i] = True
+                    datosTablaTurno['llego_home'][i] = True
+                    del jugadoresEnBase[corredor_id]
+                case _:
+                    del jugadoresEnBase[corredor_id]
+
+    datosTablaTurno = pl.DataFrame(datosTablaTurno, schema=schema_df_turno)
+    datosTablaLanzamiento = pl.DataFrame(datosTablaLanzamiento, schema=schema_df_lanzamiento)
+
+    return datosTablaTurno, datosTablaLanzamiento, pitchers_visitante, pitchers_local, bateadores_visitante, bateadores_local
+
+
+# Mismo formato que aplanarJugadasIterativo a partir del aplanado de un juego
+def aplanarJugadas(datosJuegoRaw):
+    datosTablaTurno, datosTablaLanzamiento, pitchers, bateadores = aplanarJugadasJuegos([datosJuegoRaw])
+    pitchers_local = pitchers.filter(pl.col('es_local'))['jugador_id'].to_list()
+    pitchers_visitante = pitchers.filter(~pl.col('es_local'))['jugador_id'].to_list()
+    bateadores_local = set(bateadores.filter(pl.col('es_local'))['jugador_id'].to_list())
+    bateadores_visitante = set(bateadores.filter(~pl.col('es_local'))['jugador_id'].to_list())
+    return datosTablaTurno, datosTablaLanzamiento, pitchers_visitante, pitchers_local, bateadores_visitante, bateadores_local
+
+# Compara el aplanado con el oraculo en un juego, regresa los datos que no coinciden
+def validarAplanado(datosJuegoRaw):
+    nombres = ['turno', 'lanzamiento', 'pitchers_visitante', 'pitchers_local', 'bateadores_visitante', 'bateadores_local']
+    try:
+        esperado = aplanarJugadasIterativo(datosJuegoRaw)
+    except KeyError:
+        esperado = None
+    try:
+        obtenido = aplanarJugadas(datosJuegoRaw)
+    except KeyError:
+        obtenido = None
+    # Un corredor que no esta en base es un error en las dos versiones
+    if esperado is None or obtenido is None:
+        return [] if esperado is None and obtenido is None else ['error']
+
+    diferencias = []
+    for nombre, datosEsperados, datosObtenidos in zip(nombres, esperado, obtenido):
+        if isinstance(datosEsperados, pl.DataFrame):
+            iguales = datosEsperados.equals(datosObtenidos)
+        else:
+            iguales = datosEsperados == datosObtenidos
+        if not iguales:
+            diferencias.append(nombre)
+    return diferencias
+
+# Feeds de prueba
+
+LOCAL = [100 + i for i in range(9)]
+VISITANTE = [200 + i for i in range(9)]
+PITCHER_LOCAL = 150
+PITCHER_VISITANTE = 250
+
+def lanzamiento(code, bolas, strikes, jugada=False, out=False, coordenadas=(100.0, 150.0)):
+    evento = {
+        'details': {'code': code, 'isInPlay': jugada, 'isBall': code == 'B', 'isStrike': code in ['C', 'S', 'F'], 'isOut': out},
+        'count': {'balls': bolas, 'strikes': strikes}
+    }
+    if coordenadas is not None:
+        evento['pitchData'] = {'coordinates': {'x': coordenadas[0], 'y': coordenadas[1]}}
+    return evento
+
+def sustitucionOfensiva(nuevo, reemplazado):
+    return {'details': {'eventType': 'offensive_substitution'}, 'player': {'id': nuevo}, 'replacedPlayer': {'id': reemplazado}, 'count': {'balls': 0, 'strikes': 0}}
+
+def sustitucionPitcher(pitcher):
+    return {'details': {'eventType': 'pitching_substitution'}, 'player': {'id': pitcher}, 'count': {'balls': 0, 'strikes': 0}}
+
+def corredor(corredor_id, inicio, fin):
+    return {'details': {'runner': {'id': corredor_id}}, 'movement': {'start': inicio, 'end': fin}}
+
+def jugada(entrada, alta, outs, marcador, bateador, tipo='single', eventos=None, corredores=None, pitcher=None):
+    if pitcher is None:
+        pitcher = PITCHER_LOCAL if alta else PITCHER_VISITANTE
+    if eventos is None:
+        eventos = [lanzamiento('B', 1, 0), lanzamiento('X', 1, 0, jugada=True)]
+    return {
+        'result': {'eventType': tipo, 'description': f'{bateador} {tipo}', 'homeScore': marcador[0], 'awayScore': marcador[1]},
+        'about': {'inning': entrada, 'isTopInning': alta},
+        'count': {'outs': outs},
+        'matchup': {'batter': {'id': bateador}, 'pitcher': {'id': pitcher}},
+        'playEvents': eventos,
+        'runners': corredores if corredores is not None else []
+    }
+
+def out(entrada, alta, outs, marcador, bateador, corredores=None):
+    return jugada(entrada, alta, outs, marcador, bateador, 'field_out', [lanzamiento('X', 0, 0, jugada=True, out=True)],
+                  [corredor(bateador, None, None)] + (corredores or []))
+
+# Media entrada de tres outs seguidos
+def entradaLimpia(entrada, alta, marcador):
+    bateadores = VISITANTE if alta else LOCAL
+    return [out(entrada, alta, outs, marcador, bateadores[outs - 1]) for outs in [1, 2, 3]]
+
+def feed(juego_id, jugadas):
+    return {'gameData': {'game': {'pk': juego_id}}, 'liveData': {'plays': {'allPlays': jugadas}}}
+
+def aplanarValidado(datosJuegoRaw):
+    assert validarAplanado(datosJuegoRaw) == []
+    return aplanarJugadasJuegos([datosJuegoRaw])
+
+def columna(datos, nombre):
+    return datos[nombre].to_list()
+
+# Casos
+
+def test_lanzamientosYCuenta():
+    eventos = [
+        lanzamiento('B', 1, 0),
+        lanzamiento('C', 1, 1),
+        lanzamiento('F', 1, 2, coordenadas=None),
+        # Con dos strikes un strike que no es out es foul
+        lanzamiento('F', 1, 2),
+        lanzamiento('S', 1, 3, out=True)
+    ]
+    datosJuegoRaw = feed(1, [jugada(1, True, 1, (0, 0), VISITANTE[0], 'strikeout', eventos, [corredor(VISITANTE[0], None, None)])] + entradaLimpia(1, False, (0, 0)))
+    turnos, lanzamientos, _, _ = aplanarValidado(datosJuegoRaw)
+
+    assert lanzamientos.schema == pl.Schema(schema_df_lanzamiento)
+    assert columna(lanzamientos, 'numero_lanzamiento')[:5] == [1, 2, 3, 4, 5]
+    assert columna(lanzamientos, 'cuenta_bolas')[:5] == [0, 1, 1, 1, 1]
+    assert columna(lanzamientos, 'cuenta_strikes')[:5] == [0, 0, 1, 2, 2]
+    assert columna(lanzamientos, 'es_foul')[:5] == [False, False, False, True, False]
+    assert columna(lanzamientos, 'es_out')[:5] == [False, False, False, False, True]
+    assert lanzamientos['x'][2] is None and lanzamientos['x'][0] == pytest.approx(-0.021 * 100.0 + 2.298)
+    assert turnos.schema == pl.Schema(schema_df_turno)
+    assert columna(turnos, 'cuenta_outs') == [0, 1, 1, 2]
+
+def test_jugadasSinInformacion():
+    jugadas = entradaLimpia(1, True, (0, 0))
+    jugadas.insert(1, {'result': {}, 'about': {}, 'count': {}, 'playEvents': [], 'runners': []})
+    turnos, lanzamientos, _, _ = aplanarValidado(feed(1, jugadas))
+    assert turnos.height == 3
+    assert columna(lanzamientos, 'turno') == [0, 1, 2]
+
+def test_juegoSinJugadas():
+    turnos, lanzamientos, pitchers, bateadores = aplanarValidado(feed(1, []))
+    assert turnos.is_empty() and turnos.schema == pl.Schema(schema_df_turno)
+    assert lanzamientos.is_empty() and lanzamientos.schema == pl.Schema(schema_df_lanzamiento)
+    assert pitchers.is_empty() and bateadores.is_empty()
+
+def test_basesAlcanzadasYCarreras():
+    jugadas = [
+        # Sencillo, el bateador llega a primera
+        jugada(1, True, 0, (0, 0), VISITANTE[0], 'single', corredores=[corredor(VISITANTE[0], None, '1B')]),
+        # Doble, el corredor de primera anota
+        jugada(1, True, 0, (0, 1), VISITANTE[1], 'double', corredores=[corredor(VISITANTE[1], None, '2B'), corredor(VISITANTE[0], '1B', 'score')]),
+        # Out y el corredor de segunda avanza a tercera
+        out(1, True, 1, (0, 1), VISITANTE[2], [corredor(VISITANTE[1], '2B', '3B')]),
+        # Elevado de sacrificio
+        out(1, True, 2, (0, 2), VISITANTE[3], [corredor(VISITANTE[1], '3B', 'score')]),
+        out(1, True, 3, (0, 2), VISITANTE[4]),
+        # Jonron en la parte baja
+        jugada(1, False, 0, (1, 2), LOCAL[0], 'home_run', corredores=[corredor(LOCAL[0], None, 'score')])
+    ] + [out(1, False, outs, (1, 2), LOCAL[outs]) for outs in [1, 2, 3]]
+    turnos, _, _, _ = aplanarValidado(feed(1, jugadas))
+
+    assert columna(turnos, 'llego_1b')[:6] == [True, True, False, False, False, True]
+    assert columna(turnos, 'llego_2b')[:6] == [True, True, False, False, False, True]
+    assert columna(turnos, 'llego_3b')[:6] == [True, True, False, False, False, True]
+    assert columna(turnos, 'llego_home')[:6] == [True, True, False, False, False, True]
+    assert columna(turnos, 'carreras_anotadas')[:6] == [0, 1, 0, 1, 0, 1]
+
+def test_corredorEmergente():
+    emergente = 300
+    jugadas = [
+        jugada(1, True, 0, (0, 0), VISITANTE[0], 'single', corredores=[corredor(VISITANTE[0], None, '1B')]),
+        # El corredor emergente entra por el corredor de primera y anota con el doble
+        jugada(1, True, 0, (0, 1), VISITANTE[1], 'double',
+               eventos=[sustitucionOfensiva(emergente, VISITANTE[0]), lanzamiento('X', 0, 0, jugada=True)],
+               corredores=[corredor(VISITANTE[1], None, '2B'), corredor(emergente, '1B', 'score')]),
+    ] + [out(1, True, outs, (0, 1), VISITANTE[outs + 1]) for outs in [1, 2, 3]] + entradaLimpia(1, False, (0, 1))
+    turnos, _, _, bateadores = aplanarValidado(feed(1, jugadas))
+
+    # La carrera y el corredor emergente se registran en el turno en que llego a base el corredor original
+    assert columna(turnos, 'es_corredor_emergente')[:2] == [True, False]
+    assert columna(turnos, 'llego_home')[:2] == [True, False]
+    assert emergente in bateadores.filter(~pl.col('es_local'))['jugador_id'].to_list()
+
+def test_corredorEmergenteEnCadena():
+    jugadas = [
+        jugada(1, True, 0, (0, 0), VISITANTE[0], 'walk', corredores=[corredor(VISITANTE[0], None, '1B')]),
+        # Dos corredores emergentes seguidos, el segundo reemplaza al primero
+        jugada(1, True, 1, (0, 0), VISITANTE[1], 'field_out',
+               eventos=[sustitucionOfensiva(300, VISITANTE[0]), sustitucionOfensiva(301, 300), lanzamiento('X', 0, 0, jugada=True, out=True)],
+               corredores=[corredor(VISITANTE[1], None, None), corredor(301, '1B', '2B')]),
+        out(1, True, 2, (0, 0), VISITANTE[2], [corredor(301, '2B', '3B')]),
+        out(1, True, 3, (0, 0), VISITANTE[3])
+    ] + entradaLimpia(1, False, (0, 0))
+    turnos, _, _, _ = aplanarValidado(feed(1, jugadas))
+    assert columna(turnos, 'es_corredor_emergente')[0] is True
+    assert columna(turnos, 'llego_3b')[0] is True
+
+def test_emergenteDeUnJugadorQueNoEstaEnBase():
+    # Un bateador emergente no marca ningun turno
+    jugadas = [
+        jugada(1, True, 0, (0, 0), 300, 'single', eventos=[sustitucionOfensiva(300, VISITANTE[0]), lanzamiento('X', 0, 0, jugada=True)],
+               corredores=[corredor(300, None, '1B')])
+    ] + [out(1, True, outs, (0, 0), VISITANTE[outs]) for outs in [1, 2, 3]]
+    turnos, _, _, _ = aplanarValidado(feed(1, jugadas))
+    assert not any(columna(turnos, 'es_corredor_emergente'))
+
+def test_entradasExtra():
+    jugadas = []
+    for entrada in range(1, 10):
+        jugadas += entradaLimpia(entrada, True, (0, 0)) + entradaLimpia(entrada, False, (0, 0))
+    jugadas += [
+        jugada(10, True, 0, (0, 1), VISITANTE[0], 'home_run', corredores=[corredor(VISITANTE[0], None, 'score')])
+    ] + [out(10, True, outs, (0, 1), VISITANTE[outs]) for outs in [1, 2, 3]]
+    jugadas += [
+        jugada(10, False, 0, (0, 1), LOCAL[0], 'single', corredores=[corredor(LOCAL[0], None, '1B')]),
+        jugada(10, False, 0, (2, 1), LOCAL[1], 'home_run', corredores=[corredor(LOCAL[1], None, 'score'), corredor(LOCAL[0], '1B', 'score')])
+    ]
+    turnos, _, _, _ = aplanarValidado(feed(1, jugadas))
+
+    extras = turnos.filter(pl.col('entrada') == 10)
+    assert columna(extras, 'carreras_anotadas') == [1, 0, 0, 0, 0, 2]
+    assert columna(extras, 'cuenta_outs') == [3, 0, 1, 2, 3, 0]
+    assert columna(extras, 'llego_home') == [True, False, False, False, True, True]
+
+def test_corredorQueNoEstaEnBase():
+    # En las dos versiones un corredor que no llego a base es un error del juego
+    jugadas = [out(1, True, 1, (0, 0), VISITANTE[0], [corredor(999, '2B', '3B')])]
+    assert validarAplanado(feed(1, jugadas)) == []
+    with pytest.raises(KeyError):
+        aplanarJugadasJuegos([feed(1, jugadas)])
+
+def test_tercerosOutsRepetidos():
+    # Jugadas seguidas despues de un tercer out (por ejemplo un cambio de pitcher registrado como jugada) alternan
+    # cuenta_outs entre 3 y 0, y las bases se reinician en cada tercer out
+    jugadas = [
+        jugada(1, True, 0, (0, 0), VISITANTE[0], 'single', corredores=[corredor(VISITANTE[0], None, '1B')]),
+        out(1, True, 1, (0, 0), VISITANTE[1]),
+        out(1, True, 2, (0, 0), VISITANTE[2]),
+        out(1, True, 3, (0, 0), VISITANTE[3]),
+        jugada(1, True, 3, (0, 0), VISITANTE[4], 'pitching_substitution', eventos=[], pitcher=151),
+        jugada(1, True, 3, (0, 0), VISITANTE[4], 'game_advisory', eventos=[], pitcher=151),
+        jugada(1, False, 0, (0, 0), LOCAL[0], 'single', corredores=[corredor(LOCAL[0], None, '1B')])
+    ]
+    turnos, _, pitchers, _ = aplanarValidado(feed(1, jugadas))
+    assert columna(turnos, 'cuenta_outs') == [0, 0, 1, 2, 3, 0, 3]
+
+    # El corredor que quedo en base antes del tercer out ya no esta en base
+    jugadas.append(jugada(1, False, 0, (0, 0), LOCAL[1], 'single', corredores=[corredor(LOCAL[1], None, '1B'), corredor(VISITANTE[0], '1B', '2B')]))
+    assert validarAplanado(feed(1, jugadas)) == []
+    with pytest.raises(KeyError):
+        aplanarJugadasJuegos([feed(1, jugadas)])
+
+def test_pitchersEnOrden():
+    jugadas = [
+        out(1, True, 1, (0, 0), VISITANTE[0]),
+        jugada(1, True, 1, (0, 0), VISITANTE[1], 'single', eventos=[lanzamiento('B', 1, 0), sustitucionPitcher(151), lanzamiento('X', 1, 0, jugada=True)],
+               corredores=[corredor(VISITANTE[1], None, '1B')]),
+        out(1, True, 2, (0, 0), VISITANTE[2], ),
+        jugada(1, True, 2, (0, 0), VISITANTE[3], 'strikeout', eventos=[lanzamiento('S', 0, 1, out=True)], pitcher=151,
+               corredores=[corredor(VISITANTE[3], None, None)])
+    ]
+    jugadas[2]['matchup']['pitcher']['id'] = 151
+    jugadas[3]['count']['outs'] = 3
+    turnos, _, pitchers, _ = aplanarValidado(feed(1, jugadas))
+    assert pitchers.filter(pl.col('es_local'))['jugador_id'].to_list() == [PITCHER_LOCAL, 151]
+
+def test_variosJuegos():
+    # Un grupo de juegos da lo mismo que cada juego por separado, con los turnos numerados en orden en todo el grupo
+    juegos = []
+    for juego_id in [10, 11, 12]:
+        jugadas = []
+        for entrada in range(1, 3):
+            jugadas += entradaLimpia(entrada, True, (0, 0))
+            jugadas += [jugada(entrada, False, 0, (entrada, 0), LOCAL[0], 'home_run', corredores=[corredor(LOCAL[0], None, 'score')])]
+            jugadas += [out(entrada, False, outs, (entrada, 0), LOCAL[outs]) for outs in [1, 2, 3]]
+        if juego_id == 11:
+            jugadas = jugadas[:5]
+        juegos.append(feed(juego_id, jugadas))
+
+    turnos, lanzamientos, pitchers, bateadores = aplanarJugadasJuegos(juegos)
+    separados = [aplanarValidado(datosJuegoRaw) for datosJuegoRaw in juegos]
+
+    assert columna(turnos, 'turno') == list(range(turnos.height))
+    assert turnos.drop('turno').equals(pl.concat([datos[0] for datos in separados]).drop('turno'))
+    inicio = 0
+    for datos in separados:
+        assert lanzamientos.filter(pl.col('turno') >= inicio, pl.col('turno') < inicio + datos[0].height).with_columns(pl.col('turno') - inicio).equals(datos[1])
+        inicio += datos[0].height
+    assert pitchers.equals(pl.concat([datos[2] for datos in separados]))
+    assert bateadores.sort(pl.all()).equals(pl.concat([datos[3] for datos in separados]).sort(pl.all()))
+    # Los marcadores y las bases se reinician en cada juego
+    assert columna(turnos.filter(pl.col('juego_id') == 12), 'carreras_anotadas')[:4] == [0, 0, 0, 1]
+
+def test_juegoConErrorEnUnGrupo():
+    # Un juego con error hace fallar al grupo, obtenerDatos lo vuelve a transformar juego por juego
+    valido = feed(1, entradaLimpia(1, True, (0, 0)))
+    invalido = feed(2, [out(1, True, 1, (0, 0), VISITANTE[0], [corredor(999, '2B', '3B')])])
+    with pytest.raises(KeyError):
+        aplanarJugadasJuegos([valido, invalido])
+    assert aplanarJugadasJuegos([copy.deepcopy(valido)])[0].height == 3
+
+def test_feedsBenchmark():
+    feeds = benchmarkIngesta.leerFeeds()
+    assert len(feeds) > 0
+    diferencias = {}
+    for nombre, contenido in feeds.items():
+        diferenciasJuego = validarAplanado(decodificador.decodificarJuego(contenido))
+        if len(diferenciasJuego) > 0:
+            diferencias[nombre] = diferenciasJuego
+    assert diferencias == {}
+
+def test_archivoLocal():
+    claves = sorted(archivoJuegos.getClaves('juegos'))
+    if len(claves) == 0:
+        pytest.skip('No hay juegos en el archivo local')
+    diferencias = {}
+    for clave in claves:
+        diferenciasJuego = validarAplanado(decodificador.decodificarJuego(archivoJuegos.leer(clave)))
+        if len(diferenciasJuego) > 0:
+            diferencias[clave] = diferenciasJuego
+    assert diferencias == {}
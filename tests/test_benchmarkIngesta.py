@@ -0,0 +1,39 @@
+# Pruebas de los feeds de benchmark/feeds: el benchmark debe tener al menos un juego de cada categoria
+# y el manifiesto debe describir los feeds que estan en el directorio, con su origen (sinteticos o grabados)
+
+import json
+import os
+import benchmarkIngesta
+import decodificador
+import extraccionBoxscore
+import obtenerDatos
+
+def test_categorias():
+    categorias = set()
+    for contenido in benchmarkIngesta.leerFeeds().values():
+        categorias.update(benchmarkIngesta.getCategorias(decodificador.decodificar(contenido)))
+    assert categorias >= set(benchmarkIngesta.CATEGORIAS)
+
+def test_manifiesto():
+    feeds = benchmarkIngesta.leerFeeds()
+    with open(os.path.join(benchmarkIngesta.directorioFeeds, 'manifiesto.json')) as f:
+        manifiesto = json.load(f)
+    assert set(manifiesto) == set(feeds)
+    for nombre, contenido in feeds.items():
+        datosJuegoRaw = decodificador.decodificar(contenido)
+        assert manifiesto[nombre]['juego_id'] == datosJuegoRaw['gameData']['game']['pk']
+        assert manifiesto[nombre]['categoria'] in benchmarkIngesta.getCategorias(datosJuegoRaw)
+        assert manifiesto[nombre]['origen'] in ('sintetico', 'grabado')
+        assert nombre.startswith('sintetico_') == (manifiesto[nombre]['origen'] == 'sintetico')
+
+def test_transformacion():
+    datosJuegosRaw = [decodificador.decodificarJuego(contenido) for contenido in benchmarkIngesta.leerFeeds().values()]
+    turnosJuegos, pitchers, bateadores = obtenerDatos.procesarTurnos(datosJuegosRaw)
+    juego_pitcher = extraccionBoxscore.extractorJuego_pitcher.extraer(datosJuegosRaw, pitchers)
+    juego_bateador = extraccionBoxscore.extractorJuego_bateador.extraer(datosJuegosRaw, bateadores)
+    for datosJuegoRaw in datosJuegosRaw:
+        juego_id = datosJuegoRaw['gameData']['game']['pk']
+        turno, lanzamiento = turnosJuegos[juego_id]
+        assert turno.height > 0 and lanzamiento.height > 0
+        assert juego_pitcher.filter(juego_id=juego_id).height > 0
+        assert juego_bateador.filter(juego_id=juego_id).height > 0
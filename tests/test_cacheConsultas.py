@@ -0,0 +1,91 @@
+# Pruebas del cache de consultas (cacheConsultas.py): la llave de cada consulta y el borrado de los resultados
+# sin base de datos, y con la base que las escrituras de juegos y de catalogos avanzan la revision y el resultado
+# guardado ya no se usa
+
+import json
+import os
+import polars as pl
+from sqlalchemy import text
+import cacheConsultas
+import obtenerDatos
+
+def test_llaveConsulta():
+    llave = cacheConsultas.getLlaveConsulta("SELECT juego_id FROM juego WHERE temporada = :temporada", {'temporada': '2024'})
+    # Los espacios y los comentarios no cambian la llave
+    assert cacheConsultas.getLlaveConsulta("""SELECT juego_id -- solo el id
+                                              FROM juego /* todos los juegos */
+                                              WHERE temporada = :temporada""", {'temporada': '2024'}) == llave
+    # Los parametros, el esquema y los textos entre comillas si
+    assert cacheConsultas.getLlaveConsulta("SELECT juego_id FROM juego WHERE temporada = :temporada", {'temporada': '2023'}) != llave
+    assert cacheConsultas.getLlaveConsulta("SELECT juego_id FROM juego WHERE temporada = :temporada", {'temporada': '2024'},
+                                           {'juego_id': pl.Int64}) != llave
+    assert cacheConsultas.normalizarConsulta("SELECT 'a  --b'  ,\n  \"x  y\"") == "SELECT 'a  --b' , \"x  y\""
+
+def guardar(directorio, marca, nombre, filas, usado):
+    ruta = cacheConsultas.getRutaResultado(directorio, marca, nombre)
+    cacheConsultas.guardarResultado(ruta, pl.DataFrame({'valor': list(range(filas))}))
+    os.utime(ruta, (usado, usado))
+    return os.path.getsize(ruta)
+
+def test_liberarEspacio(tmp_path):
+    directorio = str(tmp_path)
+    guardar(directorio, 'revision_1', 'anterior', 10, 100)
+    tamanos = {nombre: guardar(directorio, 'revision_2', nombre, 10, usado) for nombre, usado in [('a', 300), ('b', 100), ('c', 200)]}
+    # Cabe todo menos un resultado: se borra el usado hace mas tiempo y los resultados de otras revisiones
+    cacheConsultas.liberarEspacio(directorio, 'revision_2', sum(tamanos.values()) - 1)
+    assert os.listdir(directorio) == ['revision_2']
+    assert sorted(os.listdir(os.path.join(directorio, 'revision_2'))) == ['a.parquet', 'c.parquet']
+    # Leer un resultado lo marca como usado, ahora el usado hace mas tiempo es c
+    cacheConsultas.leerResultado(cacheConsultas.getRutaResultado(directorio, 'revision_2', 'a'))
+    cacheConsultas.liberarEspacio(directorio, 'revision_2', tamanos['a'])
+    assert os.listdir(os.path.join(directorio, 'revision_2')) == ['a.parquet']
+
+def getMarca(engine):
+    with engine.connect() as conn:
+        return cacheConsultas.getMarcaIngesta(conn)
+
+def test_escrituraDeJuegosInvalidaResultado(juegosBenchmark, escribirJuegos, baseDatos, tmp_path):
+    directorio = str(tmp_path)
+    consulta = text("""SELECT COUNT(*) AS turnos FROM turno WHERE at_bat_descripcion = :descripcion""")
+    consultar = lambda: cacheConsultas.consultar(baseDatos, consulta, {'descripcion': 'refrescado'}, directorio=directorio)
+    marca = getMarca(baseDatos)
+    assert consultar()['turnos'].item() == 0
+
+    # Una edicion a mano no avanza la revision, se sigue usando el resultado guardado
+    with baseDatos.begin() as conn:
+        conn.execute(text("""UPDATE turno SET at_bat_descripcion = 'refrescado'
+                             WHERE turno_id = (SELECT MIN(turno_id) FROM turno WHERE juego_id = :juego_id)"""),
+                     {'juego_id': juegosBenchmark[0]['juego_id']})
+    assert consultar()['turnos'].item() == 0
+
+    juego = juegosBenchmark[-1]
+    turno = juego['turno'].with_columns(at_bat_descripcion=pl.when(pl.int_range(pl.len()) == 0).then(pl.lit('refrescado')).otherwise('at_bat_descripcion'))
+    escribirJuegos([{**juego, 'turno': turno}], 'upsert')
+    assert getMarca(baseDatos) != marca
+    assert consultar()['turnos'].item() == 2
+    assert os.listdir(directorio) == [getMarca(baseDatos)]
+
+def test_catalogoInvalidaResultado(juegosBenchmark, baseDatos, monkeypatch, tmp_path):
+    directorio = str(tmp_path)
+    local_id = juegosBenchmark[0]['juego']['local_id']
+    consulta = text("""SELECT e.nombre FROM juego AS j JOIN equipo AS e ON e.equipo_id = j.local_id WHERE j.juego_id = :juego_id""")
+    consultar = lambda: cacheConsultas.consultar(baseDatos, consulta, {'juego_id': juegosBenchmark[0]['juego_id']}, directorio=directorio)
+    assert consultar()['nombre'].item() == f'Equipo {local_id}'
+
+    # Solo el catalogo de equipos cambia, los demas responden sin cambios (304)
+    equipos = {'teams': [{'id': local_id, 'name': 'Diablos Rojos del Mexico', 'abbreviation': 'MEX',
+                          'division': {'name': 'Liga Mexicana Sur'}}]}
+    def descargarCatalogo(tabla, etag, ultimaModificacion):
+        if tabla == 'equipo':
+            return json.dumps(equipos).encode(), None, None
+        return None, etag, ultimaModificacion
+    monkeypatch.setattr(obtenerDatos, 'descargarCatalogo', descargarCatalogo)
+    marca = getMarca(baseDatos)
+    obtenerDatos.validarTablasIndependientes()
+    assert getMarca(baseDatos) != marca
+    assert consultar()['nombre'].item() == 'Diablos Rojos del Mexico'
+
+    # Sin cambios en los catalogos la revision no avanza
+    marca = getMarca(baseDatos)
+    obtenerDatos.validarTablasIndependientes()
+    assert getMarca(baseDatos) == marca
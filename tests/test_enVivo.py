@@ -0,0 +1,175 @@
+# Pruebas de la aplicacion de los cambios del feed en vivo (enVivo.aplicarParche, JSON Patch RFC 6902) y de la
+# descarga del feed completo cuando los cambios no se pueden aplicar. La API se reemplaza con monkeypatch
+
+import json
+import pytest
+import enVivo
+import metricas
+import obtenerDatos
+
+def documento():
+    return {
+        'gameData': {'status': {'codedGameState': 'I'}},
+        'liveData': {'plays': {'allPlays': [{'id': 0}, {'id': 1}, {'id': 2}]}},
+        'a/b': 1,
+        'm~n': 2
+    }
+
+def test_add():
+    resultado = enVivo.aplicarParche(documento(), [
+        {'op': 'add', 'path': '/gameData/weather', 'value': {'temp': '80'}},
+        {'op': 'add', 'path': '/gameData/status/codedGameState', 'value': 'F'}
+    ])
+    assert resultado['gameData'] == {'status': {'codedGameState': 'F'}, 'weather': {'temp': '80'}}
+
+def test_addEnListaInserta():
+    # add en una lista inserta en el indice y recorre los elementos siguientes, replace reemplaza el elemento
+    resultado = enVivo.aplicarParche(documento(), [{'op': 'add', 'path': '/liveData/plays/allPlays/1', 'value': {'id': 9}}])
+    assert resultado['liveData']['plays']['allPlays'] == [{'id': 0}, {'id': 9}, {'id': 1}, {'id': 2}]
+    resultado = enVivo.aplicarParche(documento(), [{'op': 'replace', 'path': '/liveData/plays/allPlays/1', 'value': {'id': 9}}])
+    assert resultado['liveData']['plays']['allPlays'] == [{'id': 0}, {'id': 9}, {'id': 2}]
+
+def test_addAlFinal():
+    resultado = enVivo.aplicarParche(documento(), [
+        {'op': 'add', 'path': '/liveData/plays/allPlays/-', 'value': {'id': 3}},
+        {'op': 'add', 'path': '/liveData/plays/allPlays/4', 'value': {'id': 4}}
+    ])
+    assert resultado['liveData']['plays']['allPlays'] == [{'id': i} for i in range(5)]
+
+def test_remove():
+    resultado = enVivo.aplicarParche(documento(), [
+        {'op': 'remove', 'path': '/liveData/plays/allPlays/0'},
+        {'op': 'remove', 'path': '/gameData/status'}
+    ])
+    assert resultado['liveData']['plays']['allPlays'] == [{'id': 1}, {'id': 2}]
+    assert resultado['gameData'] == {}
+
+def test_replace():
+    resultado = enVivo.aplicarParche(documento(), [{'op': 'replace', 'path': '/gameData/status', 'value': {'codedGameState': 'F'}}])
+    assert resultado['gameData']['status'] == {'codedGameState': 'F'}
+
+def test_replaceRaiz():
+    assert enVivo.aplicarParche(documento(), [{'op': 'replace', 'path': '', 'value': {'nuevo': True}}]) == {'nuevo': True}
+
+def test_move():
+    resultado = enVivo.aplicarParche(documento(), [
+        {'op': 'move', 'from': '/liveData/plays/allPlays/0', 'path': '/liveData/plays/allPlays/-'},
+        {'op': 'move', 'from': '/gameData/status', 'path': '/liveData/status'}
+    ])
+    assert resultado['liveData']['plays']['allPlays'] == [{'id': 1}, {'id': 2}, {'id': 0}]
+    assert resultado['liveData']['status'] == {'codedGameState': 'I'}
+    assert 'status' not in resultado['gameData']
+
+def test_copy():
+    resultado = enVivo.aplicarParche(documento(), [{'op': 'copy', 'from': '/liveData/plays/allPlays/2', 'path': '/liveData/plays/allPlays/0'}])
+    jugadas = resultado['liveData']['plays']['allPlays']
+    assert jugadas == [{'id': 2}, {'id': 0}, {'id': 1}, {'id': 2}]
+    # La copia no comparte objetos con el original
+    jugadas[0]['id'] = 5
+    assert jugadas[3] == {'id': 2}
+
+def test_test():
+    operaciones = [{'op': 'test', 'path': '/liveData/plays/allPlays/1', 'value': {'id': 1}},
+                   {'op': 'replace', 'path': '/gameData/status/codedGameState', 'value': 'F'}]
+    assert enVivo.aplicarParche(documento(), operaciones)['gameData']['status']['codedGameState'] == 'F'
+    with pytest.raises(ValueError):
+        enVivo.aplicarParche(documento(), [{'op': 'test', 'path': '/gameData/status/codedGameState', 'value': 'F'}])
+
+def test_escapes():
+    # ~1 es '/' y ~0 es '~' dentro de una llave, '~01' es '~1' y no '/'
+    resultado = enVivo.aplicarParche(documento(), [
+        {'op': 'replace', 'path': '/a~1b', 'value': 10},
+        {'op': 'replace', 'path': '/m~0n', 'value': 20},
+        {'op': 'add', 'path': '/x~01', 'value': 30}
+    ])
+    assert (resultado['a/b'], resultado['m~n'], resultado['x~1']) == (10, 20, 30)
+
+@pytest.mark.parametrize('operacion', [
+    {'op': 'replace', 'path': '/gameData/noExiste', 'value': 1},
+    {'op': 'replace', 'path': '/liveData/plays/allPlays/3', 'value': 1},
+    {'op': 'replace', 'path': '/liveData/plays/allPlays/-', 'value': 1},
+    {'op': 'remove', 'path': '/gameData/noExiste'},
+    {'op': 'remove', 'path': '/liveData/plays/allPlays/-'},
+    {'op': 'add', 'path': '/liveData/plays/allPlays/5', 'value': 1},
+    {'op': 'add', 'path': '/liveData/plays/allPlays/-1', 'value': 1},
+    {'op': 'add', 'path': '/liveData/plays/allPlays/01', 'value': 1},
+    {'op': 'add', 'path': '/noExiste/valor', 'value': 1},
+    {'op': 'move', 'from': '/noExiste', 'path': '/gameData/valor'},
+    {'op': 'copy', 'from': '/liveData/plays/allPlays/7', 'path': '/gameData/valor'},
+    {'op': 'invalida', 'path': '/gameData'}
+])
+def test_operacionInvalida(operacion):
+    with pytest.raises((KeyError, IndexError, ValueError, TypeError)):
+        enVivo.aplicarParche(documento(), [operacion])
+
+# La API en vivo: el feed completo y los cambios desde un timecode
+class ApiEnVivo:
+    def __init__(self, feed, cambios):
+        self.feed = feed
+        self.cambios = cambios
+        self.urls = []
+
+    def getApiRaw(self, url):
+        self.urls.append(url)
+        if 'diffPatch' in url:
+            return json.dumps(self.cambios).encode()
+        return json.dumps(self.feed).encode()
+
+def feedEnVivo(timecode, jugadas):
+    return {
+        'metaData': {'timeStamp': timecode},
+        'gameData': {'status': {'codedGameState': 'I'}},
+        'liveData': {'plays': {'allPlays': [{'id': i} for i in range(jugadas)]}}
+    }
+
+@pytest.fixture
+def api(monkeypatch):
+    metricas.registro.reiniciar()
+    def crearApi(feed, cambios):
+        api = ApiEnVivo(feed, cambios)
+        monkeypatch.setattr(obtenerDatos, 'getApiRaw', api.getApiRaw)
+        return api
+    return crearApi
+
+def test_actualizarFeedConCambios(api):
+    juego = enVivo.JuegoEnVivo(1)
+    juego.feed = feedEnVivo('1', 2)
+    api(feedEnVivo('2', 3), [{'diff': [{'op': 'replace', 'path': '/metaData/timeStamp', 'value': '2'},
+                                       {'op': 'add', 'path': '/liveData/plays/allPlays/-', 'value': {'id': 2}}]}])
+    assert juego.actualizarFeed()
+    assert juego.feed == feedEnVivo('2', 3)
+    assert metricas.registro.contadores['reintentos'].get('parche', 0) == 0
+
+def test_actualizarFeedSinCambios(api):
+    juego = enVivo.JuegoEnVivo(1)
+    juego.feed = feedEnVivo('1', 2)
+    api(feedEnVivo('2', 3), [])
+    assert not juego.actualizarFeed()
+    assert juego.feed == feedEnVivo('1', 2)
+
+def test_actualizarFeedCompletoEnLugarDeCambios(api):
+    # Con un timecode muy viejo la API regresa el feed completo en lugar de la lista de cambios
+    juego = enVivo.JuegoEnVivo(1)
+    juego.feed = feedEnVivo('1', 2)
+    api(feedEnVivo('2', 3), feedEnVivo('2', 3))
+    assert juego.actualizarFeed()
+    assert juego.feed == feedEnVivo('2', 3)
+
+def test_actualizarFeedDescargaCompletoSiFallaElParche(api):
+    juego = enVivo.JuegoEnVivo(1)
+    juego.feed = feedEnVivo('1', 2)
+    # El primer cambio se aplica y el segundo no (el feed en memoria ya no coincide con el de la API)
+    apiEnVivo = api(feedEnVivo('3', 4), [{'diff': [{'op': 'replace', 'path': '/metaData/timeStamp', 'value': '2'}]},
+                                         {'diff': [{'op': 'replace', 'path': '/liveData/plays/allPlays/5', 'value': {'id': 5}}]}])
+    assert juego.actualizarFeed()
+    assert juego.feed == feedEnVivo('3', 4)
+    assert 'diffPatch?startTimecode=1' in apiEnVivo.urls[0]
+    assert apiEnVivo.urls[1].endswith('game/1/feed/live')
+    assert metricas.registro.contadores['reintentos']['parche'] == 1
+
+def test_actualizarFeedPrimeraVez(api):
+    juego = enVivo.JuegoEnVivo(1)
+    apiEnVivo = api(feedEnVivo('1', 2), [])
+    assert juego.actualizarFeed()
+    assert juego.feed == feedEnVivo('1', 2)
+    assert len(apiEnVivo.urls) == 1 and 'diffPatch' not in apiEnVivo.urls[0]
@@ -0,0 +1,127 @@
+# Pruebas de los calculos de la expectativa pitagorica (analisis/expectativaPitagorica.py) sin base de datos: los
+# juegos se arman a mano con el esquema de getJuegos y cada caso revisa a mano los valores de cada equipo.
+# El equipo 1 no permite carreras en toda la temporada y la ventana movil es mas corta que la temporada
+
+from datetime import date, datetime, timezone
+import polars as pl
+import pytest
+from analisis import expectativaPitagorica
+
+# (juego_id, fecha, local_id, visitante_id, carreras_local, carreras_visitante)
+JUEGOS = [
+    (1, date(2024, 4, 1), 1, 2, 5, 0),
+    (2, date(2024, 4, 2), 2, 1, 0, 3),
+    (3, date(2024, 4, 3), 1, 3, 4, 0),
+    (4, date(2024, 4, 4), 3, 2, 1, 7)
+]
+EQUIPOS = {1: 'Diablos', 2: 'Sultanes', 3: 'Tigres'}
+
+def getJuegos(juegos=JUEGOS):
+    filas = [{
+        'juego_id': juego_id,
+        'temporada': '2024',
+        'primer_lanzamiento': datetime(fecha.year, fecha.month, fecha.day, 23, tzinfo=timezone.utc),
+        'fecha': fecha,
+        'tipo_juego_id': 'R',
+        'local_id': local_id,
+        'local': EQUIPOS[local_id],
+        'visitante_id': visitante_id,
+        'visitante': EQUIPOS[visitante_id],
+        'carreras_local': carreras_local,
+        'carreras_visitante': carreras_visitante
+    } for juego_id, fecha, local_id, visitante_id, carreras_local, carreras_visitante in juegos]
+    return pl.DataFrame(filas, schema_overrides={'primer_lanzamiento': pl.Datetime(time_zone='UTC')}).lazy()
+
+def getPartidos():
+    return expectativaPitagorica.getPartidos(getJuegos())
+
+def getFila(frame, **filtro):
+    filas = frame.filter(**filtro)
+    assert filas.height == 1
+    return filas.row(0, named=True)
+
+def pitagorica(carreras, carrerasEnContra, exponente=expectativaPitagorica.EXPONENTE):
+    return carreras ** exponente / (carreras ** exponente + carrerasEnContra ** exponente)
+
+def test_pitagorica():
+    resultado = pl.select(
+        sinCarrerasEnContra=expectativaPitagorica.pitagorica(pl.lit(5), pl.lit(0)),
+        sinCarreras=expectativaPitagorica.pitagorica(pl.lit(0), pl.lit(0)),
+        exponente=expectativaPitagorica.pitagorica(pl.lit(7), pl.lit(9), 1.83)
+    ).row(0, named=True)
+    assert resultado['sinCarrerasEnContra'] == 1.0
+    assert resultado['sinCarreras'] is None
+    assert resultado['exponente'] == pytest.approx(pitagorica(7, 9, 1.83))
+
+def test_partidos():
+    partidos = getPartidos().collect()
+    assert partidos.height == 2 * len(JUEGOS)
+    numeros = partidos.group_by('equipo_id').agg(pl.col('numero_juego').sort()).sort('equipo_id')
+    assert numeros['numero_juego'].to_list() == [[1, 2, 3], [1, 2, 3], [1, 2]]
+    partido = getFila(partidos, juego_id=2, equipo_id=1)
+    assert (partido['localia'], partido['rival'], partido['carreras'], partido['carreras_en_contra']) == ('visitante', 'Sultanes', 3, 0)
+
+def test_resumenTemporadas():
+    resumen = expectativaPitagorica.resumenTemporadas(getPartidos()).collect()
+    # Una fila por equipo y localia (local, visitante y total)
+    assert resumen.height == len(EQUIPOS) * 3
+    # Sin carreras en contra la expectativa es 1 y coincide con las victorias reales
+    diablos = getFila(resumen, equipo_id=1, localia='total')
+    assert (diablos['juegos'], diablos['victorias'], diablos['derrotas'], diablos['carreras'], diablos['carreras_en_contra']) == (3, 3, 0, 12, 0)
+    assert (diablos['pct_victorias'], diablos['pitagorica'], diablos['diferencia_victorias']) == (1.0, 1.0, 0.0)
+
+    sultanes = getFila(resumen, equipo_id=2, localia='total')
+    assert (sultanes['juegos'], sultanes['victorias'], sultanes['derrotas'], sultanes['carreras'], sultanes['carreras_en_contra']) == (3, 1, 2, 7, 9)
+    assert sultanes['pitagorica'] == pytest.approx(pitagorica(7, 9))
+    assert sultanes['diferencia_victorias'] == pytest.approx(1 - 3 * pitagorica(7, 9))
+
+def test_resumenLocalVisitante():
+    resumen = expectativaPitagorica.resumenTemporadas(getPartidos(), exponente=1.83).collect()
+    local = getFila(resumen, equipo_id=2, localia='local')
+    visitante = getFila(resumen, equipo_id=2, localia='visitante')
+    assert (local['juegos'], local['carreras'], local['carreras_en_contra'], local['pitagorica']) == (1, 0, 3, 0.0)
+    assert (visitante['juegos'], visitante['carreras'], visitante['carreras_en_contra']) == (2, 7, 6)
+    assert visitante['pitagorica'] == pytest.approx(pitagorica(7, 6, 1.83))
+
+def test_seriesVentanaMasCortaQueLaTemporada():
+    series = expectativaPitagorica.seriesEquipos(getPartidos(), ventana=2).collect()
+    sultanes = series.filter(equipo_id=2, localia='total').sort('juegos')
+    assert sultanes['juegos'].to_list() == [1, 2, 3]
+    assert sultanes['numero_juego'].to_list() == [1, 2, 3]
+    assert sultanes['victorias'].to_list() == [0, 0, 1]
+    assert sultanes['carreras'].to_list() == [0, 0, 7]
+    assert sultanes['carreras_en_contra'].to_list() == [5, 8, 9]
+    # La ventana de 2 juegos ya no cuenta las 5 carreras en contra del primer juego
+    assert sultanes['carreras_ventana'].to_list() == [0, 0, 7]
+    assert sultanes['carreras_en_contra_ventana'].to_list() == [5, 8, 4]
+    assert sultanes['pitagorica_ventana'].to_list() == pytest.approx([0.0, 0.0, pitagorica(7, 4)])
+    assert sultanes['pitagorica'].to_list() == pytest.approx([0.0, 0.0, pitagorica(7, 9)])
+    # De visitante numero_juego sigue la temporada y juegos solo cuenta los juegos de visitante
+    visitante = series.filter(equipo_id=2, localia='visitante').sort('juegos')
+    assert visitante['juegos'].to_list() == [1, 2]
+    assert visitante['numero_juego'].to_list() == [1, 3]
+    assert visitante['pitagorica_ventana'].to_list() == pytest.approx([0.0, pitagorica(7, 6)])
+
+    diablos = series.filter(equipo_id=1, localia='total')
+    assert diablos['pitagorica_ventana'].to_list() == [1.0, 1.0, 1.0]
+
+def test_mitadesPorJuegos():
+    mitades = expectativaPitagorica.mitadesTemporada(getPartidos()).collect()
+    # Con un numero impar de juegos la primera mitad se queda con el juego de en medio
+    diablos = getFila(mitades, equipo_id=1)
+    assert (diablos['juegos1'], diablos['carreras1'], diablos['juegos2'], diablos['carreras2']) == (2, 8, 1, 4)
+    assert (diablos['pitagorica1'], diablos['pitagorica2']) == (1.0, 1.0)
+    tigres = getFila(mitades, equipo_id=3)
+    assert (tigres['juegos1'], tigres['carreras1'], tigres['carreras_en_contra1'], tigres['pitagorica1']) == (1, 0, 4, 0.0)
+    assert (tigres['juegos2'], tigres['carreras2'], tigres['carreras_en_contra2']) == (1, 1, 7)
+    assert tigres['pitagorica2'] == pytest.approx(pitagorica(1, 7))
+
+def test_mitadesPorFecha():
+    mitades = expectativaPitagorica.mitadesTemporada(getPartidos(), cortes={2024: date(2024, 4, 3)}).collect()
+    diablos = getFila(mitades, equipo_id=1)
+    assert (diablos['juegos1'], diablos['juegos2']) == (2, 1)
+    # Tigres no jugo antes del corte: su primera mitad no tiene juegos ni expectativa
+    tigres = getFila(mitades, equipo_id=3)
+    assert (tigres['juegos1'], tigres['carreras1'], tigres['carreras_en_contra1'], tigres['pitagorica1']) == (0, 0, 0, None)
+    assert (tigres['juegos2'], tigres['carreras2'], tigres['carreras_en_contra2']) == (2, 1, 11)
+    assert tigres['pitagorica2'] == pytest.approx(pitagorica(1, 11))
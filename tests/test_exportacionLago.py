@@ -0,0 +1,139 @@
+# Pruebas de la exportacion de los juegos al lago Delta (exportacionLago.exportarJuegos). Casi todas son sin base
+# de datos: la base se reemplaza con un diccionario {juego_id: (temporada, revision)} y tablas con solo las llaves
+# y un valor que depende de la revision. Se saltan si deltalake no esta instalado
+
+import polars as pl
+import pytest
+from sqlalchemy import text
+
+pytest.importorskip('deltalake')
+from deltalake import DeltaTable
+import exportacionLago
+import obtenerDatos
+
+TURNOS = 3 # turnos de cada juego, cada turno con dos lanzamientos
+
+def getJuegos(base):
+    filas = [(juego_id, temporada, revision) for juego_id, (temporada, revision) in sorted(base.items())]
+    return pl.DataFrame(filas, schema=exportacionLago.schema_registro, orient='row')
+
+# Filas de cada tabla de los juegos, con la revision como valor para saber de que exportacion es cada fila
+def getDatosTablas(base, juegos_id):
+    datos = {tabla: [] for tabla in exportacionLago.TABLAS_JUEGOS}
+    for juego_id in juegos_id:
+        temporada, revision = base[juego_id]
+        datos['juego'].append({'juego_id': juego_id, 'temporada': temporada, 'valor': revision})
+        datos['juego_pitcher'].append({'juego_id': juego_id, 'pitcher_id': 1, 'valor': revision})
+        datos['juego_bateador'].append({'juego_id': juego_id, 'bateador_id': 2, 'valor': revision})
+        for numero in range(TURNOS):
+            turno_id = juego_id * obtenerDatos.TURNOS_POR_JUEGO + numero
+            datos['turno'].append({'turno_id': turno_id, 'juego_id': juego_id, 'temporada': temporada, 'valor': revision})
+            for numero_lanzamiento in [1, 2]:
+                datos['lanzamiento'].append({'turno_id': turno_id, 'numero_lanzamiento': numero_lanzamiento, 'temporada': temporada, 'valor': revision})
+    schema = {'juego_id': pl.Int32, 'pitcher_id': pl.Int32, 'bateador_id': pl.Int32, 'turno_id': pl.Int32,
+              'numero_lanzamiento': pl.Int16, 'temporada': pl.String, 'valor': pl.Int64}
+    return {tabla: pl.DataFrame(filas, schema={columna: schema[columna] for columna in filas[0]}) for tabla, filas in datos.items()}
+
+def exportar(directorio, base, juegosPorLote=2):
+    exportacionLago.exportarJuegos(directorio, getJuegos(base), lambda juegos_id: getDatosTablas(base, juegos_id), juegosPorLote)
+
+def leerLago(directorio, tabla):
+    return pl.read_delta(exportacionLago.getRutaTabla(directorio, tabla))
+
+# El lago tiene exactamente las filas de la base, sin duplicados
+def revisarLago(directorio, base):
+    esperado = getDatosTablas(base, sorted(base))
+    for tabla in exportacionLago.TABLAS_JUEGOS:
+        datos = leerLago(directorio, tabla)
+        assert datos.select(exportacionLago.llavesTablas[tabla]).is_duplicated().sum() == 0, tabla
+        assert datos.select(esperado[tabla].columns).sort(pl.all()).equals(esperado[tabla].sort(pl.all())), tabla
+    registro = leerLago(directorio, exportacionLago.TABLA_REGISTRO).select(list(exportacionLago.schema_registro)).sort('juego_id')
+    assert registro.equals(getJuegos(base))
+
+def getArchivos(directorio, tabla, temporada):
+    return set(DeltaTable(exportacionLago.getRutaTabla(directorio, tabla)).files([('temporada', '=', temporada)]))
+
+def test_exportarDosVeces(tmp_path):
+    directorio = str(tmp_path)
+    base = {1: ('2023', 10), 2: ('2023', 10), 3: ('2024', 10), 4: ('2024', 10), 5: ('2024', 10)}
+    exportar(directorio, base)
+    revisarLago(directorio, base)
+    versiones = {tabla: DeltaTable(exportacionLago.getRutaTabla(directorio, tabla)).version() for tabla in exportacionLago.TABLAS_JUEGOS}
+    # Sin cambios en la base la segunda exportacion no escribe nada
+    exportar(directorio, base)
+    revisarLago(directorio, base)
+    for tabla, version in versiones.items():
+        assert DeltaTable(exportacionLago.getRutaTabla(directorio, tabla)).version() == version
+
+def test_exportacionDetenidaAMedias(tmp_path):
+    # Las tablas de un lote se escribieron pero el registro no, la siguiente exportacion no duplica filas
+    directorio = str(tmp_path)
+    base = {1: ('2024', 10), 2: ('2024', 10)}
+    datosTablas = getDatosTablas(base, [1, 2])
+    for tabla in exportacionLago.TABLAS_JUEGOS:
+        exportacionLago.agregarFilasJuegos(directorio, tabla, datosTablas[tabla])
+    exportar(directorio, base)
+    revisarLago(directorio, base)
+
+def test_juegosCambiadosYEliminados(tmp_path):
+    directorio = str(tmp_path)
+    base = {1: ('2023', 10), 2: ('2023', 10), 3: ('2024', 10), 4: ('2024', 10)}
+    exportar(directorio, base)
+    # El juego 3 se volvio a escribir (otra revision), el 4 se elimino de la base y el 5 es nuevo
+    base[3] = ('2024', 11)
+    del base[4]
+    base[5] = ('2024', 11)
+    exportar(directorio, base)
+    revisarLago(directorio, base)
+    assert leerLago(directorio, 'turno').filter(juego_id=3)['valor'].to_list() == [11] * TURNOS
+
+def test_juegoQueCambiaDeTemporada(tmp_path):
+    directorio = str(tmp_path)
+    base = {1: ('2023', 10)}
+    exportar(directorio, base)
+    base[1] = ('2024', 11)
+    exportar(directorio, base)
+    revisarLago(directorio, base)
+
+def test_particiones(tmp_path):
+    directorio = str(tmp_path)
+    base = {1: ('2023', 10), 2: ('2023', 10), 3: ('2024', 10)}
+    exportar(directorio, base)
+    for tabla in exportacionLago.TABLAS_PARTICIONADAS:
+        assert all(archivo.startswith('temporada=2024/') for archivo in getArchivos(directorio, tabla, '2024'))
+    archivos2023 = {tabla: getArchivos(directorio, tabla, '2023') for tabla in exportacionLago.TABLAS_PARTICIONADAS}
+    # Exportar, cambiar y eliminar juegos de 2024 no toca los archivos de 2023
+    base[3] = ('2024', 11)
+    base[4] = ('2024', 11)
+    exportar(directorio, base)
+    del base[4]
+    exportar(directorio, base)
+    revisarLago(directorio, base)
+    for tabla in exportacionLago.TABLAS_PARTICIONADAS:
+        assert getArchivos(directorio, tabla, '2023') == archivos2023[tabla]
+    # Una lectura con filtro de temporada regresa solo las filas de esa particion
+    lanzamientos = pl.scan_delta(exportacionLago.getRutaTabla(directorio, 'lanzamiento')).filter(pl.col('temporada') == '2023').collect()
+    assert lanzamientos.height == 2 * TURNOS * 2
+
+# Con la base: un refresco que solo cambia un turno no cambia la fila de juego (el upsert no reescribe las filas
+# iguales), pero el juego tiene otra revision y se vuelve a exportar
+def test_refrescoQueSoloCambiaTurnos(juegosBenchmark, escribirJuegos, baseDatos, tmp_path):
+    directorio = str(tmp_path)
+    exportacionLago.exportarLago(directorio)
+    juego = juegosBenchmark[0]
+    juego_id = juego['juego_id']
+    query_xmin = text("""SELECT CAST(xmin AS TEXT) FROM juego WHERE juego_id = :juego_id""")
+    with baseDatos.connect() as conn:
+        xmin = conn.execute(query_xmin, {'juego_id': juego_id}).scalar()
+    registro = leerLago(directorio, exportacionLago.TABLA_REGISTRO).filter(juego_id=juego_id)['revision'].item()
+
+    turno = juego['turno'].with_columns(at_bat_descripcion=pl.when(pl.int_range(pl.len()) == 0).then(pl.lit('refrescado')).otherwise('at_bat_descripcion'))
+    escribirJuegos([{**juego, 'turno': turno}], 'upsert')
+    with baseDatos.connect() as conn:
+        assert conn.execute(query_xmin, {'juego_id': juego_id}).scalar() == xmin
+
+    exportacionLago.exportarLago(directorio)
+    assert leerLago(directorio, exportacionLago.TABLA_REGISTRO).filter(juego_id=juego_id)['revision'].item() > registro
+    turnos = leerLago(directorio, 'turno').filter(juego_id=juego_id)
+    assert turnos.height == turno.height
+    assert turnos['at_bat_descripcion'].to_list().count('refrescado') == 1
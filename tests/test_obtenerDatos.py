@@ -0,0 +1,42 @@
+# Pruebas de obtenerDatos con la base temporal (conftest.baseDatos), se saltan si no hay un servidor local
+
+import threading
+from sqlalchemy import text
+import cacheConsultas
+import obtenerDatos
+
+# Dos trabajadores empiezan la misma temporada al mismo tiempo: el segundo espera a que el primero confirme y
+# escribe en la particion que creo el primero en lugar de fallar con la tabla duplicada
+def test_particionNuevaConcurrente(baseDatos):
+    errores = []
+    def segundoTrabajador():
+        try:
+            with baseDatos.begin() as conn:
+                obtenerDatos.registrarParticiones(conn, 'turno', ['2031'])
+        except Exception as err:
+            errores.append(err)
+
+    with baseDatos.begin() as conn:
+        obtenerDatos.registrarParticiones(conn, 'turno', ['2030', '2031'])
+        hilo = threading.Thread(target=segundoTrabajador)
+        hilo.start()
+        hilo.join(1)
+        assert hilo.is_alive()
+    hilo.join(10)
+    assert not hilo.is_alive() and errores == []
+    with baseDatos.connect() as conn:
+        assert obtenerDatos.getParticiones(conn, 'turno') >= {'turno_2030', 'turno_2031'}
+
+# En una base anterior sin juego_en_vivo ni trabajo_juego la limpieza se salta esas tablas y tambien borra la
+# revision de la ingesta
+def test_limpiarTablasEnBaseAnterior(juegosBenchmark, baseDatos, monkeypatch):
+    limpiezas = []
+    monkeypatch.setattr(cacheConsultas, 'limpiarCache', lambda: limpiezas.append(True))
+    with baseDatos.begin() as conn:
+        conn.execute(text("""DROP TABLE juego_en_vivo, trabajo_juego"""))
+        assert conn.execute(text("""SELECT COUNT(*) FROM revision_ingesta""")).scalar() == 1
+    obtenerDatos.limpiarTablas()
+    with baseDatos.connect() as conn:
+        for tabla in ['revision_ingesta', 'revision_juego', 'turno', 'juego', 'equipo']:
+            assert conn.execute(text(f"""SELECT COUNT(*) FROM {tabla}""")).scalar() == 0, tabla
+    assert limpiezas == [True]